@@ -0,0 +1,153 @@
+# benchmarks/bench_diff.py
+#
+# Compares src.diff_engine against the difflib.SequenceMatcher path the
+# comparator used to take, on large synthetic rule texts with repeated
+# boilerplate lines. The "old 3x path" column is what one changed rule used
+# to cost: SequenceMatcher in the comparator, HtmlDiff.make_file in the
+# reporter and SequenceMatcher again in the dashboard.
+#
+# Cases:
+#   edits            scattered inserts, deletes and amendments (--edits of them)
+#   section_rewrite  a contiguous block (--rewrite-fraction of the rule) replaced
+#                    with new text that shares only boilerplate with the old
+#   full_rewrite     every line replaced; nothing to anchor on
+#
+# Rewrites are the worst case for the engine: no patience anchors, so all the
+# work falls on the bounded Myers search. peak_kb is the engine's tracemalloc peak.
+#
+#   python -m benchmarks.bench_diff
+#   python -m benchmarks.bench_diff --lines 2000 20000 --edits 50 --json
+#   python -m benchmarks.bench_diff --cases section_rewrite full_rewrite
+
+import argparse
+import difflib
+import json
+import random
+import time
+import tracemalloc
+
+from src.diff_engine import diff_lines
+
+BOILERPLATE = [
+    "• • • Supplementary Material: --------------",
+    "(a) General.",
+    "Amended by SR-FINRA-2011-016 eff. July 9, 2012.",
+    "Selected Notice: 12-25, 12-55.",
+    "",
+]
+
+def make_rule_text(n_lines, seed=0):
+    """A FINRA-like rule body: mostly unique sentences plus frequent boilerplate."""
+    rng = random.Random(seed)
+    lines = []
+    for i in range(n_lines):
+        if rng.random() < 0.2:
+            lines.append(rng.choice(BOILERPLATE))
+        else:
+            lines.append(f"({i % 26 + 1}) A member shall make reasonable efforts to obtain information {rng.randrange(10**6)}.")
+    return lines
+
+def mutate(lines, n_edits, seed=1):
+    """Apply a mix of inserts, deletes and in-place amendments."""
+    rng = random.Random(seed)
+    lines = list(lines)
+    for e in range(n_edits):
+        op = rng.choice(('insert', 'delete', 'amend'))
+        pos = rng.randrange(len(lines))
+        if op == 'insert':
+            lines.insert(pos, f"(new) Inserted requirement number {e}.")
+        elif op == 'delete':
+            del lines[pos]
+        else:
+            lines[pos] = lines[pos] + f" as amended ({e})"
+    return lines
+
+def rewrite(lines, fraction, seed=2):
+    """Replace a block in the middle (fraction of the lines; 1.0 = everything) with fresh text."""
+    count = int(len(lines) * fraction)
+    start = (len(lines) - count) // 2
+    fresh = [f"{line} (rewritten)" if line not in BOILERPLATE else line
+             for line in make_rule_text(count, seed=seed)]
+    return lines[:start] + fresh + lines[start + count:]
+
+CASES = {
+    'edits': lambda old, args: mutate(old, args.edits),
+    'section_rewrite': lambda old, args: rewrite(old, args.rewrite_fraction),
+    'full_rewrite': lambda old, args: rewrite(old, 1.0),
+}
+
+def peak_memory(fn):
+    tracemalloc.start()
+    try:
+        fn()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+def time_it(fn, repeat):
+    best = float('inf')
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+def matched_lines(opcodes):
+    return sum(i2 - i1 for tag, i1, i2, _, _ in opcodes if tag == 'equal')
+
+def _format_s(seconds):
+    return '-' if seconds is None else f"{seconds:.4f}"
+
+def main():
+    parser = argparse.ArgumentParser(description="Diff engine vs difflib benchmark")
+    parser.add_argument('--lines', type=int, nargs='+', default=[1000, 5000, 20000])
+    parser.add_argument('--edits', type=int, default=40)
+    parser.add_argument('--rewrite-fraction', type=float, default=0.3,
+                        help="Share of the rule replaced by the section_rewrite case.")
+    parser.add_argument('--cases', nargs='+', choices=list(CASES), default=list(CASES))
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--json', action='store_true', help="Print machine-readable results.")
+    args = parser.parse_args()
+
+    results = []
+    for case in args.cases:
+        for n in args.lines:
+            old = make_rule_text(n)
+            new = CASES[case](old, args)
+            t_difflib, ref = time_it(lambda: difflib.SequenceMatcher(None, old, new).get_opcodes(), args.repeat)
+            t_engine, ops = time_it(lambda: diff_lines(old, new), args.repeat)
+            # Before: comparator, HtmlDiff report and dashboard each diffed the pair.
+            # HtmlDiff's intraline matching is quadratic on rewrites, so only light edits time it.
+            t_old_path = None
+            if case == 'edits':
+                t_old_path, _ = time_it(lambda: (
+                    difflib.SequenceMatcher(None, old, new).get_opcodes(),
+                    difflib.HtmlDiff().make_file(old, new, context=True, numlines=5),
+                    difflib.SequenceMatcher(None, old, new).get_opcodes(),
+                ), 1)
+            results.append({
+                'case': case,
+                'lines': n,
+                'edits': args.edits if case == 'edits' else None,
+                'difflib_s': round(t_difflib, 5),
+                'engine_s': round(t_engine, 5),
+                'speedup': round(t_difflib / t_engine, 1) if t_engine else None,
+                'engine_peak_kb': peak_memory(lambda: diff_lines(old, new)) // 1024,
+                'three_consumer_difflib_s': round(t_old_path, 5) if t_old_path is not None else None,
+                'difflib_matched': matched_lines(ref),
+                'engine_matched': matched_lines(ops),
+            })
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    print(f"{'case':>16} {'lines':>8} {'difflib (s)':>12} {'engine (s)':>11} {'speedup':>8} {'peak kb':>8} "
+          f"{'old 3x path (s)':>16} {'matched (difflib/engine)':>26}")
+    for r in results:
+        print(f"{r['case']:>16} {r['lines']:>8} {r['difflib_s']:>12.4f} {r['engine_s']:>11.4f} {r['speedup']:>7}x "
+              f"{r['engine_peak_kb']:>8} {_format_s(r['three_consumer_difflib_s']):>16} "
+              f"{r['difflib_matched']:>14}/{r['engine_matched']}")
+
+if __name__ == "__main__":
+    main()
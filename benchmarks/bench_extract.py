@@ -0,0 +1,90 @@
+# benchmarks/bench_extract.py
+#
+# Compares src.extractor against the full-tree parse download_rule used to do
+# (BeautifulSoup(page, 'html.parser') followed by find()/find_all('p')) on the
+# saved pages in benchmarks/samples/. Reports best wall time and the peak
+# Python allocation (tracemalloc) per page.
+#
+#   python -m benchmarks.bench_extract
+#   python -m benchmarks.bench_extract --repeat 10 --json
+
+import argparse
+import json
+import os
+import time
+import tracemalloc
+
+from bs4 import BeautifulSoup
+from src.extractor import extract_text, FINRA_PROFILE, SEC_PROFILE, PARSER
+
+SAMPLES_DIR = os.path.join(os.path.dirname(__file__), 'samples')
+
+# Sample page -> profile used to extract it
+SAMPLES = {
+    'finra_rule.html': FINRA_PROFILE,
+    'sec_rule.html': SEC_PROFILE,
+}
+
+def full_tree_extract(markup, profile):
+    """The previous download_rule extraction: parse everything, then search the tree."""
+    soup = BeautifulSoup(markup, 'html.parser')
+    target = None
+    for tag, attrs in profile['containers']:
+        target = soup.find(tag, attrs=attrs)
+        if target:
+            break
+    content = target.get_text(separator='\n').strip() if target else ""
+    if len(content) < 100:
+        paragraphs = soup.find_all('p')
+        content = "\n\n".join([p.get_text().strip() for p in paragraphs if len(p.get_text().strip()) > 20])
+    return content
+
+def measure(fn, markup, profile, repeat):
+    """Best-of-repeat wall time, then one traced run for the peak allocation."""
+    best = float('inf')
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn(markup, profile)
+        best = min(best, time.perf_counter() - start)
+    tracemalloc.start()
+    fn(markup, profile)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return best, peak, result
+
+def main():
+    parser = argparse.ArgumentParser(description="Targeted extraction vs full-tree parse benchmark")
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--json', action='store_true', help="Print machine-readable results.")
+    args = parser.parse_args()
+
+    results = []
+    for name, profile in SAMPLES.items():
+        with open(os.path.join(SAMPLES_DIR, name), 'rb') as f:
+            markup = f.read()
+        t_full, mem_full, old_text = measure(full_tree_extract, markup, profile, args.repeat)
+        t_new, mem_new, new_text = measure(extract_text, markup, profile, args.repeat)
+        results.append({
+            'page': name,
+            'bytes': len(markup),
+            'parser': PARSER,
+            'full_tree_s': round(t_full, 5),
+            'extractor_s': round(t_new, 5),
+            'speedup': round(t_full / t_new, 1) if t_new else None,
+            'full_tree_peak_kb': round(mem_full / 1024),
+            'extractor_peak_kb': round(mem_new / 1024),
+            'same_text': old_text == new_text,
+        })
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    print(f"{'page':>16} {'KB':>6} {'full tree (s)':>14} {'extractor (s)':>14} {'speedup':>8} "
+          f"{'peak KB (full/extractor)':>26} {'same text':>10}")
+    for r in results:
+        print(f"{r['page']:>16} {r['bytes'] // 1024:>6} {r['full_tree_s']:>14.4f} {r['extractor_s']:>14.4f} "
+              f"{r['speedup']:>7}x {r['full_tree_peak_kb']:>15}/{r['extractor_peak_kb']:<10} {str(r['same_text']):>10}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,186 @@
+# benchmarks/bench_faults.py
+#
+# Fetch policy (src/fetch_policy.py) against a local fault-injecting rulebook
+# server. Each scenario serves the same rules with a different failure mode
+# and checks how download_rules copes:
+#
+#   healthy        every request succeeds
+#   flaky          each page answers 503, then drops the connection, then succeeds
+#   throttled      the host answers 429 with "Retry-After: 1" to its first requests
+#   blocked        every request gets 403 (FINRA refusing the scraper)
+#   hanging        every response stalls past the read timeout
+#   long_backoff   429 with a Retry-After far beyond what a run should wait
+#
+# Reported per scenario: wall time, requests the server saw, outcomes
+# ('text', 'blocked', 'failed') and retries. Expected outcomes are checked and
+# the command exits 1 if any scenario misbehaves, so it doubles as a test.
+#
+#   python -m benchmarks.bench_faults
+#   python -m benchmarks.bench_faults --rules 51 --json
+
+import argparse
+import contextlib
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from benchmarks.bench_diff import make_rule_text
+from benchmarks.bench_pipeline import render_page, REPO_ROOT
+
+# Short timeouts and backoff so the whole suite runs in seconds; the shape of
+# the behaviour (retries, fail-fast) is what is measured, not the constants
+READ_TIMEOUT_S = 0.5
+HANG_S = 2.0
+BACKOFF_BASE_S = 0.05
+BREAKER_THRESHOLD = 3
+
+class FaultServer:
+    """
+    Serves /rules/<id> pages, injecting faults from a plan.
+
+    plan(path, attempt, request_number) returns None to serve the page, or
+    one of ('status', code, headers), ('reset',), ('hang', seconds).
+    attempt counts requests for that path; request_number counts all requests.
+    """
+
+    def __init__(self, plan):
+        self.pages = {}
+        self.requests = 0
+        self.attempts = {}
+        self.lock = threading.Lock()
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                with server.lock:
+                    server.requests += 1
+                    number = server.requests
+                    attempt = server.attempts[self.path] = server.attempts.get(self.path, 0) + 1
+                fault = plan(self.path, attempt, number)
+                if fault is not None and fault[0] == 'reset':
+                    # Drop the connection without a response
+                    self.close_connection = True
+                    self.request.close()
+                    return
+                if fault is not None and fault[0] == 'hang':
+                    time.sleep(fault[1])
+                if fault is not None and fault[0] == 'status':
+                    self.send_response(fault[1])
+                    for name, value in fault[2].items():
+                        self.send_header(name, value)
+                    self.send_header('Content-Length', '0')
+                    self.end_headers()
+                    return
+                body = server.pages.get(self.path)
+                if body is None:
+                    self.send_error(404)
+                    return
+                try:
+                    self.send_response(200)
+                    self.send_header('Content-Type', 'text/html; charset=utf-8')
+                    self.send_header('Content-Length', str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+                except OSError:
+                    pass   # The client timed out and went away
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def url(self, rule_id):
+        return f"http://127.0.0.1:{self.server.server_port}/rules/{rule_id}"
+
+    def publish(self, rule_id, lines):
+        self.pages[f"/rules/{rule_id}"] = render_page(rule_id, lines)
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+# name -> (fault plan, expected outcome for every rule)
+SCENARIOS = {
+    'healthy': (lambda path, attempt, n: None, 'text'),
+    'flaky': (lambda path, attempt, n: {1: ('status', 503, {}), 2: ('reset',)}.get(attempt), 'text'),
+    'throttled': (lambda path, attempt, n: ('status', 429, {'Retry-After': '1'}) if n <= 3 else None, 'text'),
+    'blocked': (lambda path, attempt, n: ('status', 403, {}), 'blocked'),
+    'hanging': (lambda path, attempt, n: ('hang', HANG_S), 'failed'),
+    'long_backoff': (lambda path, attempt, n: ('status', 429, {'Retry-After': '3600'}), 'blocked'),
+}
+
+def run_scenario(name, n_rules, per_host_limit):
+    from src.downloader import download_rules
+    from src.fetch_policy import FetchPolicy, fetch_outcome
+    from src import metrics
+
+    plan, expected = SCENARIOS[name]
+    server = FaultServer(plan)
+    try:
+        rules = [{'id': f"FAULT-{i:03d}", 'url': None} for i in range(n_rules)]
+        for i, rule in enumerate(rules):
+            rule['url'] = server.url(rule['id'])
+            server.publish(rule['id'], make_rule_text(30, seed=i))
+        policy = FetchPolicy(host_rate=0, breaker_threshold=BREAKER_THRESHOLD, timeout=(READ_TIMEOUT_S, READ_TIMEOUT_S),
+                             backoff_base=BACKOFF_BASE_S)
+        metrics.start_run()
+        start = time.perf_counter()
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            results = download_rules(rules, per_host_limit=per_host_limit, full_fetch_ids={r['id'] for r in rules},
+                                     policy=policy)
+        wall = time.perf_counter() - start
+        counters = metrics.export_run()['counters']
+        outcomes = {}
+        for result in results.values():
+            outcome = fetch_outcome(result) or 'text'
+            outcomes[outcome] = outcomes.get(outcome, 0) + 1
+        return {
+            'scenario': name,
+            'wall_s': round(wall, 3),
+            'requests': server.requests,
+            'outcomes': outcomes,
+            'retries': counters.get('fetch_retries', 0),
+            'circuit_skips': counters.get('circuit_open_skips', 0),
+            'ok': outcomes == {expected: n_rules},
+        }
+    finally:
+        server.close()
+
+def main():
+    parser = argparse.ArgumentParser(description="Fetch policy under injected faults")
+    parser.add_argument('--rules', type=int, default=20, help="Rules served per scenario.")
+    parser.add_argument('--per-host', type=int, default=4, help="Concurrent requests per host.")
+    parser.add_argument('--scenario', choices=sorted(SCENARIOS), nargs='+', default=list(SCENARIOS))
+    parser.add_argument('--json', action='store_true', help="Print machine-readable results.")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='bench_faults_')
+    sys.path.insert(0, REPO_ROOT)
+    try:
+        from src.database_manager import init_db
+        init_db(os.path.join(workdir, 'regulations.db'))
+        results = [run_scenario(name, args.rules, args.per_host) for name in args.scenario]
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print(f"{args.rules} rules per scenario, {args.per_host} per host, read timeout {READ_TIMEOUT_S}s:")
+        print(f"{'scenario':>14} {'wall s':>7} {'requests':>9} {'retries':>8} {'skipped':>8}  outcomes")
+        for r in results:
+            outcomes = ", ".join(f"{count} {name}" for name, count in sorted(r['outcomes'].items()))
+            print(f"{r['scenario']:>14} {r['wall_s']:>7.2f} {r['requests']:>9} {r['retries']:>8} "
+                  f"{r['circuit_skips']:>8}  {outcomes}{'' if r['ok'] else '  <-- UNEXPECTED'}")
+    if not all(r['ok'] for r in results):
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,333 @@
+# benchmarks/bench_pipeline.py
+#
+# End-to-end benchmark of the tracker pipeline on synthetic rulebooks served
+# by a local FINRA-like HTTP server (no network, no real archive touched:
+# every run works in a throwaway directory with its own data/regulations.db).
+#
+# Stages timed per call:
+#   download_extract   download_rule on a fresh page (fetch + extraction)
+#   log_baseline       log_new_version for the first version
+#   download_recheck   conditional download_rule after churn (304 or new text)
+#   get_latest_version archived text of a changed rule
+#   compare_text       compute_diff + compare_text
+#   analyze_changes    spaCy NER (skipped when the model is not installed)
+#   generate_html_report
+#   log_change         log_new_version for the changed text
+#   render_diff_html   the dashboard's redline (first page)
+#
+# Each rulebook size runs in its own subprocess so peak RSS is per size.
+#
+#   python -m benchmarks.bench_pipeline
+#   python -m benchmarks.bench_pipeline --rules 50 1000 --json
+#   python -m benchmarks.bench_pipeline --save-baseline bench_baseline.json
+#   python -m benchmarks.bench_pipeline --baseline bench_baseline.json --tolerance 0.25
+
+import argparse
+import ast
+import contextlib
+import hashlib
+import json
+import math
+import os
+import platform
+import random
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from html import escape
+
+from benchmarks.bench_diff import make_rule_text, mutate
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+STAGES = ['download_extract', 'log_baseline', 'download_recheck', 'get_latest_version', 'compare_text',
+          'analyze_changes', 'generate_html_report', 'log_change', 'render_diff_html']
+
+# Page chrome around the rule text, roughly the weight of a real FINRA page
+NAV = "".join(f'<li class="menu-item leaf"><a href="/topic-{i}">Topic {i} overview and guidance</a></li>'
+              for i in range(200))
+SCRIPTS = "".join(f'<script>dataLayer.push({{"event":"e{i}","payload":"{"x" * 300}"}});</script>' for i in range(10))
+
+def render_page(rule_id, lines):
+    """A FINRA-like rule page: nav, scripts and footer around the rule container."""
+    paragraphs = "\n".join(f"<p>{escape(line)}</p>" for line in lines)
+    return (f'<!DOCTYPE html><html><head><meta charset="utf-8"><title>{rule_id} | FINRA.org</title>{SCRIPTS}</head>'
+            f'<body><header><nav class="main-nav"><ul class="menu">{NAV}</ul></nav></header>'
+            f'<div id="block-system-main"><div class="field-item even"><div class="rule-book-content">\n'
+            f'{paragraphs}\n</div></div></div>'
+            f'<footer class="site-footer"><ul class="menu">{NAV}</ul></footer>{SCRIPTS}</body></html>').encode('utf-8')
+
+class RulebookServer:
+    """Serves /rules/<id> pages from memory with ETags (and 304s) like the real site."""
+
+    def __init__(self):
+        self.pages = {}
+        pages = self.pages
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                body = pages.get(self.path)
+                if body is None:
+                    self.send_error(404)
+                    return
+                etag = '"' + hashlib.md5(body).hexdigest() + '"'
+                if self.headers.get('If-None-Match') == etag:
+                    self.send_response(304)
+                    self.send_header('ETag', etag)
+                    self.end_headers()
+                    return
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/html; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.send_header('ETag', etag)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def url(self, rule_id):
+        return f"http://127.0.0.1:{self.server.server_port}/rules/{rule_id}"
+
+    def publish(self, rule_id, lines):
+        self.pages[f"/rules/{rule_id}"] = render_page(rule_id, lines)
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+def load_render_diff_html():
+    """
+    Pulls render_diff_html and its helpers out of dashboard.py without
+    executing the Streamlit app around them.
+    """
+    from src.diff_engine import compute_diff, grouped_opcodes
+    wanted = {'DIFF_CONTEXT_LINES', 'HUNKS_PER_PAGE', 'DIFF_STYLE', 'diff_hunks', 'diff_page_count', 'render_diff_html'}
+    with open(os.path.join(REPO_ROOT, 'dashboard.py'), encoding='utf-8') as f:
+        tree = ast.parse(f.read())
+    nodes = [node for node in tree.body
+             if (isinstance(node, ast.FunctionDef) and node.name in wanted) or
+                (isinstance(node, ast.Assign) and any(getattr(t, 'id', None) in wanted for t in node.targets))]
+    namespace = {'escape': escape, 'compute_diff': compute_diff, 'grouped_opcodes': grouped_opcodes}
+    exec(compile(ast.Module(body=nodes, type_ignores=[]), 'dashboard.py', 'exec'), namespace)
+    return namespace['render_diff_html']
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return None
+    return sorted_values[max(0, math.ceil(pct / 100 * len(sorted_values)) - 1)]
+
+def summarize(samples):
+    """Count, throughput and latency percentiles (ms) for one stage's samples (s)."""
+    samples = sorted(samples)
+    total = sum(samples)
+    return {
+        'count': len(samples),
+        'total_s': round(total, 4),
+        'throughput_per_s': round(len(samples) / total, 1) if total else None,
+        'p50_ms': round(percentile(samples, 50) * 1000, 3),
+        'p95_ms': round(percentile(samples, 95) * 1000, 3),
+        'p99_ms': round(percentile(samples, 99) * 1000, 3),
+    }
+
+def peak_rss_kb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS, kilobytes on Linux
+    return peak // 1024 if sys.platform == 'darwin' else peak
+
+def run_once(n_rules, lines_per_rule, churn, edits, seed):
+    """Runs the whole pipeline for one rulebook size in a scratch directory."""
+    workdir = tempfile.mkdtemp(prefix='bench_pipeline_')
+    os.makedirs(os.path.join(workdir, 'data'))
+    os.chdir(workdir)
+    sys.path.insert(0, REPO_ROOT)
+
+    from src.downloader import download_rule, commit_fetch_validators, create_session, NOT_MODIFIED
+    from src.database_manager import init_db, log_new_version, get_latest_version, close_connection
+    from src.comparator import compare_text
+    from src.diff_engine import compute_diff
+    from src.reporter import generate_html_report
+    import src.analyzer as analyzer
+    render_diff_html = load_render_diff_html()
+    init_db(os.path.join(workdir, 'data', 'regulations.db'))
+    try:
+        analyzer.get_nlp()
+        ner_available = True
+    except OSError:
+        ner_available = False
+
+    timings = {stage: [] for stage in STAGES}
+
+    def timed(stage, fn, *args, **kwargs):
+        start = time.perf_counter()
+        result = fn(*args, **kwargs)
+        timings[stage].append(time.perf_counter() - start)
+        return result
+
+    rng = random.Random(seed)
+    server = RulebookServer()
+    session = create_session()
+    rule_ids = [f"BENCH-{i:05d}" for i in range(n_rules)]
+    lines = {rule_id: make_rule_text(lines_per_rule, seed=seed + i) for i, rule_id in enumerate(rule_ids)}
+    changed = set(rng.sample(rule_ids, int(round(n_rules * churn))))
+
+    wall = time.perf_counter()
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        # 1. First run: every rule gets a baseline
+        for rule_id in rule_ids:
+            server.publish(rule_id, lines[rule_id])
+        for rule_id in rule_ids:
+            text = timed('download_extract', download_rule, server.url(rule_id), session=session, conditional=False)
+            timed('log_baseline', log_new_version, rule_id, text, summary="Initial Baseline Version")
+            commit_fetch_validators(server.url(rule_id))
+
+        # 2. Churn a fraction of the rulebook, then re-check everything
+        for i, rule_id in enumerate(rule_ids):
+            if rule_id in changed:
+                server.publish(rule_id, mutate(lines[rule_id], edits, seed=seed + i))
+        for rule_id in rule_ids:
+            text = timed('download_recheck', download_rule, server.url(rule_id), session=session, conditional=True)
+            if text is NOT_MODIFIED:
+                continue
+            old_text = timed('get_latest_version', get_latest_version, rule_id)
+            start = time.perf_counter()
+            diff = compute_diff(old_text, text)
+            changes = compare_text(old_text, text, diff=diff)
+            timings['compare_text'].append(time.perf_counter() - start)
+            if ner_available:
+                timed('analyze_changes', analyzer.analyze_changes, changes)
+            timed('generate_html_report', generate_html_report, rule_id, rule_id, old_text, text, diff=diff)
+            timed('log_change', log_new_version, rule_id, text, summary="Changes detected.", diff=diff)
+            timed('render_diff_html', render_diff_html, old_text, text, diff=diff)
+    wall = time.perf_counter() - wall
+
+    session.close()
+    server.close()
+    close_connection()
+    os.chdir(REPO_ROOT)
+    shutil.rmtree(workdir, ignore_errors=True)
+    return {
+        'rules': n_rules,
+        'lines_per_rule': lines_per_rule,
+        'churn': churn,
+        'edits': edits,
+        'changed_rules': len(changed),
+        'wall_s': round(wall, 3),
+        'rules_per_s': round(n_rules / wall, 1) if wall else None,
+        'peak_rss_kb': peak_rss_kb(),
+        'ner': 'measured' if ner_available else 'skipped (spaCy model not installed)',
+        'stages': {stage: summarize(samples) for stage, samples in timings.items() if samples},
+    }
+
+def run_in_subprocess(n_rules, args):
+    """One size per child process, so peak RSS is not inherited from smaller runs."""
+    with tempfile.NamedTemporaryFile(suffix='.json', delete=False) as f:
+        result_path = f.name
+    try:
+        subprocess.run([sys.executable, '-m', 'benchmarks.bench_pipeline', '--single', str(n_rules),
+                        '--lines-per-rule', str(args.lines_per_rule), '--churn', str(args.churn),
+                        '--edits', str(args.edits), '--seed', str(args.seed), '--result-file', result_path],
+                       cwd=REPO_ROOT, check=True, stdout=subprocess.DEVNULL)
+        with open(result_path, encoding='utf-8') as f:
+            return json.load(f)
+    finally:
+        os.unlink(result_path)
+
+def compare_to_baseline(report, baseline, tolerance):
+    """
+    Flags stages whose p95 latency grew by more than `tolerance` (a fraction)
+    against the baseline run of the same rulebook size.
+
+    Returns:
+        A list of regression dicts (empty when nothing regressed).
+    """
+    regressions = []
+    baseline_runs = {run['rules']: run for run in baseline.get('runs', [])}
+    for run in report['runs']:
+        base = baseline_runs.get(run['rules'])
+        if base is None:
+            continue
+        for stage, stats in run['stages'].items():
+            base_stats = base['stages'].get(stage)
+            if not base_stats or not base_stats['p95_ms']:
+                continue
+            ratio = stats['p95_ms'] / base_stats['p95_ms']
+            if ratio > 1 + tolerance:
+                regressions.append({'rules': run['rules'], 'stage': stage, 'baseline_p95_ms': base_stats['p95_ms'],
+                                    'p95_ms': stats['p95_ms'], 'ratio': round(ratio, 2)})
+    return regressions
+
+def print_table(report):
+    for run in report['runs']:
+        print(f"\n{run['rules']} rules x {run['lines_per_rule']} lines, {run['changed_rules']} changed: "
+              f"{run['wall_s']:.2f}s wall, {run['rules_per_s']} rules/s, peak RSS {run['peak_rss_kb'] // 1024} MB "
+              f"(NER {run['ner']})")
+        print(f"{'stage':>22} {'count':>7} {'ops/s':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+        for stage, s in run['stages'].items():
+            print(f"{stage:>22} {s['count']:>7} {s['throughput_per_s']:>9} {s['p50_ms']:>9.2f} "
+                  f"{s['p95_ms']:>9.2f} {s['p99_ms']:>9.2f}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Tracker pipeline benchmark on synthetic rulebooks")
+    parser.add_argument('--rules', type=int, nargs='+', default=[50, 1000, 10000])
+    parser.add_argument('--lines-per-rule', type=int, default=150)
+    parser.add_argument('--churn', type=float, default=0.1, help="Fraction of rules changed between runs.")
+    parser.add_argument('--edits', type=int, default=5, help="Edits applied to each changed rule.")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--json', action='store_true', help="Print machine-readable results.")
+    parser.add_argument('--output', help="Also write the JSON report to this file.")
+    parser.add_argument('--save-baseline', help="Write the JSON report here for later --baseline runs.")
+    parser.add_argument('--baseline', help="Compare against a saved report; exits 1 on regressions.")
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help="Allowed p95 slowdown vs the baseline, as a fraction (default 0.2).")
+    # Internal: run a single size in this process
+    parser.add_argument('--single', type=int, help=argparse.SUPPRESS)
+    parser.add_argument('--result-file', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.single is not None:
+        result = run_once(args.single, args.lines_per_rule, args.churn, args.edits, args.seed)
+        with open(args.result_file, 'w', encoding='utf-8') as f:
+            json.dump(result, f)
+        return
+
+    report = {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'runs': [run_in_subprocess(n, args) for n in args.rules],
+    }
+    for path in (args.output, args.save_baseline):
+        if path:
+            with open(path, 'w', encoding='utf-8') as f:
+                json.dump(report, f, indent=2)
+
+    regressions = []
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            regressions = compare_to_baseline(report, json.load(f), args.tolerance)
+        report['regressions'] = regressions
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_table(report)
+        if args.baseline:
+            print(f"\nRegressions vs {args.baseline} (p95 > +{args.tolerance:.0%}): {len(regressions)}")
+            for r in regressions:
+                print(f"  {r['rules']:>6} rules {r['stage']:>22}: {r['baseline_p95_ms']:.2f} -> "
+                      f"{r['p95_ms']:.2f} ms ({r['ratio']}x)")
+    if regressions:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
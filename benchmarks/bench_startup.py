@@ -0,0 +1,99 @@
+# benchmarks/bench_startup.py
+#
+# Cold-start cost of the tracker CLI. Each measurement is a fresh Python
+# process, so nothing is warm except the OS file cache:
+#
+#   import_main        python -c "import main"
+#   no_change_run      python main.py against a local rulebook server that
+#                      answers every conditional request with 304 (the common
+#                      case: nothing changed since the last run)
+#   ner_model_load     what loading spaCy at import time used to add to both
+#                      (skipped when the model is not installed)
+#
+# Runs in a throwaway directory with its own tracked_rules.json and database.
+#
+#   python -m benchmarks.bench_startup
+#   python -m benchmarks.bench_startup --rules 51 --repeat 7 --json
+
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.bench_diff import make_rule_text
+from benchmarks.bench_pipeline import RulebookServer, REPO_ROOT
+
+MAIN = os.path.join(REPO_ROOT, 'main.py')
+
+# The local server needs no politeness limit; only startup cost is measured
+TRACKER = [MAIN, '--host-rate', '0']
+
+LOAD_MODEL = "import sys; sys.path.insert(0, sys.argv[1]); from src.analyzer import get_nlp; get_nlp()"
+
+def time_process(args, cwd):
+    """Wall time of one child process, from spawn to exit (raises if it fails)."""
+    start = time.perf_counter()
+    subprocess.run(args, cwd=cwd, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    return time.perf_counter() - start
+
+def measure(args, cwd, repeat):
+    samples = sorted(time_process(args, cwd) for _ in range(repeat))
+    return {'best_s': round(samples[0], 3), 'median_s': round(statistics.median(samples), 3)}
+
+def run(n_rules, repeat):
+    workdir = tempfile.mkdtemp(prefix='bench_startup_')
+    server = RulebookServer()
+    try:
+        os.makedirs(os.path.join(workdir, 'data'))
+        rules = [{'id': f"BENCH-{i:05d}", 'name': f"Benchmark rule {i}"} for i in range(n_rules)]
+        for i, rule in enumerate(rules):
+            rule['url'] = server.url(rule['id'])
+            server.publish(rule['id'], make_rule_text(40, seed=i))
+        with open(os.path.join(workdir, 'data', 'tracked_rules.json'), 'w', encoding='utf-8') as f:
+            json.dump(rules, f)
+
+        # First run stores baselines and ETags; every later run is a no-change run
+        time_process([sys.executable, *TRACKER], workdir)
+
+        results = {
+            'rules': n_rules,
+            'import_main': measure([sys.executable, '-c', 'import main'], REPO_ROOT, repeat),
+            'no_change_run': measure([sys.executable, *TRACKER], workdir, repeat),
+        }
+        try:
+            results['ner_model_load'] = measure([sys.executable, '-c', LOAD_MODEL, REPO_ROOT], workdir, repeat)
+        except subprocess.CalledProcessError:
+            results['ner_model_load'] = None   # Model not installed
+        return results
+    finally:
+        server.close()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+def main():
+    parser = argparse.ArgumentParser(description="Tracker cold-start benchmark")
+    parser.add_argument('--rules', type=int, default=51, help="Tracked rules served by the local server.")
+    parser.add_argument('--repeat', type=int, default=5, help="Fresh processes per measurement.")
+    parser.add_argument('--json', action='store_true', help="Print machine-readable results.")
+    args = parser.parse_args()
+
+    results = run(args.rules, args.repeat)
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print(f"Cold start, {args.rules} rules, {args.repeat} fresh processes each:")
+    print(f"{'measurement':>16} {'best s':>8} {'median s':>9}")
+    for name in ('import_main', 'no_change_run', 'ner_model_load'):
+        stats = results[name]
+        if stats is None:
+            print(f"{name:>16}  skipped (spaCy model not installed)")
+        else:
+            print(f"{name:>16} {stats['best_s']:>8.3f} {stats['median_s']:>9.3f}")
+
+if __name__ == "__main__":
+    main()
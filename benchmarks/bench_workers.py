@@ -0,0 +1,193 @@
+# benchmarks/bench_workers.py
+#
+# Several `main.py --worker` processes sweeping one cycle against a local
+# rulebook server, in a throwaway directory with its own data/regulations.db.
+# Each scenario checks that every rule ends the cycle done, with exactly one
+# archived version:
+#
+#   sweep    --processes workers share the rulebook from the start
+#   crash    one worker is killed mid-round; the rest take over its rules
+#            once its leases expire
+#   locked   another connection holds the write lock past the busy timeout
+#            while a worker's round is fetching; the round must be rolled
+#            back (no rule marked done without its version) and redone
+#
+# Reported per scenario: seconds until the last rule was done, rounds
+# discarded, rules reclaimed and versions per rule. The command exits 1 if
+# any scenario misbehaves, so it doubles as a test.
+#
+#   python -m benchmarks.bench_workers
+#   python -m benchmarks.bench_workers --rules 200 --processes 4 --json
+
+import argparse
+import json
+import os
+import shutil
+import signal
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from benchmarks.bench_diff import make_rule_text
+from benchmarks.bench_faults import FaultServer
+from benchmarks.bench_pipeline import REPO_ROOT
+
+CYCLE = 'bench'
+
+# Every page takes this long to serve, so rounds overlap and a kill or a
+# lock reliably lands while a round is still fetching
+PAGE_DELAY_S = 0.05
+
+# Short leases so the crash scenario does not wait minutes for a takeover
+LEASE_S = 3
+
+CLAIM_BATCH = 5
+
+def start_worker(workdir, name, per_host=4):
+    """Starts one worker process; its output goes to <name>.log in the workdir."""
+    with open(os.path.join(workdir, f"{name}.log"), 'w') as log:
+        return subprocess.Popen(
+            [sys.executable, os.path.join(REPO_ROOT, 'main.py'), '--worker', '--cycle', CYCLE, '--worker-id', name,
+             '--claim-batch', str(CLAIM_BATCH), '--lease-seconds', str(LEASE_S), '--per-host', str(per_host),
+             '--host-rate', '0'],
+            cwd=workdir, stdout=log, stderr=subprocess.STDOUT)
+
+def query(db_path, sql, params=()):
+    conn = sqlite3.connect(db_path, timeout=30)
+    try:
+        return conn.execute(sql, params).fetchall()
+    except sqlite3.OperationalError:
+        return []   # Schema not created yet
+    finally:
+        conn.close()
+
+def wait_for(predicate, timeout_s, poll_s=0.02):
+    deadline = time.perf_counter() + timeout_s
+    while time.perf_counter() < deadline:
+        if predicate():
+            return True
+        time.sleep(poll_s)
+    return False
+
+def hold_write_lock(db_path, seconds):
+    """Keeps a write transaction open on its own connection, like a stalled peer."""
+    conn = sqlite3.connect(db_path, isolation_level=None, timeout=30)
+    conn.execute("BEGIN IMMEDIATE;")
+    time.sleep(seconds)
+    conn.execute("COMMIT;")
+    conn.close()
+
+def run_scenario(name, n_rules, n_processes):
+    from src.database_manager import BUSY_TIMEOUT_MS
+
+    workdir = tempfile.mkdtemp(prefix='bench_workers_')
+    os.makedirs(os.path.join(workdir, 'data'))
+    db_path = os.path.join(workdir, 'data', 'regulations.db')
+    server = FaultServer(lambda path, attempt, n: ('hang', PAGE_DELAY_S))
+    workers = []
+    try:
+        rules = []
+        for i in range(n_rules):
+            rule_id = f"WORK-{i:04d}"
+            server.publish(rule_id, make_rule_text(40, seed=i))
+            rules.append({'id': rule_id, 'name': f"Rule {i}", 'url': server.url(rule_id)})
+        with open(os.path.join(workdir, 'data', 'tracked_rules.json'), 'w') as f:
+            json.dump(rules, f)
+
+        def leased():
+            rows = query(db_path, "SELECT COUNT(*) FROM rule_leases WHERE status = 'leased'")
+            return bool(rows) and rows[0][0] > 0
+
+        def done():
+            rows = query(db_path, "SELECT COUNT(*) FROM rule_leases WHERE cycle = ? AND status = 'done'", (CYCLE,))
+            return bool(rows) and rows[0][0] == n_rules
+
+        start = time.perf_counter()
+        if name == 'crash':
+            # One worker, one request at a time, so it is killed with a round half fetched
+            victim = start_worker(workdir, 'victim', per_host=1)
+            wait_for(leased, 30)
+            time.sleep(PAGE_DELAY_S * 2)
+            victim.send_signal(signal.SIGKILL)
+            victim.wait()
+            time.sleep(LEASE_S + 0.5)
+        lock = None
+        if name == 'locked':
+            workers.append(start_worker(workdir, 'w0', per_host=1))
+            wait_for(leased, 30)
+            lock = threading.Thread(target=hold_write_lock, args=(db_path, BUSY_TIMEOUT_MS / 1000 + 1))
+            lock.start()
+        while len(workers) < n_processes:
+            workers.append(start_worker(workdir, f"w{len(workers)}"))
+        finished = wait_for(done, 120)
+        to_done = time.perf_counter() - start
+        for worker in workers:
+            worker.wait(timeout=60)
+        output = ""
+        for log_name in os.listdir(workdir):
+            if log_name.endswith('.log'):
+                with open(os.path.join(workdir, log_name)) as log:
+                    output += log.read()
+        if lock is not None:
+            lock.join()
+
+        versions = dict(query(db_path, "SELECT rule_id, COUNT(*) FROM rule_versions GROUP BY rule_id"))
+        by_worker = dict(query(db_path, "SELECT worker_id, COUNT(*) FROM rule_leases WHERE cycle = ? "
+                                        "AND status = 'done' GROUP BY worker_id", (CYCLE,)))
+        reclaimed = query(db_path, "SELECT COUNT(*) FROM rule_leases WHERE cycle = ? AND attempts > 1", (CYCLE,))[0][0]
+        discarded = output.count("Round discarded")
+        ok = (finished and sorted(versions) == [rule['id'] for rule in rules]
+              and set(versions.values()) == {1} and sum(by_worker.values()) == n_rules
+              and all(worker.returncode == 0 for worker in workers))
+        if name == 'crash':
+            ok = ok and reclaimed > 0 and 'victim' not in by_worker
+        if name == 'locked':
+            ok = ok and discarded > 0
+        return {
+            'scenario': name,
+            'rules': n_rules,
+            'processes': len(workers),
+            'seconds_to_done': round(to_done, 2),
+            'done_by_worker': by_worker,
+            'rounds_discarded': discarded,
+            'rules_reclaimed': reclaimed,
+            'versions_per_rule': sorted(set(versions.values())),
+            'ok': ok,
+        }
+    finally:
+        for worker in workers:
+            if worker.poll() is None:
+                worker.kill()
+        server.close()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+SCENARIOS = ['sweep', 'crash', 'locked']
+
+def main():
+    parser = argparse.ArgumentParser(description="Sharded workers sweeping one cycle")
+    parser.add_argument('--rules', type=int, default=60, help="Rules in the rulebook.")
+    parser.add_argument('--processes', type=int, default=3, help="Worker processes per scenario.")
+    parser.add_argument('--scenario', choices=SCENARIOS, nargs='+', default=SCENARIOS)
+    parser.add_argument('--json', action='store_true', help="Print machine-readable results.")
+    args = parser.parse_args()
+
+    sys.path.insert(0, REPO_ROOT)
+    results = [run_scenario(name, args.rules, args.processes) for name in args.scenario]
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print(f"{args.rules} rules, claim batch {CLAIM_BATCH}, lease {LEASE_S}s, {PAGE_DELAY_S}s per page:")
+        print(f"{'scenario':>9} {'procs':>6} {'to done s':>10} {'discarded':>10} {'reclaimed':>10}  done by worker")
+        for r in results:
+            by_worker = ", ".join(f"{worker} {count}" for worker, count in sorted(r['done_by_worker'].items()))
+            print(f"{r['scenario']:>9} {r['processes']:>6} {r['seconds_to_done']:>10.2f} {r['rounds_discarded']:>10} "
+                  f"{r['rules_reclaimed']:>10}  {by_worker}{'' if r['ok'] else '  <-- UNEXPECTED'}")
+    if not all(r['ok'] for r in results):
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
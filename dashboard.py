@@ -1,21 +1,23 @@
 # dashboard.py
 
 import streamlit as st
-import sqlite3
 import pandas as pd
 import json
-import difflib
-import spacy
 import os
+import datetime
+import sqlite3
+from html import escape
 import streamlit.components.v1 as components
-from src.downloader import download_rule
-from src.database_manager import get_latest_version, log_new_version
-
-# --- Load NLP Model ---
-try:
-    nlp = spacy.load("en_core_web_sm")
-except OSError:
-    pass 
+from src.downloader import download_rule, commit_fetch_validators, NOT_MODIFIED, FetchError
+from src.comparator import load_baseline, BASELINE_CHANGED, BASELINE_MISSING
+from src.database_manager import (log_new_version, clear_fetch_validators, has_baseline,
+                                  batch, delete_rule_history, get_version_history, get_version_text,
+                                  get_version_diff, get_db_marker, get_report, search_versions, first_appearances,
+                                  get_portfolio, record_check, init_db, close_connection,
+                                  CHURN_WINDOW_DAYS)
+from src.diff_engine import compute_diff, grouped_opcodes, LineDiff
+from src.metrics import read_run_summaries, RUNS_LOG
+from src.reporter import render_report
 
 # --- Configuration ---
 st.set_page_config(page_title="Regulatory Harmony", layout="wide", page_icon="🌑")
@@ -94,35 +96,82 @@ st.markdown("""
     """, unsafe_allow_html=True)
 
 # --- Helper Functions ---
-def get_rules():
-    try:
-        with open('data/tracked_rules.json', 'r') as f: return json.load(f)
-    except FileNotFoundError: return []
+# Streamlit reruns this whole script on every click, so anything expensive is
+# cached: storage setup as a resource (once per process), queries as data.
+# The SQLite connection itself is per rerun, not cached: each rerun runs on a
+# new thread and database_manager connections are thread-local (a shared one
+# would interleave concurrent sessions' transactions). It is opened by the
+# first query and closed at the end of the script; reruns cut short by
+# st.stop()/st.rerun() leave it to be closed when their thread exits.
+RULES_PATH = 'data/tracked_rules.json'
 
-def get_history(rule_id):
-    if not os.path.exists('data/regulations.db'): return pd.DataFrame()
-    conn = sqlite3.connect('data/regulations.db')
+@st.cache_resource(show_spinner=False)
+def init_storage():
+    """Run schema setup/migrations once per server process."""
+    return init_db()
+
+@st.cache_data(show_spinner=False)
+def load_rules(mtime):
+    """Parse tracked_rules.json once per file modification time."""
     try:
-        df = pd.read_sql_query("SELECT id, check_date, length(rule_text) as text_length, change_summary FROM rule_versions WHERE rule_id = ? ORDER BY check_date DESC", conn, params=(rule_id,))
-    except Exception: df = pd.DataFrame()
-    finally: conn.close()
-    return df
+        with open(RULES_PATH, 'r') as f: rules = json.load(f)
+    except FileNotFoundError: rules = []
+    return rules, {r['name']: r for r in rules}
+
+def get_rules():
+    try: mtime = os.path.getmtime(RULES_PATH)
+    except OSError: mtime = None
+    return load_rules(mtime)
+
+@st.cache_data(show_spinner=False)
+def get_history(rule_id, marker):
+    """Version list for a rule; `marker` (get_db_marker) changes whenever the archive does."""
+    return pd.DataFrame(get_version_history(rule_id))
 
+@st.cache_data(show_spinner=False, max_entries=64)
 def get_specific_version_text(version_id):
-    conn = sqlite3.connect('data/regulations.db')
-    cursor = conn.cursor()
-    cursor.execute("SELECT rule_text FROM rule_versions WHERE id = ?", (version_id,))
-    result = cursor.fetchone()
-    conn.close()
-    return result[0] if result else ""
+    # Archived versions are immutable, so the id alone is a safe cache key
+    return get_version_text(int(version_id))
+
+@st.cache_data
+def load_run_summaries(mtime):
+    """Tracker run summaries from the metrics log; mtime keys the cache."""
+    return read_run_summaries(limit=50)
+
+def get_run_summaries():
+    try: mtime = os.path.getmtime(RUNS_LOG)
+    except OSError: mtime = None
+    return load_run_summaries(mtime)
+
+@st.cache_data(max_entries=32)
+def run_search(query, raw, marker):
+    """Full-text search results; marker (see get_db_marker) invalidates them when the archive changes."""
+    return search_versions(query, raw=raw), first_appearances(query, raw=raw)
+
+@st.cache_data(show_spinner=False, ttl=60)
+def load_portfolio(marker):
+    """Summary row per rule; refreshed when versions change, and at least every minute for check times."""
+    return get_portfolio()
+
+def portfolio_status(row):
+    if not row.get('versions'): return "No baseline"
+    if row.get('last_outcome') == 'failed': return "Fetch failing"
+    if row.get('last_outcome') == 'blocked': return "Blocked"
+    if row.get('recent_changes'): return "Changed"
+    return "Stable"
+
+def invalidate_caches():
+    """Called after this session writes to the archive."""
+    get_history.clear()
+    load_portfolio.clear()
 
 # --- CUSTOM DIFF ENGINE ---
-def render_diff_html(old_text, new_text):
-    a = old_text.splitlines()
-    b = new_text.splitlines()
-    matcher = difflib.SequenceMatcher(None, a, b)
-    html = []
-    html.append("""
+# Unchanged lines shown around each change; longer unchanged runs collapse
+DIFF_CONTEXT_LINES = 5
+# Hunks rendered per page of the redline
+HUNKS_PER_PAGE = 20
+
+DIFF_STYLE = """
     <style>
         .diff-row { display: flex; border-bottom: 1px solid #333; font-family: 'Helvetica Neue', sans-serif; font-size: 13px; }
         .diff-cell { flex: 1; padding: 5px 10px; word-wrap: break-word; white-space: pre-wrap; color: #ffffff; }
@@ -130,31 +179,79 @@ def render_diff_html(old_text, new_text):
         .added { background-color: rgba(15, 61, 27, 0.6); color: #84e897; } 
         .deleted { background-color: rgba(61, 20, 20, 0.6); color: #f28b8b; }
         .empty { background-color: transparent; }
+        .diff-skip { padding: 4px 10px; font-family: 'Helvetica Neue', sans-serif; font-size: 12px; color: #888; background: rgba(255,255,255,0.04); border-bottom: 1px solid #333; text-align: center; }
     </style>
     <div style="background: rgba(0,0,0,0.2); border-radius: 8px; border: 1px solid #444; overflow: hidden;">
-    """)
-    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
-        if tag == 'equal':
-            for i, line in enumerate(a[i1:i2]):
-                html.append(f'<div class="diff-row"><div class="diff-num">{i1+i+1}</div><div class="diff-cell">{line}</div><div class="diff-num">{j1+i+1}</div><div class="diff-cell">{line}</div></div>')
-        elif tag == 'replace':
-            old_chunk = a[i1:i2]
-            new_chunk = b[j1:j2]
-            max_len = max(len(old_chunk), len(new_chunk))
-            old_chunk += [''] * (max_len - len(old_chunk))
-            new_chunk += [''] * (max_len - len(new_chunk))
-            for i in range(max_len):
-                o_text, n_text = old_chunk[i], new_chunk[i]
-                o_cls, n_cls = ("deleted" if o_text else "empty"), ("added" if n_text else "empty")
-                html.append(f'<div class="diff-row"><div class="diff-num">{i1+i+1 if o_text else ""}</div><div class="diff-cell {o_cls}">{o_text}</div><div class="diff-num">{j1+i+1 if n_text else ""}</div><div class="diff-cell {n_cls}">{n_text}</div></div>')
-        elif tag == 'delete':
-            for i, line in enumerate(a[i1:i2]):
-                html.append(f'<div class="diff-row"><div class="diff-num">{i1+i+1}</div><div class="diff-cell deleted">{line}</div><div class="diff-num"></div><div class="diff-cell empty"></div></div>')
-        elif tag == 'insert':
-            for i, line in enumerate(b[j1:j2]):
-                html.append(f'<div class="diff-row"><div class="diff-num"></div><div class="diff-cell empty"></div><div class="diff-num">{j1+i+1}</div><div class="diff-cell added">{line}</div></div>')
+    """
+
+def diff_hunks(diff, context=DIFF_CONTEXT_LINES):
+    """Split a diff into hunks; context=None keeps the whole text as one hunk."""
+    if context is None:
+        return [diff.opcodes] if diff.opcodes else []
+    return grouped_opcodes(diff.opcodes, context)
+
+def diff_page_count(diff, context=DIFF_CONTEXT_LINES):
+    return max(1, -(-len(diff_hunks(diff, context)) // HUNKS_PER_PAGE))
+
+def render_diff_html(old_text, new_text, diff=None, context=DIFF_CONTEXT_LINES, page=0):
+    """
+    Render one page of the side-by-side redline.
+
+    Unchanged runs longer than 2 * context lines are collapsed into a
+    "N unchanged lines" marker, so the payload grows with the size of the
+    change rather than the size of the rule.
+
+    Returns:
+        (html, row_count) for the requested page.
+    """
+    if diff is None:
+        diff = compute_diff(old_text, new_text)
+    a = diff.old_lines
+    b = diff.new_lines
+    hunks = diff_hunks(diff, context)
+    page_hunks = hunks[page * HUNKS_PER_PAGE:(page + 1) * HUNKS_PER_PAGE]
+
+    def row(o_num, o_html, o_cls, n_num, n_html, n_cls):
+        return f'<div class="diff-row"><div class="diff-num">{o_num}</div><div class="diff-cell {o_cls}">{o_html}</div><div class="diff-num">{n_num}</div><div class="diff-cell {n_cls}">{n_html}</div></div>'
+
+    def skipped(start, end):
+        return f'<div class="diff-skip">⋯ {end - start} unchanged lines ({start + 1}–{end}) ⋯</div>'
+
+    html = [DIFF_STYLE]
+    rows = 0
+    # Where the previous hunk ended in the old text (for collapse markers)
+    prev_end = hunks[page * HUNKS_PER_PAGE - 1][-1][2] if page and page_hunks else 0
+    for hunk in page_hunks:
+        if hunk[0][1] > prev_end:
+            html.append(skipped(prev_end, hunk[0][1]))
+            rows += 1
+        for tag, i1, i2, j1, j2 in hunk:
+            # Escape each line once, only for lines actually rendered
+            old_chunk = [escape(line) for line in a[i1:i2]]
+            new_chunk = [escape(line) for line in b[j1:j2]] if tag != 'equal' else old_chunk
+            if tag == 'equal':
+                for i, line in enumerate(old_chunk):
+                    html.append(row(i1+i+1, line, "", j1+i+1, line, ""))
+            elif tag == 'replace':
+                for i in range(max(len(old_chunk), len(new_chunk))):
+                    o_text = old_chunk[i] if i < len(old_chunk) else ""
+                    n_text = new_chunk[i] if i < len(new_chunk) else ""
+                    o_cls, n_cls = ("deleted" if o_text else "empty"), ("added" if n_text else "empty")
+                    html.append(row(i1+i+1 if o_text else "", o_text, o_cls, j1+i+1 if n_text else "", n_text, n_cls))
+            elif tag == 'delete':
+                for i, line in enumerate(old_chunk):
+                    html.append(row(i1+i+1, line, "deleted", "", "", "empty"))
+            elif tag == 'insert':
+                for i, line in enumerate(new_chunk):
+                    html.append(row("", "", "empty", j1+i+1, line, "added"))
+            rows += max(i2 - i1, j2 - j1)
+        prev_end = hunk[-1][2]
+    # Trailing unchanged lines after the final hunk
+    if page_hunks and page_hunks[-1] is hunks[-1] and prev_end < len(a):
+        html.append(skipped(prev_end, len(a)))
+        rows += 1
     html.append("</div>")
-    return "".join(html)
+    return "".join(html), rows
 
 # --- DEMO DATA INJECTOR ---
 def inject_demo_data(rule_id):
@@ -166,45 +263,63 @@ No member shall effect any transaction in, or induce the purchase or sale of, an
     added = """
 (c) New Requirement (Demo Update)
 This section simulates a new regulatory requirement added by the SEC to demonstrate the redline capabilities. Because this text is NOT in the baseline, it will appear GREEN."""
-    conn = sqlite3.connect('data/regulations.db')
-    c = conn.cursor()
-    c.execute('''CREATE TABLE IF NOT EXISTS rule_versions (id INTEGER PRIMARY KEY AUTOINCREMENT, rule_id TEXT, check_date TEXT, rule_text TEXT, change_summary TEXT)''')
-    c.execute("DELETE FROM rule_versions WHERE rule_id = ?", (rule_id,))
-    c.execute("INSERT INTO rule_versions (rule_id, check_date, rule_text, change_summary) VALUES (?, datetime('now', '-1 day'), ?, ?)", (rule_id, common, "Historical Baseline (Demo)"))
-    c.execute("INSERT INTO rule_versions (rule_id, check_date, rule_text, change_summary) VALUES (?, datetime('now'), ?, ?)", (rule_id, common + "\n" + added, "Live Audit (Demo)"))
-    conn.commit()
-    conn.close()
+    yesterday = (datetime.datetime.now() - datetime.timedelta(days=1)).isoformat()
+    with batch():
+        delete_rule_history(rule_id)
+        log_new_version(rule_id, common, "Historical Baseline (Demo)", check_date=yesterday)
+        log_new_version(rule_id, common + "\n" + added, "Live Audit (Demo)")
     return True
 
 # --- APP LOGIC ---
 st.sidebar.markdown("### ⚖️ Regulatory Harmony")
-rules = get_rules()
+init_storage()
+rules, rules_by_name = get_rules()
 if not rules: st.stop()
 
-selected_rule_name = st.sidebar.selectbox("Select Rulebook", list({r['name']: r for r in rules}.keys()))
-selected_rule = {r['name']: r for r in rules}[selected_rule_name]
+selected_rule_name = st.sidebar.selectbox("Select Rulebook", list(rules_by_name.keys()))
+selected_rule = rules_by_name[selected_rule_name]
 
 if st.sidebar.button("Run Live Audit", type="primary"):
     with st.spinner("Scanning FINRA..."):
-        latest = download_rule(selected_rule['url'])
-        if not latest or len(latest) < 50 or "Error" in latest:
+        try:
+            latest = download_rule(selected_rule['url'], conditional=has_baseline(selected_rule['id']))
+        except FetchError as e:
+            latest = e
+        if latest is NOT_MODIFIED:
+            record_check(selected_rule['id'], 'unchanged')
+            commit_fetch_validators(selected_rule['url'])
+            st.sidebar.success("Compliant")
+        elif isinstance(latest, FetchError):
+            record_check(selected_rule['id'], latest.outcome)
             st.error(f"Audit Failed: {latest}")
         else:
-            baseline = get_latest_version(selected_rule['id'])
-            if not baseline:
-                log_new_version(selected_rule['id'], latest, "Initial Baseline")
+            archived = True
+            # Same lookup as the tracker: formatting-only differences upgrade the stored hash
+            baseline = load_baseline(selected_rule, latest)
+            if baseline.status == BASELINE_MISSING:
+                archived = log_new_version(selected_rule['id'], latest, "Initial Baseline")
+                record_check(selected_rule['id'], 'unchanged')
                 st.sidebar.success("Baseline Established")
-            elif latest != baseline:
-                log_new_version(selected_rule['id'], latest, "Audit: Change Detected")
+            elif baseline.status == BASELINE_CHANGED:
+                archived = log_new_version(selected_rule['id'], latest, "Audit: Change Detected")
+                record_check(selected_rule['id'], 'changed')
                 st.sidebar.warning("Change Logged")
             else:
+                record_check(selected_rule['id'], 'unchanged')
                 st.sidebar.success("Compliant")
+            # Only once the page is archived may the next audit skip it as unchanged
+            if archived:
+                commit_fetch_validators(selected_rule['url'])
+            invalidate_caches()
             st.rerun()
 
 st.sidebar.markdown("---")
 st.sidebar.markdown("##### 🛠️ Demo Tools")
 if st.sidebar.button("⚠️ Load Test Data (Reset)"):
     inject_demo_data(selected_rule['id'])
+    # The archive no longer matches the cached page, so force a full fetch next audit
+    clear_fetch_validators(selected_rule['url'])
+    invalidate_caches()
     st.sidebar.success("System Reset: Demo Data Loaded.")
     st.rerun()
 
@@ -212,10 +327,11 @@ if st.sidebar.button("⚠️ Load Test Data (Reset)"):
 st.title(selected_rule_name)
 
 # DATA FETCH
-history_df = get_history(selected_rule['id'])
+history_df = get_history(selected_rule['id'], get_db_marker())
 
 # TABS (Updated with "About")
-tab_about, tab1, tab2, tab3 = st.tabs(["About", "Overview", "Redline Analysis", "Raw Text"])
+tab_about, tab_portfolio, tab1, tab2, tab3, tab_search, tab_ops = st.tabs(
+    ["About", "Portfolio", "Overview", "Redline Analysis", "Raw Text", "Search", "Operations"])
 
 # --- TAB 0: ABOUT ---
 with tab_about:
@@ -252,6 +368,36 @@ with tab_about:
         </div>
         """, unsafe_allow_html=True)
 
+# --- PORTFOLIO: every tracked rule from the summary tables ---
+with tab_portfolio:
+    status_by_rule = {row['rule_id']: row for row in load_portfolio(get_db_marker())}
+    portfolio_rows = []
+    for rule in rules:
+        row = status_by_rule.get(rule['id'], {})
+        portfolio_rows.append({
+            'Rule': rule['id'], 'Name': rule['name'], 'Status': portfolio_status(row),
+            'Versions': row.get('versions') or 0,
+            'Last Check': pd.to_datetime(row['last_check']) if row.get('last_check') else None,
+            'Last Change': pd.to_datetime(row['last_change']) if row.get('last_change') else None,
+            'Length': row.get('text_length'),
+            f'Changes ({CHURN_WINDOW_DAYS}d)': row.get('recent_changes') or 0,
+            f'Lines Changed ({CHURN_WINDOW_DAYS}d)': row.get('recent_lines_changed') or 0,
+            f'Entities ({CHURN_WINDOW_DAYS}d)': row.get('recent_entities') or 0,
+        })
+    portfolio_df = pd.DataFrame(portfolio_rows)
+    statuses = portfolio_df['Status'].value_counts()
+    m1, m2, m3, m4 = st.columns(4)
+    m1.metric("Tracked Rules", len(portfolio_df))
+    m2.metric(f"Changed ({CHURN_WINDOW_DAYS}d)", int(statuses.get("Changed", 0)))
+    m3.metric("Fetch Failing / Blocked", int(statuses.get("Fetch failing", 0) + statuses.get("Blocked", 0)))
+    m4.metric("No Baseline", int(statuses.get("No baseline", 0)))
+    churn_col = f'Lines Changed ({CHURN_WINDOW_DAYS}d)'
+    churned = portfolio_df[portfolio_df[churn_col] > 0].nlargest(15, churn_col)
+    if not churned.empty:
+        st.markdown(f"##### Most churn, last {CHURN_WINDOW_DAYS} days")
+        st.bar_chart(churned.set_index('Rule')[churn_col])
+    st.dataframe(portfolio_df, hide_index=True)
+
 # --- TAB 1: OVERVIEW ---
 with tab1:
     if history_df.empty:
@@ -269,8 +415,8 @@ with tab2:
         st.warning("⚠️ Insufficient data for comparison.")
     else:
         col_a, col_b = st.columns(2)
-        version_options = history_df.apply(lambda x: f"v.{x['id']} — {pd.to_datetime(x['check_date']).strftime('%b %d %H:%M')}", axis=1).tolist()
-        version_map = {f"v.{row['id']} — {pd.to_datetime(row['check_date']).strftime('%b %d %H:%M')}": row['id'] for _, row in history_df.iterrows()}
+        version_map = {f"v.{row.id} — {pd.to_datetime(row.check_date).strftime('%b %d %H:%M')}": row.id for row in history_df.itertuples()}
+        version_options = list(version_map)
         
         with col_a: ver_a_label = st.selectbox("Baseline Version", version_options, index=len(version_options)-1)
         with col_b: ver_b_label = st.selectbox("Comparison Version", version_options, index=0)
@@ -291,11 +437,34 @@ with tab2:
         if text_a == text_b:
             st.info("Versions are identical.")
         else:
-            diff_html = render_diff_html(text_a, text_b)
-            line_count = max(len(text_a.splitlines()), len(text_b.splitlines()))
-            dynamic_height = min(max(300, line_count * 25 + 50), 800)
+            # Cached per version pair (memory, then SQLite); computed only on first view
+            diff_info = get_version_diff(id_a, id_b)
+            st.caption(f"+{diff_info['lines_added']} lines added · −{diff_info['lines_removed']} lines removed")
+            diff = LineDiff(text_a.splitlines(), text_b.splitlines(), diff_info['opcodes'])
+
+            ctrl_a, ctrl_b = st.columns(2)
+            context_options = {"3 lines": 3, "5 lines": DIFF_CONTEXT_LINES, "10 lines": 10, "Full text": None}
+            with ctrl_a: context_label = st.selectbox("Context", list(context_options), index=1)
+            context = context_options[context_label]
+            page_count = diff_page_count(diff, context)
+            with ctrl_b: page = st.number_input(f"Page (of {page_count})", min_value=1, max_value=page_count, value=1) - 1
+
+            diff_html, row_count = render_diff_html(text_a, text_b, diff=diff, context=context, page=page)
+            dynamic_height = min(max(300, row_count * 25 + 50), 800)
             components.html(diff_html, height=dynamic_height, scrolling=True)
 
+            # Printable redline: rendered once per version pair, then served from the report cache
+            report = get_report(id_a, id_b)
+            report_path = report['path'] if report and report['status'] == 'ready' else None
+            if not (report_path and os.path.exists(report_path)):
+                report_path = None
+                if st.button("📄 Prepare HTML Report"):
+                    report_path = render_report(id_a, id_b, rule_name=selected_rule_name)
+            if report_path:
+                with open(report_path, 'rb') as f:
+                    st.download_button("⬇️ Download HTML Report", f.read(), file_name=os.path.basename(report_path),
+                                       mime='application/gzip' if report_path.endswith('.gz') else 'text/html')
+
 # --- TAB 3: RAW TEXT ---
 with tab3:
     if history_df.empty:
@@ -305,3 +474,65 @@ with tab3:
         try: selected_text_view = get_specific_version_text(version_map[ver_b_label])
         except: selected_text_view = get_specific_version_text(history_df.iloc[0]['id'])
         st.code(selected_text_view, language="text")
+
+# --- TAB 4: SEARCH ---
+with tab_search:
+    col_q, col_mode = st.columns([4, 1])
+    with col_q: query = st.text_input("Search all archived versions", placeholder="e.g. customer identification")
+    with col_mode: raw_query = st.checkbox("FTS syntax", help='AND / OR / NOT, "exact phrases", prefix*')
+    if query.strip():
+        try:
+            matches, appearances = run_search(query, raw_query, get_db_marker())
+        except sqlite3.OperationalError as e:
+            st.error(f"Invalid search query: {e}")
+            matches, appearances = [], []
+        if not matches:
+            st.info("No archived version matches.")
+        else:
+            rule_names = {rule['id']: rule['name'] for rule in rules}
+            st.markdown(f"##### Rules mentioning it ({len(appearances)})")
+            st.dataframe(pd.DataFrame([{
+                'Rule': a['rule_id'], 'Name': rule_names.get(a['rule_id'], ""),
+                'First Seen': pd.to_datetime(a['first_seen']).strftime('%Y-%m-%d'), 'First Version': a['first_version_id'],
+                'Latest Match': pd.to_datetime(a['latest_seen']).strftime('%Y-%m-%d'), 'Versions': a['matching_versions'],
+            } for a in appearances]), hide_index=True)
+            st.markdown(f"##### Matching versions (top {len(matches)})")
+            st.dataframe(pd.DataFrame([{
+                'Rule': m['rule_id'], 'Version': m['version_id'],
+                'Date': pd.to_datetime(m['check_date']).strftime('%Y-%m-%d %H:%M'), 'Snippet': m['snippet'],
+            } for m in matches]), hide_index=True)
+
+# --- TAB 5: OPERATIONS ---
+with tab_ops:
+    runs = get_run_summaries()
+    if not runs:
+        st.info("No tracker runs recorded yet. Run `python main.py` to collect timing metrics.")
+    else:
+        last_run = runs[-1]
+        col1, col2, col3 = st.columns(3)
+        col1.metric("Last Run Duration", f"{last_run['duration_s']:.1f}s")
+        col2.metric("Rules Checked", last_run['counters'].get('rules_checked', 0))
+        col3.metric("Rules Changed", last_run['counters'].get('rules_changed', 0))
+
+        st.markdown("##### Recent Run Durations (s)")
+        runs_df = pd.DataFrame([{'started_at': r['started_at'], 'duration_s': r['duration_s']} for r in runs])
+        st.bar_chart(runs_df.set_index('started_at')['duration_s'])
+
+        col_stages, col_rules = st.columns(2)
+        with col_stages:
+            st.markdown("##### Time by Stage (last run)")
+            stages_df = pd.DataFrame([{'stage': stage, 'seconds': s['seconds'], 'calls': s['calls']}
+                                      for stage, s in last_run['stages'].items()])
+            if not stages_df.empty:
+                st.dataframe(stages_df.sort_values('seconds', ascending=False), hide_index=True)
+        with col_rules:
+            st.markdown("##### Slowest Rules (last run)")
+            slow_df = pd.DataFrame([{'rule': r['rule_id'], 'seconds': r['seconds'], **r['stages']}
+                                    for r in last_run['slowest_rules']])
+            if not slow_df.empty:
+                st.dataframe(slow_df, hide_index=True)
+        with st.expander("Counters (last run)"):
+            st.json(last_run['counters'])
+
+# Release this rerun's connection (see Helper Functions)
+close_connection()
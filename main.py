@@ -1,11 +1,28 @@
 # main.py
 
+import argparse
 import json
-from src.downloader import download_rule
-from src.database_manager import get_latest_version, log_new_version
-from src.comparator import compare_text
-from src.analyzer import analyze_changes
-from src.reporter import generate_html_report  # <--- NEW IMPORT
+import sqlite3
+import time
+from src.downloader import (download_rule, download_rules, commit_fetch_validators, NOT_MODIFIED, FetchError,
+                            MAX_WORKERS, PER_HOST_LIMIT)
+from src.fetch_policy import FetchPolicy, fetch_outcome, HOST_RATE_PER_S
+from src.database_manager import (init_db, log_new_version, has_baseline, batch,
+                                  compact_database, KEYFRAME_INTERVAL, MAX_KEYFRAME_INTERVAL, sync_schedule,
+                                  get_due_rules, get_next_due_time, get_schedule, update_schedule, claim_rules,
+                                  complete_leases, release_leases, get_cycle_progress, record_check)
+from src.comparator import compare_text, load_baseline, BASELINE_MISSING, BASELINE_SAME, BASELINE_FORMATTING
+from src.diff_engine import count_changes
+from src.segmenter import diff_sections, change_summary
+from src.analyzer import analyze_changes_batch, get_cache_stats, BATCH_SIZE, N_PROCESS
+from src.reporter import render_pending_reports, start_report_worker
+from src.exporter import export_history, verify_export, CHUNK_VERSIONS
+from src.pipeline import run_pipeline, CPU_WORKERS
+from src import metrics
+from src.coordinator import (start_heartbeat, default_cycle, default_worker_id, LeaseLostError, CLAIM_BATCH_SIZE,
+                             LEASE_S, IDLE_POLL_S, MAX_ROUND_ERRORS)
+from src.scheduler import (plan_next_check, smooth_fetch_cost, sleep_time, RateLimiter, DEFAULT_INTERVAL_S,
+                           MAX_RULES_PER_TICK, MAX_REQUESTS_PER_MINUTE)
 
 def load_rules():
     try:
@@ -15,55 +32,449 @@ def load_rules():
         print("Error: data/tracked_rules.json not found.")
         return []
 
-def process_rule(rule):
+def fetch_rule(rule, rate_limiter=None, conditional=True, policy=None):
+    """Downloads one rule: its text, NOT_MODIFIED, or the FetchError that was raised."""
+    if rate_limiter is not None:
+        rate_limiter.acquire()
+    try:
+        with metrics.rule_scope(rule['id']):
+            return download_rule(rule['url'], conditional=conditional and has_baseline(rule['id']), policy=policy)
+    except FetchError as e:
+        return e
+
+def check_rule(rule, latest_text=None):
+    """
+    Checks a single rule against its stored baseline.
+
+    Nothing is written here: new baselines and detected changes are returned
+    instead, so check_rules can send every changed rule through NLP in one
+    batch and then record the whole run in one short transaction.
+
+    Args:
+        rule: Rule dict from tracked_rules.json.
+        latest_text: Pre-fetched download_rules result (concurrent mode):
+            text, NOT_MODIFIED or a FetchError. When omitted the rule is
+            downloaded here.
+
+    Returns:
+        A pending-change dict ('rule', 'old_text', 'new_text', 'changes', 'diff',
+        'sections', 'section_summary', 'as_stored'), a pending-baseline dict ('rule',
+        'new_text', 'baseline': True), or None when there is nothing to record.
+    """
     rule_id = rule['id']
     rule_name = rule['name']
-    rule_url = rule['url']
     
     print(f"\n--- Checking Rule: {rule_id} ({rule_name}) ---")
     
-    latest_text = download_rule(rule_url)
-    if not latest_text:
-        print(f"[{rule_id}] Skipping due to download failure.")
-        return
+    metrics.incr('rules_checked')
+    if latest_text is None:
+        latest_text = fetch_rule(rule)
+    if latest_text is NOT_MODIFIED:
+        print(f"[{rule_id}] Page unchanged since last fetch. No changes detected.")
+        return None
+    # Failed fetches are never stored as a version
+    if isinstance(latest_text, FetchError) or not latest_text:
+        print(f"[{rule_id}] Skipping due to download failure. {latest_text}")
+        metrics.incr('fetch_failures')
+        return None
 
-    last_version_text = get_latest_version(rule_id)
-    
-    if not last_version_text:
+    baseline = load_baseline(rule, latest_text)
+    if baseline.status == BASELINE_MISSING:
         print(f"[{rule_id}] No baseline found. Initializing...")
-        log_new_version(rule_id, latest_text, summary="Initial Baseline Version")
+        metrics.incr('baselines_created')
+        return {'rule': rule, 'new_text': latest_text, 'baseline': True}
+    elif baseline.status == BASELINE_SAME:
+        print(f"[{rule_id}] No changes detected.")
+    elif baseline.status == BASELINE_FORMATTING:
+        print(f"[{rule_id}] No changes detected (formatting only).")
     else:
         print(f"[{rule_id}] Baseline found. Comparing...")
-        changes = compare_text(last_version_text, latest_text)
+        last_version_text = baseline.text
+        # Diff once, section by section; the comparator and the report both reuse it
+        with metrics.span('diff', rule_id):
+            diff, sections, section_summary = diff_sections(last_version_text, latest_text, baseline.sections)
+            changes = compare_text(last_version_text, latest_text, diff=diff)
         
         if changes:
             print(f"[{rule_id}] ALERT: Changes detected!")
-            
-            # 1. NLP Analysis (Keep this for the database log)
-            analysis_results = analyze_changes(changes)
-            import json
-            analysis_json = json.dumps(analysis_results, indent=2)
-            
-            # 2. HTML Report Generation (NEW STEP)
-            report_path = generate_html_report(rule_id, rule_name, last_version_text, latest_text)
-            
-            # 3. Log to DB
-            log_new_version(rule_id, latest_text, summary=f"Changes detected. Report: {report_path}")
-            
-            print(f"[{rule_id}] HTML Redline Report generated at: {report_path}")
-            
+            lines_added, lines_removed = count_changes(diff.opcodes)
+            metrics.incr('rules_changed')
+            metrics.incr('lines_added', lines_added)
+            metrics.incr('lines_removed', lines_removed)
+            if section_summary:
+                print(f"[{rule_id}] Sections: {section_summary}")
+            return {'rule': rule, 'old_text': last_version_text, 'new_text': latest_text,
+                    'changes': changes, 'diff': diff, 'sections': sections, 'section_summary': section_summary,
+                    'as_stored': baseline.as_stored}
         else:
             print(f"[{rule_id}] No changes detected.")
+    return None
+
+def record_change(pending, analysis_results):
+    """
+    Logs the new version for a change found by check_rule. The redline report
+    is only queued for the (previous, new) version pair; it is rendered on
+    demand (dashboard, --render-reports) or by the background report worker.
+    """
+    rule_id = pending['rule']['id']
+    
+    # Log to DB (the analysis feeds version_stats) and queue the report for this version pair.
+    # A diff against a re-canonicalized baseline is not cached: log_new_version rediffs the archived text.
+    with metrics.span('db_write', rule_id):
+        log_new_version(rule_id, pending['new_text'], summary=change_summary(pending.get('section_summary')),
+                        diff=pending['diff'] if pending['as_stored'] else None, queue_report=True, analysis=analysis_results,
+                        sections=pending.get('sections'))
+    
+    print(f"[{rule_id}] Redline report queued.")
+
+def check_rules(rules, concurrent=True, max_workers=MAX_WORKERS, per_host_limit=PER_HOST_LIMIT,
+                nlp_batch_size=BATCH_SIZE, nlp_processes=N_PROCESS, rate_limiter=None, policy=None,
+                before_commit=None):
+    """
+    Checks, analyzes and records a list of rules. The caller owns the
+    metrics run.
+
+    Fetching, diffing and NER run first, without holding the database write
+    lock. Every version, check result and page validator is then written in
+    one short batch() transaction, so a failed write rolls back the whole run.
 
-def run_tracker():
+    Args:
+        policy: The run's FetchPolicy (default: a new one, so circuit
+            breakers reset every call).
+        before_commit: Called with the outcome dict inside that transaction,
+            for writes that must commit or roll back with the run (schedules,
+            leases). Raising from it discards the run.
+
+    Returns:
+        A dict mapping each rule_id to 'changed', 'unchanged', 'blocked' or 'failed'.
+    """
+    policy = policy or FetchPolicy()
+    # Rules without a baseline need their full text even if the page is cached
+    full_fetch_ids = {rule['id'] for rule in rules if not has_baseline(rule['id'])}
+    if concurrent:
+        # Fetch every page up front over pooled sessions, then compare in order
+        downloads = download_rules(rules, max_workers=max_workers, per_host_limit=per_host_limit,
+                                   full_fetch_ids=full_fetch_ids, rate_limiter=rate_limiter, policy=policy)
+        pending = [check_rule(rule, latest_text=downloads.get(rule['id'], "")) for rule in rules]
+    else:
+        downloads = {}
+        pending = []
+        for rule in rules:
+            downloads[rule['id']] = fetch_rule(rule, rate_limiter, conditional=rule['id'] not in full_fetch_ids,
+                                               policy=policy)
+            pending.append(check_rule(rule, latest_text=downloads[rule['id']]))
+    pending = [p for p in pending if p]
+    changes = [p for p in pending if not p.get('baseline')]
+
+    # One NLP pass over every changed rule in the run
+    analyses = {}
+    if changes:
+        analyses = analyze_changes_batch({p['rule']['id']: p['changes'] for p in changes},
+                                         batch_size=nlp_batch_size, n_process=nlp_processes)
+        stats = get_cache_stats()
+        print(f"NER cache: {stats['hits']} hits, {stats['misses']} misses ({stats['hit_rate']:.0%} hit rate).")
+
+    changed = {p['rule']['id'] for p in changes}
+    outcomes = {}
+    for rule in rules:
+        if rule['id'] in changed:
+            outcomes[rule['id']] = 'changed'
+        else:
+            outcomes[rule['id']] = fetch_outcome(downloads.get(rule['id'], "")) or 'unchanged'
+
+    # The write lock is only held from here to the commit
+    with batch():
+        for p in pending:
+            if p.get('baseline'):
+                with metrics.span('db_write', p['rule']['id']):
+                    log_new_version(p['rule']['id'], p['new_text'], summary="Initial Baseline Version")
+            else:
+                record_change(p, analyses[p['rule']['id']])
+        for rule in rules:
+            record_check(rule['id'], outcomes[rule['id']])
+            # Validators are only kept if this run's versions are
+            if outcomes[rule['id']] in ('changed', 'unchanged'):
+                commit_fetch_validators(rule['url'])
+        if before_commit is not None:
+            before_commit(outcomes)
+    return outcomes
+
+def run_tracker(concurrent=True, max_workers=MAX_WORKERS, per_host_limit=PER_HOST_LIMIT,
+                nlp_batch_size=BATCH_SIZE, nlp_processes=N_PROCESS, pipeline=False, cpu_workers=CPU_WORKERS,
+                compress_reports=False, host_rate=HOST_RATE_PER_S):
     print("=== Starting SEC/FINRA Rule Tracker Portfolio Check ===")
     rules = load_rules()
     print(f"Loaded {len(rules)} rules to track.")
+    # One policy per run: a host that keeps failing fails fast for the rest of it
+    policy = FetchPolicy(host_rate=host_rate)
     
-    for rule in rules:
-        process_rule(rule)
+    metrics.start_run()
+    try:
+        if pipeline:
+            # Fetch, analyze and write stages overlap; the writer commits in batches
+            run_pipeline(rules, max_workers=max_workers, per_host_limit=per_host_limit, cpu_workers=cpu_workers,
+                         nlp_batch_size=nlp_batch_size, compress_reports=compress_reports, policy=policy)
+        else:
+            # All new versions from this run are committed in a single transaction
+            check_rules(rules, concurrent=concurrent, max_workers=max_workers, per_host_limit=per_host_limit,
+                        nlp_batch_size=nlp_batch_size, nlp_processes=nlp_processes, policy=policy)
+    except BaseException:
+        metrics.finish_run(status='error')
+        raise
+    summary = metrics.finish_run()
+    print(f"Run {summary['run_id']} took {summary['duration_s']:.1f}s. Metrics: {metrics.RUNS_LOG}, {metrics.PROM_FILE}")
+    for slow in summary['slowest_rules'][:3]:
+        print(f"  Slowest: {slow['rule_id']} {slow['seconds']:.2f}s {slow['stages']}")
         
     print("\n=== Portfolio Check Complete ===")
 
+def run_scheduled_checks(rules, rate_limiter, max_workers=MAX_WORKERS, per_host_limit=PER_HOST_LIMIT,
+                         nlp_batch_size=BATCH_SIZE, nlp_processes=N_PROCESS, policy=None):
+    """
+    Checks the rules that are due and reschedules each one.
+
+    Versions and schedule updates are committed in one transaction, so after
+    a crash a rule is either fully checked and rescheduled or still due.
+
+    Returns:
+        The outcome dict from check_rules.
+    """
+    def reschedule(outcomes):
+        timings = metrics.rule_timings()
+        now = time.time()
+        for rule_id, outcome in outcomes.items():
+            state = get_schedule(rule_id)
+            avg_fetch_s = smooth_fetch_cost(state['avg_fetch_s'], timings.get(rule_id, {}).get('fetch'))
+            interval_s, next_check = plan_next_check(state['interval_s'], outcome, avg_fetch_s, now)
+            update_schedule(rule_id, interval_s, next_check, now, outcome, avg_fetch_s)
+
+    metrics.start_run()
+    try:
+        outcomes = check_rules(rules, max_workers=max_workers, per_host_limit=per_host_limit,
+                               nlp_batch_size=nlp_batch_size, nlp_processes=nlp_processes,
+                               rate_limiter=rate_limiter, policy=policy, before_commit=reschedule)
+    except BaseException:
+        metrics.finish_run(status='error')
+        raise
+    metrics.finish_run()
+    return outcomes
+
+def run_daemon(max_rules_per_tick=MAX_RULES_PER_TICK, requests_per_minute=MAX_REQUESTS_PER_MINUTE,
+               max_workers=MAX_WORKERS, per_host_limit=PER_HOST_LIMIT, nlp_batch_size=BATCH_SIZE,
+               nlp_processes=N_PROCESS, max_ticks=None, compress_reports=False, host_rate=HOST_RATE_PER_S):
+    """
+    Long-running mode: repeatedly checks whichever rules are due according to
+    their adaptive schedule (see src/scheduler.py), sleeping in between.
+
+    tracked_rules.json is re-read every tick, so rules can be added or removed
+    without a restart. Next-check times live in SQLite, so a restarted daemon
+    picks up where it stopped.
+
+    Args:
+        max_ticks: Stop after this many loop iterations (None runs until Ctrl+C).
+        compress_reports: gzip the reports rendered by the background worker.
+    """
+    print("=== Starting SEC/FINRA Rule Tracker Daemon (Ctrl+C to stop) ===")
+    rate_limiter = RateLimiter(requests_per_minute)
+    # Shared by every tick, so an open circuit is only retried after its cooldown
+    policy = FetchPolicy(host_rate=host_rate)
+    # Queued redline reports are rendered off the checking path
+    stop_reports = start_report_worker(compress=compress_reports)
+    ticks = 0
+    try:
+        while max_ticks is None or ticks < max_ticks:
+            ticks += 1
+            rules_by_id = {rule['id']: rule for rule in load_rules()}
+            sync_schedule(rules_by_id, DEFAULT_INTERVAL_S, time.time())
+            due = [rules_by_id[rule_id] for rule_id in get_due_rules(time.time(), max_rules_per_tick)]
+            if due:
+                print(f"\n[daemon] {len(due)} rule(s) due.")
+                outcomes = run_scheduled_checks(due, rate_limiter, max_workers=max_workers,
+                                                per_host_limit=per_host_limit, nlp_batch_size=nlp_batch_size,
+                                                nlp_processes=nlp_processes, policy=policy)
+                counts = {name: list(outcomes.values()).count(name)
+                          for name in ('changed', 'unchanged', 'blocked', 'failed')}
+                print(f"[daemon] Checked {len(outcomes)}: {counts['changed']} changed, "
+                      f"{counts['unchanged']} unchanged, {counts['blocked']} blocked, {counts['failed']} failed.")
+                continue
+            wait = sleep_time(get_next_due_time(), time.time())
+            if max_ticks is None or ticks < max_ticks:
+                time.sleep(wait)
+    except KeyboardInterrupt:
+        print("\n[daemon] Stopped. Schedule is saved; the next start resumes from it.")
+    finally:
+        stop_reports.set()
+
+def run_worker(cycle=None, worker_id=None, claim_batch_size=CLAIM_BATCH_SIZE, lease_s=LEASE_S,
+               max_workers=MAX_WORKERS, per_host_limit=PER_HOST_LIMIT, nlp_batch_size=BATCH_SIZE,
+               nlp_processes=N_PROCESS, wait=True, host_rate=HOST_RATE_PER_S):
+    """
+    Sharded mode: one of several tracker processes on this host that share
+    the database and split a sweep cycle between them. The database is in
+    WAL mode, so workers on other hosts are not supported.
+
+    Rules are claimed in small rounds from the rule_leases table and kept
+    alive by a heartbeat thread. Each round's versions and its 'done' markers
+    are committed together, and only while this worker still holds the
+    leases, so every rule is recorded by exactly one worker per cycle. A
+    round whose writes fail is rolled back and released for another try.
+    Rules a crashed worker had claimed are picked up once their lease expires.
+
+    Args:
+        cycle: Sweep label (default: the current UTC day, see coordinator.default_cycle).
+        worker_id: Lease owner name (default: hostname-pid).
+        wait: When the only unfinished rules are leased by other workers, wait
+            for them to finish or expire instead of exiting.
+
+    Returns:
+        The number of rules this worker completed.
+    """
+    cycle = cycle or default_cycle()
+    worker_id = worker_id or default_worker_id()
+    print(f"=== Starting SEC/FINRA Rule Tracker Worker {worker_id} (cycle {cycle}) ===")
+    stop_heartbeat = start_heartbeat(cycle, worker_id, lease_s)
+    policy = FetchPolicy(host_rate=host_rate)
+    completed = 0
+    round_errors = 0
+    try:
+        while True:
+            rules_by_id = {rule['id']: rule for rule in load_rules()}
+            claimed = claim_rules(list(rules_by_id), cycle, worker_id, claim_batch_size, lease_s, time.time())
+            if not claimed:
+                progress = get_cycle_progress(cycle, time.time())
+                if progress['leased'] == 0 or not wait:
+                    break
+                print(f"[worker] Nothing to claim; {progress['leased']} rule(s) leased by other workers.")
+                time.sleep(IDLE_POLL_S)
+                continue
+
+            rules = [rules_by_id[rule_id] for rule_id in claimed]
+            reclaimed = sum(1 for attempt in claimed.values() if attempt > 1)
+            print(f"\n[worker] Claimed {len(rules)} rule(s) ({reclaimed} reclaimed).")
+
+            def complete(outcomes):
+                # Marked done in the round's own transaction, after its versions
+                lost = complete_leases(claimed, cycle, worker_id, time.time())
+                if lost:
+                    raise LeaseLostError(f"Lease lost for {len(lost)} rule(s): {', '.join(lost)}")
+
+            metrics.start_run()
+            try:
+                check_rules(rules, max_workers=max_workers, per_host_limit=per_host_limit,
+                            nlp_batch_size=nlp_batch_size, nlp_processes=nlp_processes, policy=policy,
+                            before_commit=complete)
+            except (LeaseLostError, sqlite3.Error) as e:
+                # The round was rolled back; its rules are claimed again (here or by another worker)
+                print(f"[worker] {e}. Round discarded.")
+                release_leases(cycle, worker_id)
+                metrics.finish_run(status='error')
+                round_errors += 1
+                if round_errors >= MAX_ROUND_ERRORS:
+                    print(f"[worker] {round_errors} rounds in a row failed; giving up.")
+                    break
+                continue
+            except BaseException:
+                metrics.finish_run(status='error')
+                raise
+            metrics.finish_run()
+            round_errors = 0
+            completed += len(claimed)
+    except KeyboardInterrupt:
+        print("\n[worker] Stopped.")
+    finally:
+        stop_heartbeat.set()
+        # Unfinished claims go back to the pool right away instead of waiting to expire
+        release_leases(cycle, worker_id)
+
+    progress = get_cycle_progress(cycle, time.time())
+    print(f"[worker] {worker_id} completed {completed} rule(s). Cycle {cycle}: {progress['done']} done, "
+          f"{progress['leased']} leased elsewhere.")
+    return completed
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="SEC/FINRA rule tracker")
+    parser.add_argument('--db', default=None,
+                        help="SQLite database file to use (default data/regulations.db).")
+    parser.add_argument('--sequential', action='store_true',
+                        help="Fetch rules one at a time instead of concurrently.")
+    parser.add_argument('--workers', type=int, default=MAX_WORKERS,
+                        help=f"Total concurrent fetch workers (default {MAX_WORKERS}).")
+    parser.add_argument('--per-host', type=int, default=PER_HOST_LIMIT,
+                        help=f"Max simultaneous requests per host (default {PER_HOST_LIMIT}).")
+    parser.add_argument('--host-rate', type=float, default=HOST_RATE_PER_S,
+                        help=f"Sustained requests per second to any one host, 0 for no limit (default {HOST_RATE_PER_S}).")
+    parser.add_argument('--nlp-batch-size', type=int, default=BATCH_SIZE,
+                        help=f"Documents per spaCy nlp.pipe batch (default {BATCH_SIZE}).")
+    parser.add_argument('--nlp-processes', type=int, default=N_PROCESS,
+                        help=f"spaCy worker processes for NER (default {N_PROCESS}).")
+    parser.add_argument('--pipeline', action='store_true',
+                        help="Overlap fetching, analysis and writes; diff, NER and reports run in worker processes.")
+    parser.add_argument('--cpu-workers', type=int, default=CPU_WORKERS,
+                        help=f"Worker processes for --pipeline (default: all {CPU_WORKERS} cores).")
+    parser.add_argument('--daemon', action='store_true',
+                        help="Run continuously, checking each rule on its own adaptive schedule.")
+    parser.add_argument('--requests-per-minute', type=int, default=MAX_REQUESTS_PER_MINUTE,
+                        help=f"Daemon-wide request budget across all hosts (default {MAX_REQUESTS_PER_MINUTE}).")
+    parser.add_argument('--rules-per-tick', type=int, default=MAX_RULES_PER_TICK,
+                        help=f"Max rules the daemon checks per tick (default {MAX_RULES_PER_TICK}).")
+    parser.add_argument('--worker', action='store_true',
+                        help="Sharded mode: claim rules from the shared lease table alongside other workers "
+                             "on this host.")
+    parser.add_argument('--cycle', default=None,
+                        help="Sweep label for --worker; each rule is checked once per cycle (default: UTC date).")
+    parser.add_argument('--worker-id', default=None,
+                        help="Lease owner name for --worker (default: hostname-pid).")
+    parser.add_argument('--claim-batch', type=int, default=CLAIM_BATCH_SIZE,
+                        help=f"Rules a worker claims per round (default {CLAIM_BATCH_SIZE}).")
+    parser.add_argument('--lease-seconds', type=int, default=LEASE_S,
+                        help=f"Lease duration before an unrenewed claim can be taken over (default {LEASE_S}).")
+    parser.add_argument('--render-reports', action='store_true',
+                        help="Render every queued redline report and exit.")
+    parser.add_argument('--compress-reports', action='store_true',
+                        help="Write rendered reports as .html.gz.")
+    parser.add_argument('--compact-db', action='store_true',
+                        help="Convert the archive to compressed keyframe + delta storage and exit.")
+    parser.add_argument('--keyframe-interval', type=int, default=KEYFRAME_INTERVAL,
+                        help=f"Versions per keyframe when compacting, kept for later writes "
+                             f"(default {KEYFRAME_INTERVAL}, at most {MAX_KEYFRAME_INTERVAL}).")
+    parser.add_argument('--export', nargs='?', const='', default=None, metavar='DIR',
+                        help="Stream the version history to DIR (default exports/<timestamp>) and exit.")
+    parser.add_argument('--export-format', choices=['jsonl', 'parquet'], default='jsonl',
+                        help="gzip JSONL (default) or Parquet (needs pyarrow).")
+    parser.add_argument('--export-diffs', action='store_true',
+                        help="Include the diff against each version's predecessor.")
+    parser.add_argument('--incremental', action='store_true',
+                        help="Only export versions added since the last export.")
+    parser.add_argument('--export-chunk', type=int, default=CHUNK_VERSIONS,
+                        help=f"Versions per export file (default {CHUNK_VERSIONS}).")
+    parser.add_argument('--verify-export', metavar='DIR', default=None,
+                        help="Check an export's files against its manifest hashes and exit.")
+    return parser.parse_args()
+
 if __name__ == "__main__":
-    run_tracker()
\ No newline at end of file
+    args = parse_args()
+    init_db(args.db)
+    if args.compact_db:
+        compact_database(keyframe_interval=args.keyframe_interval)
+    elif args.export is not None:
+        export_history(out_dir=args.export or None, fmt=args.export_format, include_diffs=args.export_diffs,
+                       incremental=args.incremental, chunk_size=args.export_chunk)
+    elif args.verify_export:
+        bad = verify_export(args.verify_export)
+        print(f"Export damaged: {', '.join(bad)}" if bad else "Export verified: every file matches its manifest.")
+    elif args.render_reports:
+        print(f"Rendered {render_pending_reports(compress=args.compress_reports)} queued report(s).")
+    elif args.worker:
+        run_worker(cycle=args.cycle, worker_id=args.worker_id, claim_batch_size=args.claim_batch,
+                   lease_s=args.lease_seconds, max_workers=args.workers, per_host_limit=args.per_host,
+                   nlp_batch_size=args.nlp_batch_size, nlp_processes=args.nlp_processes, host_rate=args.host_rate)
+    elif args.daemon:
+        run_daemon(max_rules_per_tick=args.rules_per_tick, requests_per_minute=args.requests_per_minute,
+                   max_workers=args.workers, per_host_limit=args.per_host,
+                   nlp_batch_size=args.nlp_batch_size, nlp_processes=args.nlp_processes,
+                   compress_reports=args.compress_reports, host_rate=args.host_rate)
+    else:
+        run_tracker(concurrent=not args.sequential, max_workers=args.workers, per_host_limit=args.per_host,
+                    nlp_batch_size=args.nlp_batch_size, nlp_processes=args.nlp_processes,
+                    pipeline=args.pipeline, cpu_workers=args.cpu_workers, compress_reports=args.compress_reports,
+                    host_rate=args.host_rate)
@@ -1,14 +1,63 @@
 # src/analyzer.py
 
-import spacy
+import hashlib
+import threading
+from importlib import metadata
 from typing import List, Dict
+from src.database_manager import get_cached_entities, store_cached_entities, touch_cached_entities
+from src import metrics
 
-# Load the small English model (must be done only once)
-try:
-    nlp = spacy.load("en_core_web_sm")
-except OSError:
-    print("Error: spaCy model 'en_core_web_sm' not found. Did you run 'python3 -m spacy download en_core_web_sm'?")
-    # Exit or handle error
+MODEL_NAME = "en_core_web_sm"
+
+# Only NER output is used, so skip the tagger/parser/lemmatizer entirely
+NON_NER_PIPES = ["tagger", "parser", "attribute_ruler", "lemmatizer", "senter"]
+
+# nlp.pipe settings for batch analysis (documents are individual changed lines)
+BATCH_SIZE = 256
+N_PROCESS = 1
+
+# Long change sets are split into chunks of at most this many characters
+# (well below spaCy's default max_length of 1,000,000)
+MAX_CHUNK_CHARS = 100_000
+
+ENTITY_LABELS = ['DATE', 'MONEY', 'ORG', 'GPE', 'LAW']
+
+# Hit/miss counters for the persistent per-line entity cache (see get_cache_stats)
+cache_stats = {'hits': 0, 'misses': 0}
+
+# The model is loaded on first use (see get_nlp): runs where no changed line
+# misses the entity cache never import spaCy at all
+nlp = None
+_nlp_lock = threading.Lock()
+
+def load_ner_model(name: str = MODEL_NAME):
+    """Load the spaCy model with only the components named-entity recognition needs."""
+    import spacy
+    model = spacy.load(name, exclude=NON_NER_PIPES)
+    # Drop the shared tok2vec too unless NER actually listens to it
+    if "tok2vec" in model.pipe_names and "ner" not in getattr(model.get_pipe("tok2vec"), "listening_components", []):
+        model.remove_pipe("tok2vec")
+    return model
+
+def get_nlp():
+    """
+    The shared NER pipeline, loaded once on first call.
+
+    Raises:
+        OSError: The spaCy model is not installed.
+    """
+    global nlp
+    if nlp is None:
+        with _nlp_lock:
+            if nlp is None:
+                try:
+                    with metrics.span('ner_model_load'):
+                        nlp = load_ner_model()
+                except OSError:
+                    print("Error: spaCy model 'en_core_web_sm' not found. "
+                          "Did you run 'python3 -m spacy download en_core_web_sm'?")
+                    raise
+    return nlp
 
 def analyze_changes(changed_lines: List[str]) -> Dict[str, any]:
     """
@@ -21,31 +70,143 @@ def analyze_changes(changed_lines: List[str]) -> Dict[str, any]:
     Returns:
         A dictionary containing the summary and extracted entities.
     """
+    return analyze_changes_batch({None: changed_lines})[None]
+
+def analyze_changes_batch(change_sets: Dict[str, List[str]], batch_size: int = BATCH_SIZE,
+                          n_process: int = N_PROCESS, cache_writes: Dict = None) -> Dict[str, Dict[str, any]]:
+    """
+    Analyzes the change sets of many rules in one streamed nlp.pipe pass.
+
+    Entities are memoized per normalized line (keyed by the line and the model
+    name/version), so only lines never seen before go through spaCy; cached
+    results are merged in for the rest.
+
+    Args:
+        change_sets: Mapping of rule_id to its compare_text output.
+        batch_size: Texts per nlp.pipe batch.
+        n_process: Worker processes for nlp.pipe.
+        cache_writes: When given, the cache is only read: hits ('touched')
+            and new entries ('fresh') are collected in this dict for
+            save_cache_writes to apply from a process that may write.
+
+    Returns:
+        A mapping of rule_id to the same structure analyze_changes returns.
+    """
     print("\nStarting NLP analysis of rule changes...")
-    
-    analysis = {
-        'summary': "Rule change detected. NLP analysis completed.",
-        'added_entities': {},
-        'removed_entities': {},
-        'raw_changes': changed_lines
-    }
-    
-    # Concatenate all new (+) and removed (-) lines separately for spaCy processing
-    added_text = " ".join([line[2:] for line in changed_lines if line.startswith('+')])
-    removed_text = " ".join([line[2:] for line in changed_lines if line.startswith('-')])
-
-    # Process ADDED text
-    if added_text:
-        doc_added = nlp(added_text)
-        analysis['added_entities'] = extract_entities(doc_added)
-        
-    # Process REMOVED text
-    if removed_text:
-        doc_removed = nlp(removed_text)
-        analysis['removed_entities'] = extract_entities(doc_removed)
-        
-    print("NLP analysis finished.")
-    return analysis
+
+    fingerprint = model_fingerprint()
+    results = {}
+    wanted = {}        # (rule_id, side) -> line hashes
+    line_by_hash = {}  # line hash -> normalized line
+    for rule_id, changed_lines in change_sets.items():
+        results[rule_id] = {
+            'summary': "Rule change detected. NLP analysis completed.",
+            'added_entities': {},
+            'removed_entities': {},
+            'raw_changes': changed_lines
+        }
+        # Collect all new (+) and removed (-) lines separately for spaCy processing
+        added_lines = [line[2:] for line in changed_lines if line.startswith('+')]
+        removed_lines = [line[2:] for line in changed_lines if line.startswith('-')]
+        for side, lines in (('added_entities', added_lines), ('removed_entities', removed_lines)):
+            hashes = []
+            for line in lines:
+                normalized = " ".join(line.split())
+                if normalized:
+                    line_hash = hash_line(normalized, fingerprint)
+                    line_by_hash[line_hash] = normalized
+                    hashes.append(line_hash)
+            wanted[(rule_id, side)] = hashes
+
+    with metrics.span('ner_cache'):
+        known = get_cached_entities(line_by_hash.keys(), touch=cache_writes is None)
+    unseen = [h for h in line_by_hash if h not in known]
+    cache_stats['hits'] += len(line_by_hash) - len(unseen)
+    cache_stats['misses'] += len(unseen)
+    metrics.incr('ner_cache_hits', len(line_by_hash) - len(unseen))
+    metrics.incr('ner_cache_misses', len(unseen))
+
+    jobs = [(chunk, line_hash) for line_hash in unseen for chunk in chunk_lines([line_by_hash[line_hash]])]
+    fresh = {}
+    if jobs:
+        model = get_nlp()
+        with metrics.span('ner'):
+            for doc, line_hash in model.pipe(jobs, as_tuples=True, batch_size=batch_size, n_process=n_process):
+                fresh.setdefault(line_hash, []).append(extract_entities(doc))
+    fresh = {line_hash: merge_entities(found) for line_hash, found in fresh.items()}
+    if cache_writes is None:
+        with metrics.span('ner_cache'):
+            store_cached_entities(fresh)
+    else:
+        cache_writes.setdefault('touched', []).extend(known)
+        cache_writes.setdefault('fresh', {}).update(fresh)
+    known.update(fresh)
+
+    for (rule_id, side), hashes in wanted.items():
+        if hashes:
+            results[rule_id][side] = merge_entities([known[h] for h in hashes])
+            metrics.incr('entities_found', sum(len(found) for found in results[rule_id][side].values()))
+
+    print(f"NLP analysis finished ({len(change_sets)} rule(s), {len(unseen)} new line(s), "
+          f"{len(line_by_hash) - len(unseen)} cached).")
+    return results
+
+def save_cache_writes(cache_writes: Dict):
+    """Apply the entity-cache updates collected by analyze_changes_batch(cache_writes=...)."""
+    with metrics.span('ner_cache'):
+        touch_cached_entities(cache_writes.get('touched', []))
+        store_cached_entities(cache_writes.get('fresh', {}))
+
+def model_fingerprint() -> str:
+    """
+    Identify the model so cached entities are invalidated by model upgrades.
+
+    Read from the installed package's metadata when possible, so cache lookups
+    do not have to load the model.
+    """
+    if nlp is None:
+        try:
+            return f"{MODEL_NAME}@{metadata.version(MODEL_NAME)}"
+        except metadata.PackageNotFoundError:
+            pass   # Model loaded from a path rather than an installed package
+    meta = get_nlp().meta
+    return f"{meta.get('lang')}_{meta.get('name')}@{meta.get('version')}"
+
+def hash_line(line: str, fingerprint: str) -> bytes:
+    """Cache key for one normalized changed line under a given model."""
+    return hashlib.sha256(f"{fingerprint}\n{line}".encode('utf-8')).digest()
+
+def get_cache_stats() -> Dict[str, float]:
+    """Hit/miss counts (unique lines) for the entity cache since process start."""
+    total = cache_stats['hits'] + cache_stats['misses']
+    return {**cache_stats, 'hit_rate': cache_stats['hits'] / total if total else 0.0}
+
+def chunk_lines(lines: List[str], max_chars: int = MAX_CHUNK_CHARS) -> List[str]:
+    """Join lines with spaces into texts of at most max_chars, splitting on line boundaries."""
+    chunks = []
+    current = []
+    size = 0
+    for line in lines:
+        if current and size + len(line) + 1 > max_chars:
+            chunks.append(" ".join(current))
+            current, size = [], 0
+        # A single oversized line is hard-split
+        while len(line) > max_chars:
+            chunks.append(line[:max_chars])
+            line = line[max_chars:]
+        current.append(line)
+        size += len(line) + 1
+    if current and " ".join(current).strip():
+        chunks.append(" ".join(current))
+    return chunks
+
+def merge_entities(results: List[Dict[str, List[str]]]) -> Dict[str, List[str]]:
+    """Union several extract_entities results, keeping each list sorted and de-duplicated."""
+    merged = {key: set() for key in ENTITY_LABELS}
+    for entities in results:
+        for key in ENTITY_LABELS:
+            merged[key].update(entities.get(key, []))
+    return {key: sorted(values) for key, values in merged.items()}
 
 def extract_entities(doc) -> Dict[str, List[str]]:
     """Helper function to extract named entities of interest."""
@@ -67,4 +228,4 @@ def extract_entities(doc) -> Dict[str, List[str]]:
         
     return entities
 
-# End of analyzer.py
\ No newline at end of file
+# End of analyzer.py
@@ -1,9 +1,70 @@
 # src/comparator.py
 
-import difflib
-from typing import List
+from typing import List, NamedTuple, Optional
+from src import metrics
+from src.database_manager import get_latest_sections, get_latest_version, hash_text, latest_hash, set_latest_hash
+from src.diff_engine import LineDiff, compute_diff
+from src.extractor import profile_for_url
+from src.normalizer import canonicalize
 
-def compare_text(old_text: str, new_text: str) -> List[str]:
+# How freshly fetched text relates to the rule's archive (Baseline.status)
+BASELINE_MISSING = 'missing'          # Nothing archived yet: the text becomes the baseline
+BASELINE_SAME = 'same'                # Same hash as the latest version
+BASELINE_FORMATTING = 'formatting'    # Same once the archived text is canonicalized
+BASELINE_CHANGED = 'changed'          # Needs a diff
+
+class Baseline(NamedTuple):
+    """The archived text a fetched rule is compared against (see load_baseline)."""
+    status: str
+    text: Optional[str] = None        # Canonicalized latest version, when status is BASELINE_CHANGED
+    sections: Optional[list] = None   # Its stored sections, when they describe that text
+    # False when canonicalizing changed the archived text: a diff against `text`
+    # then does not index the archived version's lines and must not be stored for it
+    as_stored: bool = True
+
+def load_baseline(rule: dict, latest_text: str, upgrade_hash: bool = True) -> Baseline:
+    """
+    Decides whether a fetched rule text needs diffing. Shared by
+    main.check_rule and the pipeline's compare stage.
+
+    One indexed hash lookup settles unchanged rules without loading the
+    archived text. Otherwise the latest version is loaded and canonicalized,
+    because baselines archived before canonicalization may differ only in
+    formatting; those get their stored hash upgraded so the next check is a
+    single lookup again.
+
+    Args:
+        rule: Rule dict from tracked_rules.json.
+        latest_text: The canonicalized text just fetched.
+        upgrade_hash: Store the canonical hash for a formatting-only match.
+            Pass False where writes are not allowed; the caller then calls
+            set_latest_hash itself.
+
+    Returns:
+        A Baseline.
+    """
+    rule_id = rule['id']
+    with metrics.span('db_read', rule_id):
+        stored_hash = latest_hash(rule_id)
+    if stored_hash is None:
+        return Baseline(BASELINE_MISSING)
+    if stored_hash == hash_text(latest_text):
+        return Baseline(BASELINE_SAME)
+
+    with metrics.span('db_read', rule_id):
+        stored_text = get_latest_version(rule_id)
+        last_version_text = canonicalize(stored_text, profile_for_url(rule['url']))
+        # Stored section hashes only describe the text as archived
+        old_sections = get_latest_sections(rule_id) if last_version_text == stored_text else None
+    if last_version_text == latest_text:
+        if not upgrade_hash:
+            return Baseline(BASELINE_FORMATTING)
+        with metrics.span('db_write', rule_id):
+            set_latest_hash(rule_id, hash_text(latest_text))
+        return Baseline(BASELINE_FORMATTING)
+    return Baseline(BASELINE_CHANGED, last_version_text, old_sections, last_version_text == stored_text)
+
+def compare_text(old_text: str, new_text: str, diff: Optional[LineDiff] = None) -> List[str]:
     """
     Compares two strings of text line-by-line and returns a list of lines
     that represent additions or deletions (the changes).
@@ -11,6 +72,7 @@ def compare_text(old_text: str, new_text: str) -> List[str]:
     Args:
         old_text: The baseline text fetched from the database.
         new_text: The newly downloaded text from the website.
+        diff: A LineDiff already computed for this pair (reused, not recomputed).
 
     Returns:
         A list of strings, where each string is a line showing a difference,
@@ -18,19 +80,18 @@ def compare_text(old_text: str, new_text: str) -> List[str]:
     """
     print("Starting comparison of old and new rule versions...")
     
-    # 1. Split text into lists of lines
-    old_lines = old_text.splitlines()
-    new_lines = new_text.splitlines()
-
-    # 2. Use difflib SequenceMatcher to find differences
-    differ = difflib.SequenceMatcher(None, old_lines, new_lines)
+    # 1. Split text into lines and diff them (shared diff engine)
+    if diff is None:
+        diff = compute_diff(old_text, new_text)
+    old_lines = diff.old_lines
+    new_lines = diff.new_lines
     
     changed_lines = []
     
-    # 3. Iterate through the comparisons and capture changes
-    #    The 'opcodes' method yields differences as tuples: (tag, i1, i2, j1, j2)
+    # 2. Iterate through the comparisons and capture changes
+    #    Opcodes are tuples: (tag, i1, i2, j1, j2)
     #    Tags are 'replace', 'delete', 'insert', 'equal'
-    for tag, i1, i2, j1, j2 in differ.get_opcodes():
+    for tag, i1, i2, j1, j2 in diff.opcodes:
         if tag == 'equal':
             continue
         
@@ -56,4 +117,4 @@ def compare_text(old_text: str, new_text: str) -> List[str]:
     print(f"Comparison finished. Found {len(changed_lines)} lines of changes.")
     return changed_lines
 
-# End of comparator.py
\ No newline at end of file
+# End of comparator.py
@@ -0,0 +1,56 @@
+# src/coordinator.py
+
+import os
+import socket
+import threading
+import time
+from datetime import datetime, timezone
+from src.database_manager import renew_leases, close_connection
+
+# A claimed rule stays with its worker this long unless the lease is renewed.
+# Leases of a crashed worker become claimable once they expire.
+LEASE_S = 300
+
+# How often a live worker renews its leases (well inside LEASE_S)
+HEARTBEAT_S = 60
+
+# Rules claimed per round; small rounds keep each write transaction short
+CLAIM_BATCH_SIZE = 25
+
+# How long a worker with nothing to claim waits for other workers' leases
+# to finish or expire before looking again
+IDLE_POLL_S = 15
+
+# Rounds in a row a worker may lose to failed writes (e.g. the database stays locked)
+# before a worker gives up instead of reclaiming the same rules forever
+MAX_ROUND_ERRORS = 3
+
+class LeaseLostError(Exception):
+    """Another worker took over a rule before this worker finished it (the lease expired)."""
+
+def default_worker_id():
+    """Unique per process and host, e.g. 'tracker-01-4312'."""
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+def default_cycle(now=None):
+    """Sweep label for the current UTC day: every rule is checked once per day by default."""
+    return datetime.fromtimestamp(now or time.time(), timezone.utc).strftime('%Y-%m-%d')
+
+def start_heartbeat(cycle, worker_id, lease_s=LEASE_S, interval=HEARTBEAT_S):
+    """
+    Renew this worker's leases on a background thread until the returned
+    threading.Event is set. Short leases are renewed at least three times
+    per lease, whatever the interval.
+    """
+    stop = threading.Event()
+    interval = min(interval, lease_s / 3)
+
+    def beat():
+        while not stop.wait(interval):
+            renew_leases(cycle, worker_id, lease_s, time.time())
+        close_connection()
+
+    threading.Thread(target=beat, name="lease-heartbeat", daemon=True).start()
+    return stop
+
+# End of coordinator.py
@@ -2,23 +2,163 @@
 
 import sqlite3
 import datetime
+import hashlib
+import json
+import os
+import re
+import threading
+import zlib
+from contextlib import contextmanager
+from functools import lru_cache
+from urllib.request import pathname2url
+from src.diff_engine import compute_diff, count_changes, diff_lines
+from src.segmenter import Section, section_diff, segment
 
-# Define the path to the database file in the 'data' directory
+# Define the path to the database file in the 'data' directory (relative to the
+# working directory unless init_db is given another path)
 DB_PATH = 'data/regulations.db'
 
+# Set by init_db(read_only=True) in processes that must leave every write to
+# another process (e.g. the pipeline's CPU workers)
+READ_ONLY = False
+
+# Bumped whenever setup_database gains a migration step (stored in PRAGMA user_version)
+SCHEMA_VERSION = 4
+
+# Delta storage: a compressed full keyframe every KEYFRAME_INTERVAL versions of a
+# rule, line-level deltas against the previous version in between.
+KEYFRAME_INTERVAL = 10
+# _materialize rebuilds a delta chain recursively, one frame per version, so
+# longer chains would run into Python's recursion limit
+MAX_KEYFRAME_INTERVAL = 200
+VERSION_CACHE_SIZE = 128   # Materialized version texts kept in memory
+DIFF_CACHE_SIZE = 256      # Version-pair diffs kept in memory (all are also persisted)
+
+# Upper bound on memoized NER results; least recently used lines are evicted first
+NER_CACHE_MAX_ENTRIES = 200_000
+
+# How long a writer waits on a locked database before giving up (milliseconds)
+BUSY_TIMEOUT_MS = 5000
+
+# Portfolio overview: window (days) for the recent-churn column
+CHURN_WINDOW_DAYS = 30
+
+# Rows fetched per step when streaming the archive (see iter_versions)
+STREAM_FETCH_SIZE = 256
+
+# Full-text search: max versions returned per query, and snippet length in characters
+SEARCH_LIMIT = 50
+SNIPPET_CHARS = 200
+
+# One persistent connection per thread, plus the batch nesting depth for that thread
+_local = threading.local()
+
 def create_connection():
-    """Create a database connection."""
+    """
+    Create a new database connection configured for concurrent use:
+    WAL journal (readers never block the writer), NORMAL fsync level
+    (safe under WAL) and a busy timeout instead of instant 'database is locked'.
+
+    WAL relies on shared memory, so every process using the database must run
+    on the same host; this includes --worker processes. In READ_ONLY mode the
+    file is opened read-only and keeps whatever journal mode it already has.
+    """
     conn = None
     try:
-        conn = sqlite3.connect(DB_PATH)
+        if READ_ONLY:
+            conn = sqlite3.connect(f"file:{pathname2url(os.path.abspath(DB_PATH))}?mode=ro", uri=True,
+                                   timeout=BUSY_TIMEOUT_MS / 1000)
+        else:
+            conn = sqlite3.connect(DB_PATH, timeout=BUSY_TIMEOUT_MS / 1000)
+            conn.execute("PRAGMA journal_mode=WAL;")
+        conn.execute("PRAGMA synchronous=NORMAL;")
+        conn.execute(f"PRAGMA busy_timeout={BUSY_TIMEOUT_MS};")
         return conn
     except sqlite3.Error as e:
         print(f"Error connecting to database: {e}")
     return conn
 
+def get_connection():
+    """Return this thread's persistent connection, opening it on first use."""
+    conn = getattr(_local, 'conn', None)
+    if conn is None or getattr(_local, 'path', None) != DB_PATH:
+        conn = create_connection()
+        _local.conn = conn
+        _local.path = DB_PATH
+        _local.depth = 0
+    return conn
+
+def close_connection():
+    """Close this thread's persistent connection (it is reopened on next use)."""
+    conn = getattr(_local, 'conn', None)
+    if conn is not None:
+        conn.close()
+        _local.conn = None
+
+def _commit(conn):
+    """Commit unless we're inside a batch(), in which case the batch commits."""
+    if getattr(_local, 'depth', 0) == 0:
+        conn.commit()
+
+@contextmanager
+def batch():
+    """
+    Group writes into a single transaction.
+
+    Every log_new_version/save_* call made on this thread inside the block is
+    committed once at the end (or rolled back together on any error,
+    including KeyboardInterrupt). Batches nest.
+    """
+    conn = get_connection()
+    _local.depth = getattr(_local, 'depth', 0) + 1
+    committed = False
+    try:
+        yield conn
+        if _local.depth == 1:
+            conn.commit()
+        committed = True
+    finally:
+        # Runs on KeyboardInterrupt too, so the thread never stays stuck inside a batch
+        _local.depth -= 1
+        if _local.depth == 0 and not committed:
+            conn.rollback()
+
+# Database paths whose schema has been set up by this process (see init_db)
+_initialized = set()
+_init_lock = threading.Lock()
+
+def init_db(path: str = None, read_only: bool = False):
+    """
+    Point storage at a database file and make sure its schema is current.
+
+    Importing this module no longer touches the disk; entry points call
+    init_db once before using storage. Repeat calls for the same path are
+    no-ops, so it is safe to call from library code too.
+
+    Args:
+        path: Database file to use (default: the current DB_PATH).
+        read_only: Open every connection of this process read-only and skip
+            schema setup (the database must already exist).
+
+    Returns:
+        The database path in use.
+    """
+    global DB_PATH, READ_ONLY
+    with _init_lock:
+        if path:
+            DB_PATH = path
+        READ_ONLY = read_only
+        if DB_PATH not in _initialized and not read_only:
+            directory = os.path.dirname(DB_PATH)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            setup_database()
+            _initialized.add(DB_PATH)
+    return DB_PATH
+
 def setup_database():
     """Create the table needed to store regulatory rule versions."""
-    conn = create_connection()
+    conn = get_connection()
     if conn:
         try:
             # UPDATED: Added 'rule_id' column to track different rules separately
@@ -31,47 +171,1237 @@ def setup_database():
                     check_date TEXT NOT NULL
                 );
             """)
+            # HTTP validators for conditional GETs (one row per rule URL)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS fetch_cache (
+                    url TEXT PRIMARY KEY,
+                    etag TEXT,
+                    last_modified TEXT,
+                    body_hash TEXT,
+                    fetched_at TEXT NOT NULL
+                );
+            """)
+            # Small key/value store for database-wide settings (e.g. storage mode)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS db_meta (
+                    key TEXT PRIMARY KEY,
+                    value TEXT
+                );
+            """)
+            # Memoized spaCy entities per normalized changed line (see analyzer)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS ner_cache (
+                    line_hash BLOB PRIMARY KEY,
+                    entities TEXT NOT NULL,
+                    last_used REAL NOT NULL
+                );
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_ner_cache_last_used ON ner_cache (last_used);")
+            # Line diffs between archived version pairs (opcodes as JSON)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS diff_cache (
+                    version_a INTEGER NOT NULL,
+                    version_b INTEGER NOT NULL,
+                    opcodes TEXT NOT NULL,
+                    lines_added INTEGER NOT NULL,
+                    lines_removed INTEGER NOT NULL,
+                    created_at TEXT NOT NULL,
+                    PRIMARY KEY (version_a, version_b)
+                );
+            """)
+            # Adaptive polling state per rule (see scheduler); times are Unix seconds
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS rule_schedule (
+                    rule_id TEXT PRIMARY KEY,
+                    interval_s REAL NOT NULL,
+                    next_check REAL NOT NULL,
+                    last_check REAL,
+                    last_change REAL,
+                    checks INTEGER NOT NULL DEFAULT 0,
+                    changes INTEGER NOT NULL DEFAULT 0,
+                    failures INTEGER NOT NULL DEFAULT 0,
+                    avg_fetch_s REAL
+                );
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_rule_schedule_next_check ON rule_schedule (next_check);")
+            # Redline reports per version pair: queued by the tracker, rendered on demand or by the worker
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS reports (
+                    version_a INTEGER NOT NULL,
+                    version_b INTEGER NOT NULL,
+                    rule_id TEXT NOT NULL,
+                    status TEXT NOT NULL DEFAULT 'pending',
+                    path TEXT,
+                    bytes INTEGER,
+                    created_at TEXT NOT NULL,
+                    rendered_at TEXT,
+                    PRIMARY KEY (version_a, version_b)
+                );
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_reports_status ON reports (status);")
+            # Sharded workers: who holds each rule in a sweep cycle, until when, and whether it is done
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS rule_leases (
+                    rule_id TEXT NOT NULL,
+                    cycle TEXT NOT NULL,
+                    worker_id TEXT NOT NULL,
+                    status TEXT NOT NULL DEFAULT 'leased',
+                    lease_expires REAL NOT NULL,
+                    claimed_at REAL NOT NULL,
+                    finished_at REAL,
+                    attempts INTEGER NOT NULL DEFAULT 1,
+                    PRIMARY KEY (rule_id, cycle)
+                );
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_rule_leases_worker ON rule_leases (worker_id, status);")
+            # Per-version numbers kept beside rule_versions so charts never read rule_text
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS version_stats (
+                    version_id INTEGER PRIMARY KEY,
+                    rule_id TEXT NOT NULL,
+                    check_date TEXT NOT NULL,
+                    text_length INTEGER NOT NULL,
+                    line_count INTEGER NOT NULL,
+                    lines_added INTEGER NOT NULL DEFAULT 0,
+                    lines_removed INTEGER NOT NULL DEFAULT 0,
+                    entities_added INTEGER,
+                    entities_removed INTEGER
+                );
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_version_stats_rule ON version_stats (rule_id, check_date);")
+            # One row per rule: latest version, totals and the outcome of the last check
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS rule_status (
+                    rule_id TEXT PRIMARY KEY,
+                    versions INTEGER NOT NULL DEFAULT 0,
+                    latest_version_id INTEGER,
+                    first_seen TEXT,
+                    last_change TEXT,
+                    last_check TEXT,
+                    last_outcome TEXT,
+                    text_length INTEGER,
+                    lines_added_total INTEGER NOT NULL DEFAULT 0,
+                    lines_removed_total INTEGER NOT NULL DEFAULT 0
+                );
+            """)
+            # Section tree of each version (see segmenter.segment): changed sections are
+            # found by comparing hashes, without loading or re-splitting the old text
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS version_sections (
+                    version_id INTEGER NOT NULL,
+                    position INTEGER NOT NULL,
+                    section_key TEXT NOT NULL,
+                    parent_key TEXT NOT NULL,
+                    line_start INTEGER NOT NULL,
+                    line_end INTEGER NOT NULL,
+                    section_hash BLOB NOT NULL,
+                    PRIMARY KEY (version_id, position)
+                ) WITHOUT ROWID;
+            """)
+            migrate_database(conn)
             conn.commit()
-            conn.close()
         except sqlite3.Error as e:
+            # Leave no half-applied migration holding the write lock
+            conn.rollback()
             print(f"Error setting up database table: {e}")
 
+def migrate_database(conn):
+    """Bring an existing database up to SCHEMA_VERSION."""
+    version = conn.execute("PRAGMA user_version;").fetchone()[0]
+
+    if version < 1:
+        # v1: normalized-text hash per version + (rule_id, id) index for latest lookups
+        columns = [row[1] for row in conn.execute("PRAGMA table_info(rule_versions);")]
+        if 'text_hash' not in columns:
+            conn.execute("ALTER TABLE rule_versions ADD COLUMN text_hash BLOB")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_rule_versions_rule_id ON rule_versions (rule_id, id);")
+        rows = conn.execute("SELECT id, rule_text FROM rule_versions WHERE text_hash IS NULL;").fetchall()
+        conn.executemany("UPDATE rule_versions SET text_hash = ? WHERE id = ?",
+                         [(hash_text(text), row_id) for row_id, text in rows])
+        if rows:
+            print(f"Backfilled text hashes for {len(rows)} archived versions.")
+
+    if version < 2:
+        # v2: keyframe/delta storage. 'full' rows keep using rule_text; 'keyframe'
+        # and 'delta' rows hold a zlib payload and leave rule_text empty.
+        columns = [row[1] for row in conn.execute("PRAGMA table_info(rule_versions);")]
+        for name, ddl in (('storage', "TEXT NOT NULL DEFAULT 'full'"), ('payload', 'BLOB'),
+                          ('base_id', 'INTEGER'), ('chain_pos', 'INTEGER NOT NULL DEFAULT 0'),
+                          ('text_length', 'INTEGER')):
+            if name not in columns:
+                conn.execute(f"ALTER TABLE rule_versions ADD COLUMN {name} {ddl}")
+        conn.execute("UPDATE rule_versions SET text_length = length(rule_text) WHERE text_length IS NULL;")
+
+    if version < 3:
+        # v3: full-text index over every version (rowid = rule_versions.id). Contentless,
+        # so the archive's delta compression is not undone by a second copy of the text.
+        try:
+            conn.execute(
+                "CREATE VIRTUAL TABLE IF NOT EXISTS rule_versions_fts USING fts5("
+                "rule_text, content='', tokenize='porter unicode61 remove_diacritics 2');"
+            )
+            rows = conn.execute("SELECT id FROM rule_versions ORDER BY id;").fetchall()
+            conn.executemany("INSERT INTO rule_versions_fts (rowid, rule_text) VALUES (?, ?)",
+                             ((row_id, get_version_text(row_id)) for (row_id,) in rows))
+            if rows:
+                print(f"Indexed {len(rows)} archived versions for full-text search.")
+        except sqlite3.OperationalError as e:
+            print(f"Full-text search unavailable (SQLite built without FTS5?): {e}")
+
+    if version < 4:
+        # v4: version_stats / rule_status summaries, rebuilt from the archive once
+        previous = {}
+        rows = conn.execute(
+            "SELECT id, rule_id, check_date FROM rule_versions "
+            "WHERE id NOT IN (SELECT version_id FROM version_stats) ORDER BY rule_id, id;"
+        ).fetchall()
+        for version_id, rule_id, check_date in rows:
+            text = get_version_text(version_id)
+            added = removed = 0
+            if rule_id in previous:
+                cached = conn.execute(
+                    "SELECT lines_added, lines_removed FROM diff_cache WHERE version_a = ? AND version_b = ?",
+                    (previous[rule_id], version_id)
+                ).fetchone()
+                added, removed = cached or count_changes(
+                    compute_diff(get_version_text(previous[rule_id]), text).opcodes)
+            _insert_version_stats(conn, version_id, rule_id, check_date, text, added, removed)
+            previous[rule_id] = version_id
+        conn.execute("""
+            INSERT OR REPLACE INTO rule_status (rule_id, versions, latest_version_id, first_seen, last_change,
+                                                last_check, text_length, lines_added_total, lines_removed_total)
+            SELECT g.rule_id, g.versions, g.latest_id, g.first_seen, g.last_change, g.last_change,
+                   latest.text_length, g.added, g.removed
+            FROM (SELECT rule_id, COUNT(*) AS versions, MAX(version_id) AS latest_id, MIN(check_date) AS first_seen,
+                         MAX(check_date) AS last_change, SUM(lines_added) AS added, SUM(lines_removed) AS removed
+                  FROM version_stats GROUP BY rule_id) g
+            JOIN version_stats latest ON latest.version_id = g.latest_id;
+        """)
+        if rows:
+            print(f"Summarized {len(rows)} archived versions for the portfolio overview.")
+
+    conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION};")
+
+def _insert_version_stats(conn, version_id, rule_id, check_date, text, lines_added, lines_removed,
+                          analysis=None):
+    entities_added = entities_removed = None
+    if analysis:
+        entities_added = sum(len(found) for found in analysis.get('added_entities', {}).values())
+        entities_removed = sum(len(found) for found in analysis.get('removed_entities', {}).values())
+    conn.execute(
+        "INSERT OR REPLACE INTO version_stats (version_id, rule_id, check_date, text_length, line_count, "
+        "lines_added, lines_removed, entities_added, entities_removed) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+        (version_id, rule_id, check_date, len(text), len(text.splitlines()), lines_added, lines_removed,
+         entities_added, entities_removed)
+    )
+
+def _insert_sections(conn, version_id, sections):
+    conn.executemany(
+        "INSERT OR REPLACE INTO version_sections (version_id, position, section_key, parent_key, line_start, "
+        "line_end, section_hash) VALUES (?, ?, ?, ?, ?, ?, ?)",
+        [(version_id, position, *section) for position, section in enumerate(sections)]
+    )
+
+def get_version_sections(version_id: int):
+    """
+    The stored sections of a version, in order.
+
+    Returns:
+        A list of segmenter.Section, or None for versions archived before
+        sections were stored (callers re-segment the text).
+    """
+    conn = get_connection()
+    if conn:
+        try:
+            rows = conn.execute(
+                "SELECT section_key, parent_key, line_start, line_end, section_hash FROM version_sections "
+                "WHERE version_id = ? ORDER BY position;", (int(version_id),)
+            ).fetchall()
+            return [Section(*row) for row in rows] or None
+        except sqlite3.Error as e:
+            print(f"Error retrieving version sections: {e}")
+    return None
+
+def get_latest_sections(rule_id: str):
+    """Sections of a rule's latest version (see get_version_sections)."""
+    conn = get_connection()
+    if conn:
+        try:
+            row = conn.execute(
+                "SELECT id FROM rule_versions WHERE rule_id = ? ORDER BY id DESC LIMIT 1;", (rule_id,)
+            ).fetchone()
+            if row:
+                return get_version_sections(row[0])
+        except sqlite3.Error as e:
+            print(f"Error retrieving latest sections: {e}")
+    return None
+
+def _has_fts(conn) -> bool:
+    """Whether the full-text index exists (it is skipped when SQLite lacks FTS5)."""
+    return conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'rule_versions_fts';"
+    ).fetchone() is not None
+
+def normalize_text(text: str) -> str:
+    """Normalize line endings and trailing whitespace so cosmetic noise doesn't change the hash."""
+    lines = [line.rstrip() for line in text.replace('\r\n', '\n').replace('\r', '\n').split('\n')]
+    return '\n'.join(lines).strip('\n')
+
+def hash_text(text: str) -> bytes:
+    """32-byte SHA-256 digest of the normalized rule text."""
+    return hashlib.sha256(normalize_text(text).encode('utf-8')).digest()
+
+def latest_hash(rule_id: str):
+    """
+    Return the text hash of the latest saved version for a rule, or None if the
+    rule has no versions yet. Uses the (rule_id, id) index and never reads rule_text
+    unless the row predates the hash column.
+    """
+    conn = get_connection()
+    digest = None
+    if conn:
+        try:
+            row = conn.execute(
+                "SELECT id, text_hash FROM rule_versions WHERE rule_id = ? ORDER BY id DESC LIMIT 1;", (rule_id,)
+            ).fetchone()
+            if row:
+                digest = row[1]
+                if digest is None:
+                    # Row written by an older client: hash it once and store it
+                    digest = hash_text(get_version_text(row[0]))
+                    conn.execute("UPDATE rule_versions SET text_hash = ? WHERE id = ?", (digest, row[0]))
+                    _commit(conn)
+        except sqlite3.Error as e:
+            print(f"Error retrieving latest hash: {e}")
+    return digest
+
+def set_latest_hash(rule_id: str, digest: bytes):
+    """
+    Replace the text hash of a rule's latest version.
+
+    Used when a baseline archived before canonicalization turns out to differ
+    from the fetched page only in formatting: storing the canonical hash lets
+    later checks settle "unchanged" with latest_hash alone again.
+    """
+    conn = get_connection()
+    if conn:
+        try:
+            conn.execute(
+                "UPDATE rule_versions SET text_hash = ? "
+                "WHERE id = (SELECT MAX(id) FROM rule_versions WHERE rule_id = ?)", (digest, rule_id)
+            )
+            _commit(conn)
+        except sqlite3.Error as e:
+            print(f"Error updating latest hash: {e}")
+
 def get_latest_version(rule_id: str):
     """Retrieve the text of the latest saved version for a SPECIFIC rule."""
-    conn = create_connection()
+    conn = get_connection()
     latest_text = ""
     if conn:
         try:
             cursor = conn.cursor()
             # UPDATED: Filter by rule_id
-            cursor.execute("SELECT rule_text FROM rule_versions WHERE rule_id = ? ORDER BY id DESC LIMIT 1;", (rule_id,))
+            cursor.execute("SELECT id FROM rule_versions WHERE rule_id = ? ORDER BY id DESC LIMIT 1;", (rule_id,))
             result = cursor.fetchone()
             if result:
-                latest_text = result[0]
-            conn.close()
+                latest_text = get_version_text(result[0])
         except sqlite3.Error as e:
             print(f"Error retrieving latest version: {e}")
     return latest_text
 
-def log_new_version(rule_id: str, new_text: str, summary: str = "Initial or Minor Change"):
-    """Insert a new rule version into the database for a specific rule."""
+def get_version_text(version_id: int):
+    """
+    Retrieve the text of one archived version by its row id, rebuilding it from
+    its keyframe and deltas if needed. Recently materialized versions are served
+    from an in-memory LRU cache (versions are immutable once written).
+    """
+    try:
+        return _materialize(DB_PATH, int(version_id))
+    except sqlite3.Error as e:
+        print(f"Error retrieving version {version_id}: {e}")
+    return ""
+
+@lru_cache(maxsize=VERSION_CACHE_SIZE)
+def _materialize(db_path, version_id):
+    # db_path is part of the cache key only; reads go through this thread's connection
+    conn = get_connection()
+    row = conn.execute(
+        "SELECT storage, rule_text, payload, base_id FROM rule_versions WHERE id = ?;", (version_id,)
+    ).fetchone()
+    if not row:
+        return ""
+    storage, rule_text, payload, base_id = row
+    if storage == 'keyframe':
+        return zlib.decompress(payload).decode('utf-8')
+    if storage == 'delta':
+        return apply_delta(_materialize(db_path, base_id), payload)
+    return rule_text
+
+def make_delta(old_text: str, new_text: str) -> bytes:
+    """
+    Encode new_text as line-level edits against old_text.
+
+    The delta is a zlib-compressed JSON list where [i1, i2] copies old lines
+    i1:i2 and a list of strings inserts those lines verbatim.
+    """
+    old_lines = old_text.split('\n')
+    new_lines = new_text.split('\n')
+    ops = []
+    for tag, i1, i2, j1, j2 in diff_lines(old_lines, new_lines):
+        if tag == 'equal':
+            ops.append([i1, i2])
+        elif j2 > j1:
+            ops.append(new_lines[j1:j2])
+    return zlib.compress(json.dumps(ops, separators=(',', ':')).encode('utf-8'))
+
+def apply_delta(old_text: str, delta: bytes) -> str:
+    """Rebuild a version from its predecessor's text and a make_delta payload."""
+    old_lines = old_text.split('\n')
+    new_lines = []
+    for op in json.loads(zlib.decompress(delta).decode('utf-8')):
+        if op and isinstance(op[0], int):
+            new_lines.extend(old_lines[op[0]:op[1]])
+        else:
+            new_lines.extend(op)
+    return '\n'.join(new_lines)
+
+def get_storage_mode(conn=None):
+    """Return 'full' (plain rule_text rows) or 'delta' (keyframe + delta rows)."""
+    conn = conn or get_connection()
+    row = conn.execute("SELECT value FROM db_meta WHERE key = 'storage_mode';").fetchone()
+    return row[0] if row else 'full'
+
+def get_keyframe_interval(conn=None):
+    """Return the keyframe interval chosen at compaction time (KEYFRAME_INTERVAL if none was stored)."""
+    conn = conn or get_connection()
+    row = conn.execute("SELECT value FROM db_meta WHERE key = 'keyframe_interval';").fetchone()
+    return min(max(int(row[0]), 1), MAX_KEYFRAME_INTERVAL) if row else KEYFRAME_INTERVAL
+
+def _encode_version(conn, rule_id, new_text, before_id=None, keyframe_interval=None):
+    """
+    Work out how to store new_text as the next version of rule_id in delta mode.
+    Without an explicit keyframe_interval, the one stored by compact_database is used.
+
+    Returns:
+        (storage, payload, base_id, chain_pos)
+    """
+    query = "SELECT id, chain_pos FROM rule_versions WHERE rule_id = ?"
+    params = [rule_id]
+    if before_id is not None:
+        query += " AND id < ?"
+        params.append(before_id)
+    previous = conn.execute(query + " ORDER BY id DESC LIMIT 1;", params).fetchone()
+    if previous is None or previous[1] + 1 >= (keyframe_interval or get_keyframe_interval(conn)):
+        return 'keyframe', zlib.compress(new_text.encode('utf-8'), 9), None, 0
+    base_id, chain_pos = previous
+    return 'delta', make_delta(get_version_text(base_id), new_text), base_id, chain_pos + 1
+
+def get_version_history(rule_id: str):
+    """
+    List the archived versions of a rule, newest first, without their text.
+
+    Reads version_stats only: rule_versions rows carry the full text ahead of
+    every other column, so even selecting their dates pages the text in.
+
+    Returns:
+        A list of dicts with 'id', 'check_date', 'text_length', 'line_count',
+        'lines_added' and 'lines_removed'.
+    """
+    conn = get_connection()
+    history = []
+    if conn:
+        try:
+            cursor = conn.execute(
+                "SELECT version_id, check_date, text_length, line_count, lines_added, lines_removed "
+                "FROM version_stats WHERE rule_id = ? ORDER BY check_date DESC;",
+                (rule_id,)
+            )
+            history = [
+                {'id': row[0], 'check_date': row[1], 'text_length': row[2], 'line_count': row[3],
+                 'lines_added': row[4], 'lines_removed': row[5]}
+                for row in cursor
+            ]
+        except sqlite3.Error as e:
+            print(f"Error retrieving version history: {e}")
+    return history
+
+def search_versions(query: str, limit: int = SEARCH_LIMIT, raw: bool = False):
+    """
+    Full-text search across every archived version.
+
+    Args:
+        query: Words to find. Treated as one phrase unless raw is True, in
+            which case it is passed through as FTS5 syntax (AND/OR/NOT, "phrases",
+            prefix*, NEAR(...)).
+        limit: Maximum number of versions returned.
+        raw: Use the query as-is instead of quoting it as a phrase.
+
+    Returns:
+        A list of dicts with 'rule_id', 'version_id', 'check_date' and
+        'snippet', best matches first.
+
+    Raises:
+        sqlite3.OperationalError: The raw query is not valid FTS5 syntax.
+    """
+    conn = get_connection()
+    if not conn or not _has_fts(conn) or not query.strip():
+        return []
+    rows = conn.execute(
+        "SELECT v.rule_id, v.id, v.check_date FROM rule_versions_fts f JOIN rule_versions v ON v.id = f.rowid "
+        "WHERE rule_versions_fts MATCH ? ORDER BY f.rank, v.id DESC LIMIT ?;",
+        (query if raw else _fts_phrase(query), limit)
+    ).fetchall()
+    return [{'rule_id': rule_id, 'version_id': version_id, 'check_date': check_date,
+             'snippet': make_snippet(get_version_text(version_id), query)}
+            for rule_id, version_id, check_date in rows]
+
+def first_appearances(query: str, raw: bool = False):
+    """
+    For each rule whose archive matches the query, the earliest and latest
+    matching versions ("when was this wording added, and is it still there?").
+
+    Returns:
+        A list of dicts with 'rule_id', 'first_version_id', 'first_seen',
+        'latest_version_id', 'latest_seen' and 'matching_versions', ordered by first_seen.
+    """
+    conn = get_connection()
+    if not conn or not _has_fts(conn) or not query.strip():
+        return []
+    rows = conn.execute(
+        "SELECT v.rule_id, MIN(v.id), MIN(v.check_date), MAX(v.id), MAX(v.check_date), COUNT(*) "
+        "FROM rule_versions_fts f JOIN rule_versions v ON v.id = f.rowid "
+        "WHERE rule_versions_fts MATCH ? GROUP BY v.rule_id ORDER BY MIN(v.check_date);",
+        (query if raw else _fts_phrase(query),)
+    ).fetchall()
+    return [{'rule_id': row[0], 'first_version_id': row[1], 'first_seen': row[2], 'latest_version_id': row[3],
+             'latest_seen': row[4], 'matching_versions': row[5]} for row in rows]
+
+def _fts_phrase(text: str) -> str:
+    """Quote user input as a single FTS5 phrase so punctuation can't break the query."""
+    return '"' + text.strip().replace('"', '""') + '"'
+
+def make_snippet(text: str, query: str, width: int = SNIPPET_CHARS) -> str:
+    """
+    A window of text around the first occurrence of a query word. (The FTS
+    index is contentless, so snippets are cut from the materialized version.)
+    """
+    words = [w for w in re.findall(r"\w+", query) if w.upper() not in ('AND', 'OR', 'NOT', 'NEAR')]
+    lowered = text.lower()
+    hit = -1
+    for word in words:
+        # Porter stemming matches "identify" to "identification", so fall back to the stem-ish prefix
+        for probe in (word.lower(), word.lower()[:max(4, len(word) - 3)]):
+            hit = lowered.find(probe)
+            if hit >= 0:
+                break
+        if hit >= 0:
+            break
+    start = max(0, hit - width // 2) if hit >= 0 else 0
+    snippet = " ".join(text[start:start + width].split())
+    return ("…" if start else "") + snippet + ("…" if start + width < len(text) else "")
+
+def record_check(rule_id: str, outcome: str, checked_at: str = None):
+    """
+    Note the result of checking a rule in rule_status (versions logged by
+    log_new_version update the rest of the row).
+
+    Args:
+        outcome: 'changed', 'unchanged', 'blocked' or 'failed'.
+        checked_at: ISO timestamp; defaults to now.
+    """
+    conn = get_connection()
+    if conn:
+        try:
+            checked_at = checked_at or datetime.datetime.now().isoformat()
+            conn.execute(
+                "INSERT INTO rule_status (rule_id, last_check, last_outcome) VALUES (?, ?, ?) "
+                "ON CONFLICT (rule_id) DO UPDATE SET last_check = excluded.last_check, "
+                "last_outcome = excluded.last_outcome",
+                (rule_id, checked_at, outcome)
+            )
+            _commit(conn)
+        except sqlite3.Error as e:
+            print(f"Error recording check: {e}")
+
+def get_portfolio(churn_window_days: int = CHURN_WINDOW_DAYS):
+    """
+    Status and recent churn of every rule with archived versions or checks,
+    in one query over the summary tables (rule_text is never read).
+
+    Returns:
+        A list of dicts: the rule_status columns plus 'recent_changes',
+        'recent_lines_changed' and 'recent_entities' over the churn window.
+    """
+    conn = get_connection()
+    portfolio = []
+    if conn:
+        try:
+            since = (datetime.datetime.now() - datetime.timedelta(days=churn_window_days)).isoformat()
+            cursor = conn.execute(
+                "SELECT s.*, COALESCE(SUM(v.lines_added + v.lines_removed > 0), 0) AS recent_changes, "
+                "COALESCE(SUM(v.lines_added + v.lines_removed), 0) AS recent_lines_changed, "
+                "COALESCE(SUM(v.entities_added + v.entities_removed), 0) AS recent_entities "
+                "FROM rule_status s LEFT JOIN version_stats v ON v.rule_id = s.rule_id AND v.check_date >= ? "
+                "GROUP BY s.rule_id ORDER BY s.rule_id;",
+                (since,)
+            )
+            columns = [col[0] for col in cursor.description]
+            portfolio = [dict(zip(columns, row)) for row in cursor]
+        except sqlite3.Error as e:
+            print(f"Error reading portfolio: {e}")
+    return portfolio
+
+def get_version_info(version_id: int):
+    """Return (rule_id, check_date) for an archived version, or None."""
+    conn = get_connection()
+    row = None
+    if conn:
+        try:
+            row = conn.execute("SELECT rule_id, check_date FROM rule_versions WHERE id = ?;", (version_id,)).fetchone()
+        except sqlite3.Error as e:
+            print(f"Error retrieving version {version_id}: {e}")
+    return row
+
+def iter_versions(after_id: int = 0, rule_ids=None, fetch_size: int = STREAM_FETCH_SIZE):
+    """
+    Stream version metadata rule by rule, oldest first within each rule.
+
+    Runs on its own connection inside one read transaction, so the export sees
+    a consistent snapshot while the tracker keeps writing, and only
+    fetch_size rows are held at a time. Texts are not selected; load them one
+    at a time with get_version_text.
+
+    Args:
+        after_id: Only versions with a larger id (an export watermark).
+        rule_ids: Restrict to these rules (default: every rule).
+
+    Yields:
+        (version_id, rule_id, check_date, change_summary) tuples.
+    """
     conn = create_connection()
+    if conn is None:
+        return
+    try:
+        conn.execute("BEGIN;")
+        query = "SELECT id, rule_id, check_date, change_summary FROM rule_versions WHERE id > ?"
+        params = [after_id]
+        if rule_ids is not None:
+            rule_ids = list(rule_ids)
+            query += f" AND rule_id IN ({', '.join('?' * len(rule_ids))})"
+            params += rule_ids
+        cursor = conn.execute(query + " ORDER BY rule_id, id;", params)
+        while True:
+            rows = cursor.fetchmany(fetch_size)
+            if not rows:
+                break
+            yield from rows
+    except sqlite3.Error as e:
+        print(f"Error streaming versions: {e}")
+    finally:
+        conn.close()
+
+def get_previous_version_id(rule_id: str, version_id: int):
+    """Id of the version archived for a rule just before version_id, or None."""
+    conn = get_connection()
+    row = None
+    if conn:
+        try:
+            row = conn.execute(
+                "SELECT id FROM rule_versions WHERE rule_id = ? AND id < ? ORDER BY id DESC LIMIT 1;",
+                (rule_id, int(version_id))
+            ).fetchone()
+        except sqlite3.Error as e:
+            print(f"Error retrieving previous version: {e}")
+    return row[0] if row else None
+
+def get_export_watermark() -> int:
+    """Highest version id covered by the last export (0 before the first one)."""
+    conn = get_connection()
+    if conn:
+        try:
+            row = conn.execute("SELECT value FROM db_meta WHERE key = 'export_watermark';").fetchone()
+            return int(row[0]) if row else 0
+        except sqlite3.Error as e:
+            print(f"Error retrieving export watermark: {e}")
+    return 0
+
+def set_export_watermark(version_id: int):
+    conn = get_connection()
     if conn:
         try:
-            timestamp = datetime.datetime.now().isoformat()
+            conn.execute("INSERT OR REPLACE INTO db_meta (key, value) VALUES ('export_watermark', ?);",
+                         (str(int(version_id)),))
+            _commit(conn)
+        except sqlite3.Error as e:
+            print(f"Error saving export watermark: {e}")
+
+def get_db_marker():
+    """
+    A cheap value that changes whenever versions are added or removed
+    (max row id + row count), used to invalidate dashboard caches.
+    """
+    conn = get_connection()
+    marker = (0, 0)
+    if conn:
+        try:
+            marker = tuple(conn.execute("SELECT COALESCE(MAX(id), 0), COUNT(*) FROM rule_versions;").fetchone())
+        except sqlite3.Error as e:
+            print(f"Error reading database marker: {e}")
+    return marker
+
+def has_baseline(rule_id: str) -> bool:
+    """Return True if at least one version of the rule has been archived."""
+    conn = get_connection()
+    found = False
+    if conn:
+        try:
+            found = conn.execute("SELECT 1 FROM rule_versions WHERE rule_id = ? LIMIT 1;", (rule_id,)).fetchone() is not None
+        except sqlite3.Error as e:
+            print(f"Error checking baseline: {e}")
+    return found
+
+def log_new_version(rule_id: str, new_text: str, summary: str = "Initial or Minor Change", check_date: str = None,
+                    diff=None, queue_report: bool = False, analysis=None, sections=None):
+    """
+    Insert a new rule version into the database for a specific rule.
+
+    The diff against the rule's previous version is stored in diff_cache right
+    away, so "latest vs previous" in the dashboard is a lookup.
+
+    Args:
+        check_date: ISO timestamp to record; defaults to now.
+        diff: LineDiff of previous -> new text if the caller already has one.
+        queue_report: Queue a redline report for (previous, new) in the same
+            transaction (rendered later, see reporter.render_report).
+        analysis: analyze_changes output for this change; its entity counts
+            go into version_stats.
+        sections: segmenter.segment output for new_text if the caller
+            already has it.
+
+    Returns:
+        True once the version is logged. Inside batch() a database error is
+        raised instead of returning False, so the batch rolls back rather
+        than committing the rest of its writes without this version.
+    """
+    conn = get_connection()
+    if conn:
+        try:
+            previous = conn.execute(
+                "SELECT id FROM rule_versions WHERE rule_id = ? ORDER BY id DESC LIMIT 1;", (rule_id,)
+            ).fetchone()
+            timestamp = check_date or datetime.datetime.now().isoformat()
+            storage, payload, base_id, chain_pos = 'full', None, None, 0
+            if get_storage_mode(conn) == 'delta':
+                storage, payload, base_id, chain_pos = _encode_version(conn, rule_id, new_text)
             # UPDATED: Insert rule_id
             conn.execute(
-                "INSERT INTO rule_versions (rule_id, rule_text, change_summary, check_date) VALUES (?, ?, ?, ?)",
-                (rule_id, new_text, summary, timestamp)
+                "INSERT INTO rule_versions (rule_id, rule_text, change_summary, check_date, text_hash, "
+                "storage, payload, base_id, chain_pos, text_length) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (rule_id, new_text if storage == 'full' else '', summary, timestamp, hash_text(new_text),
+                 storage, payload, base_id, chain_pos, len(new_text))
             )
-            conn.commit()
-            conn.close()
+            new_id = conn.execute("SELECT last_insert_rowid();").fetchone()[0]
+            if _has_fts(conn):
+                conn.execute("INSERT INTO rule_versions_fts (rowid, rule_text) VALUES (?, ?)", (new_id, new_text))
+            new_lines = new_text.splitlines()
+            if sections is None:
+                sections = segment(new_lines)
+            _insert_sections(conn, new_id, sections)
+            lines_added = lines_removed = 0
+            if previous:
+                if diff is None:
+                    diff = section_diff(get_version_text(previous[0]).splitlines(), new_lines,
+                                        get_version_sections(previous[0]), sections)
+                lines_added, lines_removed = _store_diff(conn, previous[0], new_id, diff.opcodes)
+                if queue_report:
+                    conn.execute(
+                        "INSERT OR IGNORE INTO reports (version_a, version_b, rule_id, created_at) VALUES (?, ?, ?, ?)",
+                        (previous[0], new_id, rule_id, datetime.datetime.now().isoformat())
+                    )
+            _insert_version_stats(conn, new_id, rule_id, timestamp, new_text, lines_added, lines_removed, analysis)
+            conn.execute(
+                "INSERT INTO rule_status (rule_id, versions, latest_version_id, first_seen, last_change, last_check, "
+                "text_length, lines_added_total, lines_removed_total) VALUES (?, 1, ?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (rule_id) DO UPDATE SET versions = versions + 1, "
+                "latest_version_id = excluded.latest_version_id, last_change = excluded.last_change, "
+                "last_check = MAX(COALESCE(last_check, ''), excluded.last_check), "
+                "first_seen = COALESCE(first_seen, excluded.first_seen), text_length = excluded.text_length, "
+                "lines_added_total = lines_added_total + excluded.lines_added_total, "
+                "lines_removed_total = lines_removed_total + excluded.lines_removed_total",
+                (rule_id, new_id, timestamp, timestamp, timestamp, len(new_text), lines_added, lines_removed)
+            )
+            _commit(conn)
             print(f"[{rule_id}] New version logged on {timestamp}.")
             return True
         except sqlite3.Error as e:
             print(f"Error logging new version: {e}")
+            if getattr(_local, 'depth', 0):
+                raise
             return False
     return False
 
-# Run setup immediately on import to ensure table exists
-setup_database()
\ No newline at end of file
+def delete_rule_history(rule_id: str):
+    """Remove every archived version of a rule (used by the demo reset)."""
+    conn = get_connection()
+    if conn:
+        try:
+            conn.execute(
+                "DELETE FROM diff_cache WHERE version_a IN (SELECT id FROM rule_versions WHERE rule_id = ?) "
+                "OR version_b IN (SELECT id FROM rule_versions WHERE rule_id = ?)", (rule_id, rule_id)
+            )
+            conn.execute("DELETE FROM reports WHERE rule_id = ?", (rule_id,))
+            conn.execute("DELETE FROM version_stats WHERE rule_id = ?", (rule_id,))
+            conn.execute("DELETE FROM version_sections WHERE version_id IN "
+                         "(SELECT id FROM rule_versions WHERE rule_id = ?)", (rule_id,))
+            conn.execute("DELETE FROM rule_status WHERE rule_id = ?", (rule_id,))
+            if _has_fts(conn):
+                # Contentless FTS5 rows are removed by replaying the indexed text
+                version_ids = [row[0] for row in conn.execute("SELECT id FROM rule_versions WHERE rule_id = ?", (rule_id,))]
+                conn.executemany(
+                    "INSERT INTO rule_versions_fts (rule_versions_fts, rowid, rule_text) VALUES ('delete', ?, ?)",
+                    [(version_id, get_version_text(version_id)) for version_id in version_ids]
+                )
+            conn.execute("DELETE FROM rule_versions WHERE rule_id = ?", (rule_id,))
+            _commit(conn)
+        except sqlite3.Error as e:
+            print(f"Error deleting rule history: {e}")
+
+def get_version_diff(version_a: int, version_b: int):
+    """
+    Return the line diff between two archived versions.
+
+    Looks in an in-process LRU first, then the persisted diff_cache table, and
+    only computes (and stores) the diff on a miss.
+
+    Returns:
+        A dict with 'opcodes' (difflib-style tuples), 'lines_added' and 'lines_removed'.
+        Treat it as read-only; it is shared by the cache.
+    """
+    try:
+        return _cached_diff(DB_PATH, int(version_a), int(version_b))
+    except sqlite3.Error as e:
+        print(f"Error retrieving diff {version_a}->{version_b}: {e}")
+    diff = compute_diff(get_version_text(version_a), get_version_text(version_b))
+    added, removed = count_changes(diff.opcodes)
+    return {'opcodes': diff.opcodes, 'lines_added': added, 'lines_removed': removed}
+
+@lru_cache(maxsize=DIFF_CACHE_SIZE)
+def _cached_diff(db_path, version_a, version_b):
+    # db_path is part of the cache key only; reads go through this thread's connection
+    conn = get_connection()
+    row = conn.execute(
+        "SELECT opcodes, lines_added, lines_removed FROM diff_cache WHERE version_a = ? AND version_b = ?;",
+        (version_a, version_b)
+    ).fetchone()
+    if row:
+        opcodes = [tuple(op) for op in json.loads(row[0])]
+        return {'opcodes': opcodes, 'lines_added': row[1], 'lines_removed': row[2]}
+    diff = compute_diff(get_version_text(version_a), get_version_text(version_b))
+    if not READ_ONLY:
+        _store_diff(conn, version_a, version_b, diff.opcodes)
+        _commit(conn)
+    added, removed = count_changes(diff.opcodes)
+    return {'opcodes': diff.opcodes, 'lines_added': added, 'lines_removed': removed}
+
+def _store_diff(conn, version_a, version_b, opcodes):
+    added, removed = count_changes(opcodes)
+    conn.execute(
+        "INSERT OR REPLACE INTO diff_cache (version_a, version_b, opcodes, lines_added, lines_removed, created_at) "
+        "VALUES (?, ?, ?, ?, ?, ?)",
+        (version_a, version_b, json.dumps(opcodes, separators=(',', ':')), added, removed,
+         datetime.datetime.now().isoformat())
+    )
+    return added, removed
+
+def get_report(version_a: int, version_b: int):
+    """The reports row for a version pair as a dict, or None."""
+    conn = get_connection()
+    if conn:
+        try:
+            cursor = conn.execute("SELECT * FROM reports WHERE version_a = ? AND version_b = ?",
+                                  (int(version_a), int(version_b)))
+            row = cursor.fetchone()
+            if row:
+                return dict(zip([col[0] for col in cursor.description], row))
+        except sqlite3.Error as e:
+            print(f"Error reading report cache: {e}")
+    return None
+
+def get_pending_reports(limit: int = None):
+    """Queued (version_a, version_b) pairs that have not been rendered yet, oldest first."""
+    conn = get_connection()
+    rows = []
+    if conn:
+        try:
+            rows = conn.execute(
+                "SELECT version_a, version_b FROM reports WHERE status = 'pending' ORDER BY created_at LIMIT ?",
+                (-1 if limit is None else limit,)
+            ).fetchall()
+        except sqlite3.Error as e:
+            print(f"Error reading report queue: {e}")
+    return rows
+
+def save_report(version_a: int, version_b: int, rule_id: str, path: str, size: int):
+    """Mark a version pair's report as rendered to path."""
+    conn = get_connection()
+    if conn:
+        try:
+            now = datetime.datetime.now().isoformat()
+            conn.execute(
+                "INSERT OR REPLACE INTO reports (version_a, version_b, rule_id, status, path, bytes, created_at, rendered_at) "
+                "VALUES (?, ?, ?, 'ready', ?, ?, COALESCE((SELECT created_at FROM reports WHERE version_a = ? AND version_b = ?), ?), ?)",
+                (version_a, version_b, rule_id, path, size, version_a, version_b, now, now)
+            )
+            _commit(conn)
+        except sqlite3.Error as e:
+            print(f"Error saving report cache: {e}")
+
+def get_fetch_validators(url: str):
+    """Return the stored (etag, last_modified, body_hash) for a URL, or None."""
+    conn = get_connection()
+    row = None
+    if conn:
+        try:
+            row = conn.execute("SELECT etag, last_modified, body_hash FROM fetch_cache WHERE url = ?;", (url,)).fetchone()
+        except sqlite3.Error as e:
+            print(f"Error reading fetch cache: {e}")
+    return row
+
+def save_fetch_validators(url: str, etag, last_modified, body_hash):
+    """Store the HTTP validators and raw body hash from the latest fetch of a URL."""
+    conn = get_connection()
+    if conn:
+        try:
+            conn.execute(
+                "INSERT OR REPLACE INTO fetch_cache (url, etag, last_modified, body_hash, fetched_at) VALUES (?, ?, ?, ?, ?)",
+                (url, etag, last_modified, body_hash, datetime.datetime.now().isoformat())
+            )
+            _commit(conn)
+        except sqlite3.Error as e:
+            print(f"Error saving fetch cache: {e}")
+
+def clear_fetch_validators(url: str):
+    """Forget the cached validators for a URL so the next fetch is unconditional."""
+    conn = get_connection()
+    if conn:
+        try:
+            conn.execute("DELETE FROM fetch_cache WHERE url = ?", (url,))
+            _commit(conn)
+        except sqlite3.Error as e:
+            print(f"Error clearing fetch cache: {e}")
+
+def sync_schedule(rule_ids, interval_s: float, now: float):
+    """
+    Give every tracked rule a schedule row (new rules are due immediately) and
+    drop rows for rules no longer tracked. Existing rows, including their
+    next_check, are left alone so a restarted daemon resumes where it stopped.
+    """
+    conn = get_connection()
+    if conn:
+        try:
+            rule_ids = list(rule_ids)
+            conn.executemany(
+                "INSERT OR IGNORE INTO rule_schedule (rule_id, interval_s, next_check) VALUES (?, ?, ?)",
+                [(rule_id, interval_s, now) for rule_id in rule_ids]
+            )
+            tracked = set(rule_ids)
+            stale = [(row[0],) for row in conn.execute("SELECT rule_id FROM rule_schedule;") if row[0] not in tracked]
+            conn.executemany("DELETE FROM rule_schedule WHERE rule_id = ?", stale)
+            _commit(conn)
+        except sqlite3.Error as e:
+            print(f"Error syncing rule schedule: {e}")
+
+def get_due_rules(now: float, limit: int):
+    """Rule IDs whose next_check has passed, most overdue first."""
+    conn = get_connection()
+    rows = []
+    if conn:
+        try:
+            rows = conn.execute(
+                "SELECT rule_id FROM rule_schedule WHERE next_check <= ? ORDER BY next_check LIMIT ?", (now, limit)
+            ).fetchall()
+        except sqlite3.Error as e:
+            print(f"Error reading rule schedule: {e}")
+    return [row[0] for row in rows]
+
+def get_next_due_time():
+    """Earliest next_check across all rules, or None when nothing is scheduled."""
+    conn = get_connection()
+    if conn:
+        try:
+            return conn.execute("SELECT MIN(next_check) FROM rule_schedule;").fetchone()[0]
+        except sqlite3.Error as e:
+            print(f"Error reading rule schedule: {e}")
+    return None
+
+def get_schedule(rule_id: str):
+    """The schedule row for a rule as a dict, or None."""
+    conn = get_connection()
+    if conn:
+        try:
+            cursor = conn.execute("SELECT * FROM rule_schedule WHERE rule_id = ?", (rule_id,))
+            row = cursor.fetchone()
+            if row:
+                return dict(zip([col[0] for col in cursor.description], row))
+        except sqlite3.Error as e:
+            print(f"Error reading rule schedule: {e}")
+    return None
+
+def update_schedule(rule_id: str, interval_s: float, next_check: float, now: float, outcome: str,
+                    avg_fetch_s=None):
+    """
+    Record the result of a scheduled check and when the rule is due next.
+
+    Args:
+        outcome: 'changed', 'unchanged', 'blocked' or 'failed'.
+        avg_fetch_s: Updated moving average of the rule's fetch time.
+    """
+    conn = get_connection()
+    if conn:
+        try:
+            conn.execute(
+                "UPDATE rule_schedule SET interval_s = ?, next_check = ?, last_check = ?, "
+                "last_change = CASE WHEN ? = 'changed' THEN ? ELSE last_change END, "
+                "checks = checks + 1, changes = changes + (? = 'changed'), failures = failures + (? IN ('failed', 'blocked')), "
+                "avg_fetch_s = COALESCE(?, avg_fetch_s) WHERE rule_id = ?",
+                (interval_s, next_check, now, outcome, now, outcome, outcome, avg_fetch_s, rule_id)
+            )
+            _commit(conn)
+        except sqlite3.Error as e:
+            print(f"Error updating rule schedule: {e}")
+
+def claim_rules(rule_ids, cycle: str, worker_id: str, limit: int, lease_s: float, now: float):
+    """
+    Lease up to `limit` rules of a sweep cycle to one worker.
+
+    A rule can be claimed when it has no lease in this cycle yet, when its
+    lease expired without being completed (the worker crashed or stalled), or
+    when this worker still holds it from a round it discarded.
+    The whole claim runs under BEGIN IMMEDIATE, so concurrent workers never
+    receive the same rule. It commits on its own; do not call it inside batch().
+
+    Args:
+        rule_ids: Every tracked rule ID, in preferred order.
+        cycle: Sweep label; each rule is completed at most once per cycle.
+        lease_s: Seconds the lease lasts unless renewed by renew_leases.
+
+    Returns:
+        A dict mapping each claimed rule ID to its attempt number in this
+        cycle (above 1 when the rule was reclaimed); empty when nothing is
+        claimable right now.
+    """
+    conn = get_connection()
+    claimed = {}
+    if conn:
+        try:
+            conn.commit()   # BEGIN IMMEDIATE cannot start inside an open transaction
+            conn.execute("BEGIN IMMEDIATE;")
+            try:
+                held = dict(conn.execute(
+                    "SELECT rule_id, status = 'done' OR (lease_expires > ? AND worker_id != ?) "
+                    "FROM rule_leases WHERE cycle = ?",
+                    (now, worker_id, cycle)
+                ).fetchall())
+                claimable = [rule_id for rule_id in rule_ids if not held.get(rule_id)][:limit]
+                conn.executemany(
+                    "INSERT INTO rule_leases (rule_id, cycle, worker_id, lease_expires, claimed_at) "
+                    "VALUES (?, ?, ?, ?, ?) ON CONFLICT (rule_id, cycle) DO UPDATE SET "
+                    "worker_id = excluded.worker_id, lease_expires = excluded.lease_expires, "
+                    "claimed_at = excluded.claimed_at, attempts = attempts + 1",
+                    [(rule_id, cycle, worker_id, now + lease_s, now) for rule_id in claimable]
+                )
+                for rule_id in claimable:
+                    claimed[rule_id] = conn.execute(
+                        "SELECT attempts FROM rule_leases WHERE rule_id = ? AND cycle = ?", (rule_id, cycle)
+                    ).fetchone()[0]
+                conn.commit()
+            except BaseException:
+                conn.rollback()
+                raise
+        except sqlite3.Error as e:
+            print(f"Error claiming rules: {e}")
+            return {}
+    return claimed
+
+def renew_leases(cycle: str, worker_id: str, lease_s: float, now: float) -> int:
+    """Heartbeat: extend every unfinished lease this worker holds. Returns how many were renewed."""
+    conn = get_connection()
+    if conn:
+        try:
+            cursor = conn.execute(
+                "UPDATE rule_leases SET lease_expires = ? WHERE cycle = ? AND worker_id = ? AND status = 'leased'",
+                (now + lease_s, cycle, worker_id)
+            )
+            _commit(conn)
+            return cursor.rowcount
+        except sqlite3.Error as e:
+            print(f"Error renewing leases: {e}")
+    return 0
+
+def complete_leases(rule_ids, cycle: str, worker_id: str, now: float):
+    """
+    Mark leased rules done for the cycle. Call it inside the batch() that
+    wrote the rules' versions: only leases this worker still holds are
+    completed, and the caller should roll back if any were lost.
+
+    Returns:
+        The rule IDs whose lease this worker no longer held.
+    """
+    conn = get_connection()
+    lost = []
+    if conn:
+        try:
+            for rule_id in rule_ids:
+                cursor = conn.execute(
+                    "UPDATE rule_leases SET status = 'done', finished_at = ? "
+                    "WHERE rule_id = ? AND cycle = ? AND worker_id = ? AND status = 'leased'",
+                    (now, rule_id, cycle, worker_id)
+                )
+                if cursor.rowcount == 0:
+                    lost.append(rule_id)
+            _commit(conn)
+        except sqlite3.Error as e:
+            print(f"Error completing leases: {e}")
+            return list(rule_ids)
+    return lost
+
+def release_leases(cycle: str, worker_id: str):
+    """Give up this worker's unfinished leases (clean shutdown) so others can claim them at once."""
+    conn = get_connection()
+    if conn:
+        try:
+            conn.execute("DELETE FROM rule_leases WHERE cycle = ? AND worker_id = ? AND status = 'leased'",
+                         (cycle, worker_id))
+            _commit(conn)
+        except sqlite3.Error as e:
+            print(f"Error releasing leases: {e}")
+
+def get_cycle_progress(cycle: str, now: float):
+    """Counts of 'done', live 'leased' and 'expired' leases in a cycle."""
+    conn = get_connection()
+    progress = {'done': 0, 'leased': 0, 'expired': 0}
+    if conn:
+        try:
+            for state, count in conn.execute(
+                "SELECT CASE WHEN status = 'done' THEN 'done' WHEN lease_expires > ? THEN 'leased' "
+                "ELSE 'expired' END, COUNT(*) FROM rule_leases WHERE cycle = ? GROUP BY 1", (now, cycle)
+            ):
+                progress[state] = count
+        except sqlite3.Error as e:
+            print(f"Error reading cycle progress: {e}")
+    return progress
+
+def get_cached_entities(line_hashes, touch: bool = True):
+    """
+    Look up memoized entities for a list of line hashes.
+
+    Args:
+        touch: Refresh the hits' last_used time so eviction stays
+            least-recently-used. Pass False where writes are not allowed and
+            call touch_cached_entities from the writer instead.
+
+    Returns:
+        A dict mapping each cached line hash to its entities dict.
+    """
+    conn = get_connection()
+    found = {}
+    if conn and line_hashes:
+        try:
+            keys = list(line_hashes)
+            # Stay under SQLite's bound-parameter limit
+            for start in range(0, len(keys), 500):
+                chunk = keys[start:start + 500]
+                placeholders = ",".join("?" * len(chunk))
+                for line_hash, entities in conn.execute(
+                    f"SELECT line_hash, entities FROM ner_cache WHERE line_hash IN ({placeholders});", chunk
+                ):
+                    found[line_hash] = json.loads(entities)
+        except sqlite3.Error as e:
+            print(f"Error reading NER cache: {e}")
+    if touch:
+        touch_cached_entities(found)
+    return found
+
+def touch_cached_entities(line_hashes):
+    """Mark cached lines as just used (see get_cached_entities)."""
+    conn = get_connection()
+    if conn and line_hashes:
+        try:
+            now = datetime.datetime.now().timestamp()
+            conn.executemany("UPDATE ner_cache SET last_used = ? WHERE line_hash = ?", [(now, h) for h in line_hashes])
+            _commit(conn)
+        except sqlite3.Error as e:
+            print(f"Error updating NER cache: {e}")
+
+def store_cached_entities(entries, max_entries: int = NER_CACHE_MAX_ENTRIES):
+    """
+    Memoize entities for newly analyzed lines, then trim the cache to max_entries.
+
+    Args:
+        entries: Mapping of line hash to entities dict.
+    """
+    conn = get_connection()
+    if conn and entries:
+        try:
+            now = datetime.datetime.now().timestamp()
+            conn.executemany(
+                "INSERT OR REPLACE INTO ner_cache (line_hash, entities, last_used) VALUES (?, ?, ?)",
+                [(h, json.dumps(entities, separators=(',', ':')), now) for h, entities in entries.items()]
+            )
+            excess = conn.execute("SELECT COUNT(*) FROM ner_cache;").fetchone()[0] - max_entries
+            if excess > 0:
+                conn.execute(
+                    "DELETE FROM ner_cache WHERE line_hash IN (SELECT line_hash FROM ner_cache ORDER BY last_used LIMIT ?)",
+                    (excess,)
+                )
+            _commit(conn)
+        except sqlite3.Error as e:
+            print(f"Error writing NER cache: {e}")
+
+def compact_database(keyframe_interval: int = KEYFRAME_INTERVAL):
+    """
+    One-shot migration of every 'full' row to keyframe + delta storage.
+
+    Rewrites each rule's history oldest-first, switches the database to delta
+    mode and records keyframe_interval so later writes use the same layout,
+    then VACUUMs and reports the space saved. The interval is capped at
+    MAX_KEYFRAME_INTERVAL.
+
+    Returns:
+        A dict with 'versions_converted', 'bytes_before' and 'bytes_after'.
+    """
+    if not 1 <= keyframe_interval <= MAX_KEYFRAME_INTERVAL:
+        clamped = min(max(keyframe_interval, 1), MAX_KEYFRAME_INTERVAL)
+        print(f"Keyframe interval {keyframe_interval} is out of range; using {clamped}.")
+        keyframe_interval = clamped
+
+    conn = get_connection()
+    page_size = conn.execute("PRAGMA page_size;").fetchone()[0]
+    bytes_before = conn.execute("PRAGMA page_count;").fetchone()[0] * page_size
+
+    converted = 0
+    with batch():
+        rows = conn.execute("SELECT id, rule_id FROM rule_versions WHERE storage = 'full' ORDER BY rule_id, id;").fetchall()
+        for version_id, rule_id in rows:
+            text = get_version_text(version_id)
+            storage, payload, base_id, chain_pos = _encode_version(conn, rule_id, text, before_id=version_id,
+                                                                    keyframe_interval=keyframe_interval)
+            conn.execute(
+                "UPDATE rule_versions SET rule_text = '', storage = ?, payload = ?, base_id = ?, chain_pos = ?, "
+                "text_length = ? WHERE id = ?",
+                (storage, payload, base_id, chain_pos, len(text), version_id)
+            )
+            converted += 1
+        conn.execute("INSERT OR REPLACE INTO db_meta (key, value) VALUES ('storage_mode', 'delta');")
+        conn.execute("INSERT OR REPLACE INTO db_meta (key, value) VALUES ('keyframe_interval', ?);",
+                     (str(keyframe_interval),))
+
+    conn.execute("VACUUM;")
+    conn.execute("PRAGMA wal_checkpoint(TRUNCATE);")
+    bytes_after = conn.execute("PRAGMA page_count;").fetchone()[0] * page_size
+
+    saved = bytes_before - bytes_after
+    pct = (saved / bytes_before * 100) if bytes_before else 0
+    print(f"Compacted {converted} versions: {bytes_before:,} -> {bytes_after:,} bytes ({saved:,} saved, {pct:.1f}%).")
+    return {'versions_converted': converted, 'bytes_before': bytes_before, 'bytes_after': bytes_after}
@@ -0,0 +1,267 @@
+# src/diff_engine.py
+
+from bisect import bisect_left
+from typing import List, NamedTuple, Tuple
+
+# Upper bound on edit distance (inserted + deleted lines) Myers may explore in a
+# single region before the region is emitted as one 'replace' block instead.
+# Search time grows with its square, so keep it well below rule sizes.
+MAX_COST = 400
+
+Opcode = Tuple[str, int, int, int, int]
+
+class LineDiff(NamedTuple):
+    """A line diff computed once and shared by the comparator, reporter and dashboard."""
+    old_lines: List[str]
+    new_lines: List[str]
+    opcodes: List[Opcode]   # Same (tag, i1, i2, j1, j2) format as difflib.get_opcodes()
+
+def compute_diff(old_text: str, new_text: str, max_cost: int = MAX_COST) -> LineDiff:
+    """
+    Diffs two texts line by line.
+
+    Args:
+        old_text: The baseline text.
+        new_text: The newer text.
+        max_cost: Edit-distance budget per region before falling back to 'replace'.
+
+    Returns:
+        A LineDiff holding both line lists and the opcodes.
+    """
+    old_lines = old_text.splitlines()
+    new_lines = new_text.splitlines()
+    return LineDiff(old_lines, new_lines, diff_lines(old_lines, new_lines, max_cost))
+
+def diff_lines(a: List[str], b: List[str], max_cost: int = MAX_COST) -> List[Opcode]:
+    """
+    Returns difflib-style opcodes turning line list a into line list b.
+
+    Lines are interned to integer IDs, common prefix/suffix are trimmed, the
+    middle is split on patience anchors (lines unique to both sides, kept in
+    order via a longest increasing subsequence) and the gaps between anchors
+    are solved with a cost-bounded, linear-space Myers O(ND) search.
+    """
+    ids = {}
+    a_ids = [ids.setdefault(line, len(ids)) for line in a]
+    b_ids = [ids.setdefault(line, len(ids)) for line in b]
+    blocks = []
+    _diff_range(a_ids, b_ids, 0, len(a_ids), 0, len(b_ids), max_cost, blocks)
+    return _blocks_to_opcodes(sorted(blocks), len(a_ids), len(b_ids))
+
+def grouped_opcodes(opcodes: List[Opcode], context: int = 3) -> List[List[Opcode]]:
+    """
+    Groups opcodes into hunks with up to `context` lines of unchanged text
+    around each change (same behaviour as SequenceMatcher.get_grouped_opcodes).
+    """
+    codes = list(opcodes) or [('equal', 0, 1, 0, 1)]
+    # Trim leading/trailing context
+    if codes[0][0] == 'equal':
+        tag, i1, i2, j1, j2 = codes[0]
+        codes[0] = tag, max(i1, i2 - context), i2, max(j1, j2 - context), j2
+    if codes[-1][0] == 'equal':
+        tag, i1, i2, j1, j2 = codes[-1]
+        codes[-1] = tag, i1, min(i2, i1 + context), j1, min(j2, j1 + context)
+
+    groups = []
+    group = []
+    for tag, i1, i2, j1, j2 in codes:
+        # Split long unchanged runs into the tail of one hunk and the head of the next
+        if tag == 'equal' and i2 - i1 > context * 2:
+            group.append((tag, i1, min(i2, i1 + context), j1, min(j2, j1 + context)))
+            groups.append(group)
+            group = []
+            i1, j1 = max(i1, i2 - context), max(j1, j2 - context)
+        group.append((tag, i1, i2, j1, j2))
+    if group and not (len(group) == 1 and group[0][0] == 'equal'):
+        groups.append(group)
+    return groups
+
+def count_changes(opcodes: List[Opcode]) -> Tuple[int, int]:
+    """Returns (lines_added, lines_removed) for a set of opcodes."""
+    added = removed = 0
+    for tag, i1, i2, j1, j2 in opcodes:
+        if tag != 'equal':
+            removed += i2 - i1
+            added += j2 - j1
+    return added, removed
+
+def _diff_range(a, b, alo, ahi, blo, bhi, max_cost, blocks):
+    """Appends (i, j, size) matching blocks for a[alo:ahi] vs b[blo:bhi]."""
+    # 1. Common prefix / suffix
+    start = 0
+    while alo + start < ahi and blo + start < bhi and a[alo + start] == b[blo + start]:
+        start += 1
+    if start:
+        blocks.append((alo, blo, start))
+        alo += start
+        blo += start
+    end = 0
+    while ahi - end > alo and bhi - end > blo and a[ahi - end - 1] == b[bhi - end - 1]:
+        end += 1
+    if end:
+        blocks.append((ahi - end, bhi - end, end))
+        ahi -= end
+        bhi -= end
+    if alo == ahi or blo == bhi:
+        return
+
+    # 2. Patience anchors: recurse into the gaps between them
+    anchors = _patience_anchors(a, b, alo, ahi, blo, bhi)
+    if anchors:
+        i, j = alo, blo
+        for ai, bj in anchors:
+            _diff_range(a, b, i, ai, j, bj, max_cost, blocks)
+            blocks.append((ai, bj, 1))
+            i, j = ai + 1, bj + 1
+        _diff_range(a, b, i, ahi, j, bhi, max_cost, blocks)
+        return
+
+    # 3. No unique lines to anchor on: bounded Myers, else give up on this region
+    blocks.extend(_myers(a, b, alo, ahi, blo, bhi, max_cost))
+
+def _patience_anchors(a, b, alo, ahi, blo, bhi):
+    """Lines occurring exactly once on each side, as the longest in-order subsequence."""
+    counts = {}
+    for i in range(alo, ahi):
+        entry = counts.get(a[i])
+        counts[a[i]] = [1, i, None] if entry is None else [entry[0] + 1, i, None]
+    for j in range(blo, bhi):
+        entry = counts.get(b[j])
+        if entry is None or entry[0] != 1:
+            continue
+        # Mark duplicates on the b side as disqualified
+        entry[2] = j if entry[2] is None else -1
+    pairs = sorted((entry[1], entry[2]) for entry in counts.values()
+                   if entry[0] == 1 and entry[2] is not None and entry[2] >= 0)
+    if not pairs:
+        return []
+
+    # Longest increasing subsequence on b positions (patience sorting)
+    tails = []
+    tail_idx = []
+    prev = [-1] * len(pairs)
+    for idx, (_, bj) in enumerate(pairs):
+        pos = bisect_left(tails, bj)
+        if pos == len(tails):
+            tails.append(bj)
+            tail_idx.append(idx)
+        else:
+            tails[pos] = bj
+            tail_idx[pos] = idx
+        prev[idx] = tail_idx[pos - 1] if pos else -1
+    result = []
+    idx = tail_idx[-1]
+    while idx != -1:
+        result.append(pairs[idx])
+        idx = prev[idx]
+    return result[::-1]
+
+def _myers(a, b, alo, ahi, blo, bhi, max_cost):
+    """
+    Linear-space Myers diff on a[alo:ahi] vs b[blo:bhi].
+
+    Finds the middle snake of an optimal edit path, then diffs the halves on
+    either side of it through _diff_range. Memory stays O(n + m) whatever the
+    edit distance.
+
+    Returns matching blocks, or an empty list (i.e. one 'replace') when the
+    edit distance exceeds max_cost.
+    """
+    n, m = ahi - alo, bhi - blo
+    # Every line missing from the other side costs one edit, so regions that
+    # share (almost) nothing are known to be a replace without searching
+    counts = {}
+    for line in a[alo:ahi]:
+        counts[line] = counts.get(line, 0) + 1
+    common = 0
+    for line in b[blo:bhi]:
+        if counts.get(line, 0) > 0:
+            counts[line] -= 1
+            common += 1
+    if not common or n + m - 2 * common > max_cost:
+        return []
+
+    snake = _middle_snake(a, b, alo, ahi, blo, bhi, max_cost)
+    if snake is None:
+        return []
+    x1, y1, x2, y2 = snake
+    blocks = []
+    _diff_range(a, b, alo, x1, blo, y1, max_cost, blocks)
+    if x2 > x1:
+        blocks.append((x1, y1, x2 - x1))
+    _diff_range(a, b, x2, ahi, y2, bhi, max_cost, blocks)
+    return blocks
+
+def _middle_snake(a, b, alo, ahi, blo, bhi, max_cost):
+    """
+    Searches forwards from the start and backwards from the end at the same
+    time (Myers 1986, section 4b) until the two frontiers overlap.
+
+    Returns:
+        (x1, y1, x2, y2): the diagonal run a[x1:x2] == b[y1:y2] in the middle
+        of an optimal path, or None when the edit distance exceeds max_cost.
+    """
+    n, m = ahi - alo, bhi - blo
+    delta = n - m
+    odd = delta % 2 == 1
+    forward = {1: 0}     # Diagonal k -> furthest x (offset from alo) reached from the start
+    backward = {1: 0}    # Diagonal c -> furthest distance back from the end
+    for d in range((min(n + m, max_cost) + 1) // 2 + 1):
+        for k in range(-d, d + 1, 2):
+            if k == -d or (k != d and forward[k - 1] < forward[k + 1]):
+                x = forward[k + 1]
+            else:
+                x = forward[k - 1] + 1
+            y = x - k
+            x0, y0 = x, y
+            while x < n and y < m and a[alo + x] == b[blo + y]:
+                x += 1
+                y += 1
+            forward[k] = x
+            c = delta - k
+            if odd and -(d - 1) <= c <= d - 1 and x + backward[c] >= n:
+                return alo + x0, blo + y0, alo + x, blo + y
+        for c in range(-d, d + 1, 2):
+            if c == -d or (c != d and backward[c - 1] < backward[c + 1]):
+                u = backward[c + 1]
+            else:
+                u = backward[c - 1] + 1
+            v = u - c
+            u0 = u
+            while u < n and v < m and a[ahi - u - 1] == b[bhi - v - 1]:
+                u += 1
+                v += 1
+            backward[c] = u
+            k = delta - c
+            if not odd and -d <= k <= d and forward[k] + u >= n:
+                return ahi - u, bhi - v, ahi - u0, bhi - (u0 - c)
+    return None
+
+def _blocks_to_opcodes(blocks, n, m):
+    """Converts sorted matching blocks into difflib-style opcodes."""
+    # Merge adjacent blocks (e.g. a trimmed prefix followed by an anchor)
+    merged = []
+    for i, j, size in blocks:
+        if size <= 0:
+            continue
+        if merged and merged[-1][0] + merged[-1][2] == i and merged[-1][1] + merged[-1][2] == j:
+            merged[-1] = (merged[-1][0], merged[-1][1], merged[-1][2] + size)
+        else:
+            merged.append((i, j, size))
+    merged.append((n, m, 0))
+
+    opcodes = []
+    i = j = 0
+    for ai, bj, size in merged:
+        if i < ai and j < bj:
+            opcodes.append(('replace', i, ai, j, bj))
+        elif i < ai:
+            opcodes.append(('delete', i, ai, j, bj))
+        elif j < bj:
+            opcodes.append(('insert', i, ai, j, bj))
+        i, j = ai + size, bj + size
+        if size:
+            opcodes.append(('equal', ai, i, bj, j))
+    return opcodes
+
+# End of diff_engine.py
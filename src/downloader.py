@@ -1,52 +1,225 @@
 # src/downloader.py
-import requests
-from bs4 import BeautifulSoup
+import hashlib
 import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+from src.database_manager import get_fetch_validators, save_fetch_validators, close_connection
+from src.extractor import extract_text, profile_for_url
+from src.normalizer import canonicalize
+from src.fetch_policy import (FetchPolicy, FetchError, BlockedError, ThrottledError, EmptyPageError,
+                              ConnectionFailedError, fetch_outcome)
+from src import metrics
 
-def download_rule(url):
+# Concurrent fetch settings (used by download_rules)
+MAX_WORKERS = 16          # Total worker threads across all hosts
+PER_HOST_LIMIT = 4        # Max simultaneous requests against a single host
+
+# Returned by download_rule when the page has not changed since the last fetch
+# (HTTP 304, or a 200 whose raw body hashes the same as last time).
+NOT_MODIFIED = object()
+
+# Validators (ETag, Last-Modified, raw body hash) from each URL's latest fetch,
+# held until the caller has recorded the rule's outcome (see commit_fetch_validators).
+# Saving them at fetch time would let a run that aborts before archiving a
+# changed page answer NOT_MODIFIED for it on the next run.
+_fetched_validators = {}
+_fetched_lock = threading.Lock()
+
+# Use a very standard 'Real Person' User-Agent
+HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
+    'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,*/*;q=0.8',
+    'Referer': 'https://www.google.com/'
+}
+
+def create_session(pool_size=PER_HOST_LIMIT):
+    """Create a keep-alive session whose connection pool matches the per-host cap."""
+    # requests is imported on first use so commands that never fetch skip it
+    import requests
+    from requests.adapters import HTTPAdapter
+    session = requests.Session()
+    session.headers.update(HEADERS)
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+def download_rule(url, session=None, conditional=True, policy=None, raw=False):
     """
     Downloads rule text. Includes heavy error handling and fallbacks.
+
+    The text is run through normalizer.canonicalize, so whitespace reflow,
+    non-breaking spaces and per-site banners never show up as changes.
+
+    Args:
+        url: The rule page to fetch.
+        session: Optional requests.Session to reuse pooled connections.
+        conditional: Send the stored ETag/Last-Modified validators and return
+            NOT_MODIFIED instead of text when the page is unchanged. Pass False
+            when the caller needs the text regardless (e.g. no baseline yet).
+            The new validators are kept for commit_fetch_validators, not stored.
+        policy: The run's FetchPolicy (per-host rate limit, retries, circuit
+            breaker); a fresh default policy when omitted.
+        raw: Return the page body (bytes) instead of its text, for a caller
+            that runs parse_page elsewhere (e.g. in a worker process).
+
+    Raises:
+        FetchError: One of its subclasses when no rule text could be obtained.
     """
-    # Use a very standard 'Real Person' User-Agent
-    headers = {
-        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
-        'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,*/*;q=0.8',
-        'Referer': 'https://www.google.com/'
-    }
-    
+    headers = dict(HEADERS)
+    with _fetched_lock:
+        _fetched_validators.pop(url, None)
+    cached = get_fetch_validators(url) if conditional else None
+    if cached:
+        etag, last_modified, _ = cached
+        if etag:
+            headers['If-None-Match'] = etag
+        if last_modified:
+            headers['If-Modified-Since'] = last_modified
+
     try:
         # 1. Try to connect
-        response = requests.get(url, headers=headers, timeout=15)
+        # Retries, backoff and the host's rate limit all happen inside the policy
+        with metrics.span('fetch'):
+            response = (policy or FetchPolicy()).get(session, url, headers)
+        metrics.incr('bytes_fetched', len(response.content))
         
+        # Server confirmed our cached copy is still current
+        if response.status_code == 304 and cached:
+            metrics.incr('http_not_modified')
+            return NOT_MODIFIED
+
         # If FINRA blocks us (403 Forbidden), return a clear error
         if response.status_code == 403:
-            return "Error 403: FINRA blocked the automated request. Use 'Load Test Data' to demo."
+            raise BlockedError("Error 403: FINRA blocked the automated request. Use 'Load Test Data' to demo.")
+        if response.status_code == 429:
+            raise ThrottledError("Error 429: still rate-limited after retrying.")
         
         response.raise_for_status()
-        soup = BeautifulSoup(response.content, 'html.parser')
-        
-        # 2. Aggressive Text Extraction
-        # We try specific containers first, but if they fail, we grab the whole body
-        content = ""
-        
-        # Try finding the main rule container (specific to FINRA)
-        target = soup.find('div', class_='rule-book-content') or \
-                 soup.find('div', class_='field-item even') or \
-                 soup.find('div', id='block-system-main')
-                 
-        if target:
-            content = target.get_text(separator='\n').strip()
-        
-        # FALLBACK: If specific targets failed, grab all paragraph text
-        if len(content) < 100:
-            paragraphs = soup.find_all('p')
-            content = "\n\n".join([p.get_text().strip() for p in paragraphs if len(p.get_text().strip()) > 20])
-            
-        # 3. Final Check
-        if len(content) < 50:
-            return "Error: Connected to page but found no readable text."
-            
-        return content
 
+        # Byte-for-byte identical page: skip parsing entirely
+        body_hash = hashlib.sha256(response.content).hexdigest()
+        _remember_validators(url, response, body_hash)
+        if cached and cached[2] == body_hash:
+            metrics.incr('body_unchanged')
+            return NOT_MODIFIED
+        if raw:
+            return response.content
+        return parse_page(url, response.content)
+
+    except FetchError:
+        raise
     except Exception as e:
-        return f"Connection Error: {str(e)}"
+        raise ConnectionFailedError(f"Connection Error: {str(e)}") from e
+
+def parse_page(url, body):
+    """
+    Extracts and canonicalizes the rule text of a fetched page body.
+
+    Raises:
+        EmptyPageError: The page has no readable rule text.
+    """
+    # Only the site's rule container is parsed; <p> text is the fallback
+    profile = profile_for_url(url)
+    with metrics.span('extract'):
+        content = canonicalize(extract_text(body, profile), profile)
+    if len(content) < 50:
+        raise EmptyPageError("Error: Connected to page but found no readable text.")
+    return content
+
+def _remember_validators(url, response, body_hash):
+    with _fetched_lock:
+        _fetched_validators[url] = (response.headers.get('ETag'), response.headers.get('Last-Modified'), body_hash)
+
+def commit_fetch_validators(url):
+    """
+    Store the validators from the latest fetch of a URL for conditional GETs.
+
+    Call it only once the rule's new version (or its unchanged check) has
+    been recorded, inside the same batch(), so the fetch cache never runs
+    ahead of the archive.
+    """
+    with _fetched_lock:
+        validators = _fetched_validators.pop(url, None)
+    if validators:
+        save_fetch_validators(url, *validators)
+
+def open_host_sessions(urls, per_host_limit=PER_HOST_LIMIT):
+    """
+    One keep-alive session and one in-flight semaphore per host.
+
+    Returns:
+        A dict mapping host to a (session, semaphore) pair.
+    """
+    hosts = {}
+    for url in urls:
+        host = urlsplit(url).netloc
+        if host not in hosts:
+            hosts[host] = (create_session(per_host_limit), threading.BoundedSemaphore(per_host_limit))
+    return hosts
+
+def close_host_sessions(hosts):
+    for session, _ in hosts.values():
+        session.close()
+
+def fetch_rule_page(rule, hosts, conditional=True, rate_limiter=None, policy=None, raw=False):
+    """
+    Downloads one rule over its host's session, holding the host's semaphore.
+
+    Returns:
+        Whatever download_rule returned (text, or the body when raw; or
+        NOT_MODIFIED), or the FetchError it raised.
+    """
+    session, limit = hosts[urlsplit(rule['url']).netloc]
+    with limit, metrics.rule_scope(rule['id']):
+        if rate_limiter is not None:
+            rate_limiter.acquire()
+        try:
+            return download_rule(rule['url'], session=session, conditional=conditional, policy=policy, raw=raw)
+        except FetchError as e:
+            return e
+
+def download_rules(rules, max_workers=MAX_WORKERS, per_host_limit=PER_HOST_LIMIT, full_fetch_ids=(),
+                   rate_limiter=None, policy=None):
+    """
+    Downloads many rules concurrently.
+
+    Each host gets one keep-alive session (connection pool) and a semaphore so
+    that no more than `per_host_limit` requests hit it at the same time.
+
+    Args:
+        rules: List of rule dicts (as in tracked_rules.json) with 'id' and 'url'.
+        max_workers: Size of the shared worker pool.
+        per_host_limit: Max in-flight requests per host.
+        full_fetch_ids: Rule IDs to fetch unconditionally (no cached validators).
+        rate_limiter: Optional object whose acquire() is called before each
+            request (e.g. scheduler.RateLimiter for a global request budget).
+        policy: FetchPolicy shared by every fetch in the run (default: a new one).
+
+    Returns:
+        A dict mapping rule_id to whatever download_rule returned for it
+        (text or NOT_MODIFIED), or the FetchError it raised.
+    """
+    hosts = open_host_sessions([rule['url'] for rule in rules], per_host_limit)
+    policy = policy or FetchPolicy()
+
+    def fetch(rule):
+        try:
+            return fetch_rule_page(rule, hosts, conditional=rule['id'] not in full_fetch_ids,
+                                   rate_limiter=rate_limiter, policy=policy)
+        finally:
+            # get_fetch_validators opened a connection on this pool thread
+            close_connection()
+
+    start = time.perf_counter()
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, max_workers)) as pool:
+            results = dict(zip([r['id'] for r in rules], pool.map(fetch, rules)))
+    finally:
+        close_host_sessions(hosts)
+
+    outcomes = [fetch_outcome(result) for result in results.values()]
+    print(f"Fetched {len(results)} rules from {len(hosts)} host(s) in {time.perf_counter() - start:.1f}s "
+          f"({outcomes.count('blocked')} blocked, {outcomes.count('failed')} failed).")
+    return results
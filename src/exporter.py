@@ -0,0 +1,172 @@
+# src/exporter.py
+
+import datetime
+import gzip
+import hashlib
+import json
+import os
+from importlib.util import find_spec
+from src.database_manager import (get_export_watermark, get_previous_version_id, get_version_diff, get_version_text,
+                                  iter_versions, set_export_watermark)
+
+EXPORT_DIR = 'exports'
+
+# Versions per output file (one Parquet row group). Only one chunk is buffered
+# at a time, so memory is bounded by this rather than by the archive size.
+CHUNK_VERSIONS = 500
+
+# Parquet needs pyarrow, which is optional; JSONL is always available
+PARQUET_AVAILABLE = find_spec('pyarrow') is not None
+
+MANIFEST_NAME = 'manifest.json'
+
+def export_history(out_dir: str = None, fmt: str = 'jsonl', include_diffs: bool = False, incremental: bool = False,
+                   rule_ids=None, chunk_size: int = CHUNK_VERSIONS):
+    """
+    Streams the archived version history to chunked files plus a manifest.
+
+    Versions are read rule by rule through a cursor and written chunk_size
+    at a time as gzip-compressed JSONL (versions-00001.jsonl.gz, ...) or
+    Parquet, so memory stays flat however large the archive is. Each record
+    carries the sha256 of its text, and manifest.json lists every file with
+    its sha256, size and row count.
+
+    Args:
+        out_dir: Directory to write (default: exports/<UTC timestamp>).
+        fmt: 'jsonl' or 'parquet' (falls back to JSONL without pyarrow).
+        include_diffs: Add the line diff (opcodes and counts) against each
+            version's predecessor, taken from diff_cache when precomputed.
+        incremental: Only export versions added since the last export's
+            watermark.
+        rule_ids: Restrict the export to these rules. Partial exports do not
+            move the watermark.
+        chunk_size: Versions per output file.
+
+    Returns:
+        The manifest dict (also written to out_dir/manifest.json).
+    """
+    if fmt == 'parquet' and not PARQUET_AVAILABLE:
+        print("pyarrow is not installed; exporting gzip JSONL instead.")
+        fmt = 'jsonl'
+    started = datetime.datetime.now(datetime.timezone.utc)
+    out_dir = out_dir or os.path.join(EXPORT_DIR, started.strftime('%Y%m%dT%H%M%SZ'))
+    os.makedirs(out_dir, exist_ok=True)
+    since = get_export_watermark() if incremental else 0
+
+    files = []
+    chunk = []
+    watermark = since
+    previous = (None, None)   # (rule_id, version_id) of the last version seen, for diffs
+    for version_id, rule_id, check_date, summary in iter_versions(after_id=since, rule_ids=rule_ids):
+        text = get_version_text(version_id)
+        record = {
+            'version_id': version_id,
+            'rule_id': rule_id,
+            'check_date': check_date,
+            'change_summary': summary,
+            'text': text,
+            'text_sha256': hashlib.sha256(text.encode('utf-8')).hexdigest(),
+        }
+        if include_diffs:
+            # The first version of a rule in an incremental export diffs against an older one
+            base_id = previous[1] if previous[0] == rule_id else get_previous_version_id(rule_id, version_id)
+            record.update(_diff_fields(base_id, version_id))
+        chunk.append(record)
+        previous = (rule_id, version_id)
+        watermark = max(watermark, version_id)
+        if len(chunk) >= chunk_size:
+            files.append(_write_chunk(out_dir, len(files) + 1, chunk, fmt, include_diffs))
+            chunk = []
+    if chunk:
+        files.append(_write_chunk(out_dir, len(files) + 1, chunk, fmt, include_diffs))
+
+    manifest = {
+        'created_at': started.isoformat(),
+        'format': fmt,
+        'include_diffs': include_diffs,
+        'incremental': incremental,
+        'rule_ids': sorted(rule_ids) if rule_ids is not None else None,
+        'since_version_id': since,
+        'watermark': watermark,
+        'versions': sum(entry['rows'] for entry in files),
+        'files': files,
+    }
+    with open(os.path.join(out_dir, MANIFEST_NAME), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2)
+    # Only a complete, unfiltered export may advance the watermark
+    if rule_ids is None and watermark > since:
+        set_export_watermark(watermark)
+    print(f"Exported {manifest['versions']} version(s) in {len(files)} file(s) to {out_dir} "
+          f"(watermark {since} -> {watermark}).")
+    return manifest
+
+def _diff_fields(base_id, version_id):
+    if base_id is None:
+        return {'previous_version_id': None, 'opcodes': None, 'lines_added': None, 'lines_removed': None}
+    diff = get_version_diff(base_id, version_id)
+    return {'previous_version_id': base_id, 'opcodes': [list(op) for op in diff['opcodes']],
+            'lines_added': diff['lines_added'], 'lines_removed': diff['lines_removed']}
+
+def _write_chunk(out_dir, number, records, fmt, include_diffs):
+    """Write one chunk of records and return its manifest entry."""
+    extension = 'parquet' if fmt == 'parquet' else 'jsonl.gz'
+    name = f"versions-{number:05d}.{extension}"
+    path = os.path.join(out_dir, name)
+    tmp_path = f"{path}.tmp"
+    if fmt == 'parquet':
+        _write_parquet(tmp_path, records, include_diffs)
+    else:
+        # mtime=0 keeps the gzip header, and so the file hash, reproducible
+        with open(tmp_path, 'wb') as raw, gzip.GzipFile(filename='', mode='wb', fileobj=raw, mtime=0) as gz:
+            for record in records:
+                gz.write(json.dumps(record, ensure_ascii=False).encode('utf-8') + b"\n")
+    os.replace(tmp_path, path)
+    return {
+        'file': name,
+        'rows': len(records),
+        'first_version_id': min(record['version_id'] for record in records),
+        'last_version_id': max(record['version_id'] for record in records),
+        'bytes': os.path.getsize(path),
+        'sha256': file_sha256(path),
+    }
+
+def _write_parquet(path, records, include_diffs):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    columns = {key: [record[key] for record in records]
+               for key in ('version_id', 'rule_id', 'check_date', 'change_summary', 'text', 'text_sha256')}
+    if include_diffs:
+        columns['previous_version_id'] = [record['previous_version_id'] for record in records]
+        # Opcodes are kept as compact JSON rather than a nested list column
+        columns['opcodes'] = [json.dumps(record['opcodes'], separators=(',', ':'))
+                              if record['opcodes'] is not None else None for record in records]
+        columns['lines_added'] = [record['lines_added'] for record in records]
+        columns['lines_removed'] = [record['lines_removed'] for record in records]
+    pq.write_table(pa.table(columns), path, compression='zstd')
+
+def file_sha256(path: str) -> str:
+    """sha256 of a file, read in 1 MiB blocks."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def verify_export(out_dir: str):
+    """
+    Check every file listed in an export's manifest against its sha256.
+
+    Returns:
+        The names of missing or mismatched files (empty when the export is intact).
+    """
+    with open(os.path.join(out_dir, MANIFEST_NAME), 'r', encoding='utf-8') as f:
+        manifest = json.load(f)
+    bad = []
+    for entry in manifest['files']:
+        path = os.path.join(out_dir, entry['file'])
+        if not os.path.exists(path) or file_sha256(path) != entry['sha256']:
+            bad.append(entry['file'])
+    return bad
+
+# End of exporter.py
@@ -0,0 +1,120 @@
+# src/extractor.py
+
+from importlib.util import find_spec
+from urllib.parse import urlsplit
+
+# Prefer the C-backed lxml tree builder when it is installed (checked without
+# importing it; BeautifulSoup itself is imported on the first extract_text call)
+PARSER = 'lxml' if find_spec('lxml') else 'html.parser'
+
+# Container text shorter than this is treated as "not found" (falls back to <p> text)
+MIN_CONTAINER_CHARS = 100
+
+# Paragraphs shorter than this are skipped by the fallback (nav links, captions)
+MIN_PARAGRAPH_CHARS = 20
+
+# Extraction profiles: containers are tried in order as (tag, attrs) pairs,
+# with the same matching rules as soup.find(tag, attrs=attrs).
+FINRA_PROFILE = {
+    'name': 'finra',
+    'containers': [
+        ('div', {'class': 'rule-book-content'}),
+        ('div', {'class': 'field-item even'}),
+        ('div', {'id': 'block-system-main'}),
+    ],
+    'paragraph_fallback': True,
+    # Page chrome inside the container (see normalizer.canonicalize)
+    'ignore_patterns': [
+        r'^(rule )?version history$',
+        r'^(download|print) (pdf|rule)$',
+    ],
+}
+
+SEC_PROFILE = {
+    'name': 'sec',
+    'containers': [
+        ('div', {'class': 'article-body'}),
+        ('main', {'id': 'main-content'}),
+        ('article', {}),
+    ],
+    'paragraph_fallback': True,
+    'ignore_patterns': [
+        r'^(return|back) to top$',
+    ],
+}
+
+PROFILES_BY_HOST = {
+    'www.finra.org': FINRA_PROFILE,
+    'finra.org': FINRA_PROFILE,
+    'www.sec.gov': SEC_PROFILE,
+    'sec.gov': SEC_PROFILE,
+}
+
+# Unknown hosts get the selectors the downloader has always used
+DEFAULT_PROFILE = FINRA_PROFILE
+
+def profile_for_url(url):
+    """Returns the extraction profile for a rule URL's host."""
+    return PROFILES_BY_HOST.get(urlsplit(url).netloc.lower(), DEFAULT_PROFILE)
+
+# Combined strainers, built on first use per profile name
+_STRAINERS = {}
+
+def _strainer_for(profile):
+    """
+    Returns a SoupStrainer that admits every container of the profile (and
+    <p>, when it falls back to paragraphs), so one parse serves every selector.
+    """
+    strainer = _STRAINERS.get(profile['name'])
+    if strainer is None:
+        from bs4 import SoupStrainer
+
+        class AnyOf(SoupStrainer):
+            def __init__(self, strainers):
+                super().__init__()
+                self.strainers = strainers
+
+            def allow_tag_creation(self, nsprefix, name, attrs):
+                return any(s.allow_tag_creation(nsprefix, name, attrs) for s in self.strainers)
+
+        parts = [SoupStrainer(tag, attrs=attrs) for tag, attrs in profile['containers']]
+        if profile.get('paragraph_fallback'):
+            parts.append(SoupStrainer('p'))
+        strainer = _STRAINERS[profile['name']] = AnyOf(parts)
+    return strainer
+
+def extract_text(markup, profile=DEFAULT_PROFILE):
+    """
+    Extracts the readable rule text from a page.
+
+    The page is parsed once with a SoupStrainer that admits the profile's
+    containers and <p> elements, so only those subtrees are ever built
+    (navigation, footers and scripts outside them are tokenized but never
+    turned into Tag objects). Containers are then tried in profile order;
+    pages where none yields enough text fall back to the <p> elements.
+
+    Args:
+        markup: The raw page (bytes or str).
+        profile: One of the *_PROFILE dicts (see profile_for_url).
+
+    Returns:
+        The extracted text, or "" when nothing readable was found.
+    """
+    from bs4 import BeautifulSoup
+
+    soup = BeautifulSoup(markup, PARSER, parse_only=_strainer_for(profile))
+    content = ""
+    for tag, attrs in profile['containers']:
+        target = soup.find(tag, attrs=attrs)
+        if target:
+            content = target.get_text(separator='\n').strip()
+            if len(content) >= MIN_CONTAINER_CHARS:
+                return content
+
+    if profile.get('paragraph_fallback'):
+        # Each paragraph's text is built once
+        texts = (p.get_text().strip() for p in soup.find_all('p'))
+        content = "\n\n".join(text for text in texts if len(text) > MIN_PARAGRAPH_CHARS)
+    return content
+
+# End of extractor.py
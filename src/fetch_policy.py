@@ -0,0 +1,299 @@
+# src/fetch_policy.py
+
+import datetime
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlsplit
+from src import metrics
+
+# Per-host token bucket: sustained requests per second and burst size (0 = no limit)
+HOST_RATE_PER_S = 4.0
+HOST_BURST = 8
+
+# Transient failures (these statuses, connection resets, truncated bodies, timeouts) are retried
+# with exponential backoff and full jitter, honouring Retry-After when given
+MAX_RETRIES = 3
+BACKOFF_BASE_S = 1.0
+BACKOFF_MAX_S = 30.0
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+# A Retry-After longer than this is not waited out: the host fails fast until then
+MAX_RETRY_AFTER_S = 120
+
+# Circuit breaker: consecutive failed fetches (after retries) against a host
+# before its requests fail fast, and how long it stays open before one trial request
+BREAKER_THRESHOLD = 3
+BREAKER_COOLDOWN_S = 600
+
+# (connect, read) timeouts per attempt
+CONNECT_TIMEOUT = 5
+READ_TIMEOUT = 15
+
+# Check outcomes, as stored in rule_status.last_outcome and used by the scheduler
+CHANGED = 'changed'
+UNCHANGED = 'unchanged'
+FAILED = 'failed'
+BLOCKED = 'blocked'
+
+class FetchError(Exception):
+    """A rule page could not be fetched or yielded no rule text."""
+    outcome = FAILED
+
+class BlockedError(FetchError):
+    """The site refused the automated request (HTTP 403)."""
+    outcome = BLOCKED
+
+class ThrottledError(BlockedError):
+    """The site kept rate-limiting us (HTTP 429) past the retry budget."""
+
+class EmptyPageError(FetchError):
+    """The page loaded but no readable rule text could be extracted."""
+
+class ConnectionFailedError(FetchError):
+    """Network failure, timeout or an HTTP error status."""
+
+class CircuitOpenError(FetchError):
+    """Skipped without a request: the host's circuit breaker is open."""
+
+    def __init__(self, message, outcome=FAILED):
+        super().__init__(message)
+        self.outcome = outcome   # Why the breaker opened: 'blocked' or 'failed'
+
+class TokenBucket:
+    """Allows `rate` acquire() calls per second on average, in bursts of up to `burst`, across threads."""
+
+    def __init__(self, rate=HOST_RATE_PER_S, burst=HOST_BURST):
+        self.rate = rate
+        self.burst = max(1, burst)
+        self.tokens = float(self.burst)
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        with self.lock:
+            now = time.monotonic()
+            wait = self.paused_until - now
+            if self.rate:
+                self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                # Take the token now (possibly going negative) and sleep off the debt outside the lock
+                self.tokens -= 1
+                if self.tokens < 0:
+                    wait = max(wait, -self.tokens / self.rate)
+        if wait > 0:
+            metrics.incr('host_rate_waits')
+            time.sleep(wait)
+
+    def pause(self, seconds):
+        """Hold every request to this host for `seconds` (e.g. a Retry-After)."""
+        with self.lock:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+class CircuitBreaker:
+    """
+    Closed until `threshold` consecutive failures, then open (fail fast) for
+    `cooldown` seconds, then half-open: one trial request decides whether it
+    closes again or re-opens.
+    """
+
+    def __init__(self, threshold=BREAKER_THRESHOLD, cooldown=BREAKER_COOLDOWN_S):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.open_until = None
+        self.trial_in_flight = False
+        self.last_outcome = FAILED
+        self.lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self.lock:
+            if self.open_until is None:
+                return True
+            if time.monotonic() < self.open_until or self.trial_in_flight:
+                return False
+            self.trial_in_flight = True
+            return True
+
+    def tripped(self) -> bool:
+        """Whether the breaker is open right now (not counting a half-open trial)."""
+        with self.lock:
+            return self.open_until is not None and time.monotonic() < self.open_until
+
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+            self.open_until = None
+            self.trial_in_flight = False
+
+    def release_trial(self):
+        """Drop a half-open trial that ended without a verdict, so the next request can try again."""
+        with self.lock:
+            self.trial_in_flight = False
+
+    def record_failure(self, outcome=FAILED):
+        with self.lock:
+            self.failures += 1
+            self.last_outcome = outcome
+            if self.trial_in_flight or self.failures >= self.threshold:
+                if self.open_until is None:
+                    metrics.incr('circuits_opened')
+                self.open_until = time.monotonic() + self.cooldown
+                self.trial_in_flight = False
+
+    def trip(self, seconds, outcome=BLOCKED):
+        """Open immediately for `seconds` (the host asked us to stay away that long)."""
+        with self.lock:
+            if self.open_until is None:
+                metrics.incr('circuits_opened')
+            self.last_outcome = outcome
+            self.open_until = max(self.open_until or 0.0, time.monotonic() + seconds)
+            self.trial_in_flight = False
+
+def backoff_delay(attempt, rng=random, base=BACKOFF_BASE_S, cap=BACKOFF_MAX_S):
+    """Full-jitter exponential backoff: uniform in [0, min(cap, base * 2**attempt)]."""
+    return rng.uniform(0, min(cap, base * 2 ** attempt))
+
+def parse_retry_after(value, now=None):
+    """Seconds to wait from a Retry-After header (delta-seconds or HTTP-date), or None."""
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        when = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    now = now or datetime.datetime.now(datetime.timezone.utc)
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=datetime.timezone.utc)
+    return max(0.0, (when - now).total_seconds())
+
+class FetchPolicy:
+    """
+    How one run talks to each host: a token bucket and a circuit breaker per
+    host, plus retries for transient failures. Create one per run and share
+    it between fetch threads; breakers stay open for the rest of the run
+    (or until BREAKER_COOLDOWN_S) once a host keeps failing.
+    """
+
+    def __init__(self, host_rate=HOST_RATE_PER_S, host_burst=HOST_BURST, max_retries=MAX_RETRIES,
+                 breaker_threshold=BREAKER_THRESHOLD, breaker_cooldown=BREAKER_COOLDOWN_S,
+                 max_retry_after=MAX_RETRY_AFTER_S, timeout=(CONNECT_TIMEOUT, READ_TIMEOUT),
+                 backoff_base=BACKOFF_BASE_S, rng=None):
+        self.host_rate = host_rate
+        self.host_burst = host_burst
+        self.max_retries = max_retries
+        self.breaker_threshold = breaker_threshold
+        self.breaker_cooldown = breaker_cooldown
+        self.max_retry_after = max_retry_after
+        self.timeout = timeout
+        self.backoff_base = backoff_base
+        self.rng = rng or random.Random()
+        self.buckets = {}
+        self.breakers = {}
+        self.lock = threading.Lock()
+
+    def _host(self, host):
+        with self.lock:
+            if host not in self.buckets:
+                self.buckets[host] = TokenBucket(self.host_rate, self.host_burst)
+                self.breakers[host] = CircuitBreaker(self.breaker_threshold, self.breaker_cooldown)
+            return self.buckets[host], self.breakers[host]
+
+    def get(self, session, url, headers):
+        """
+        GET a URL under the policy.
+
+        Returns the final response; statuses are left to the caller, so an
+        exhausted retry returns the last 429/5xx response and a 403 is
+        returned as is. The breaker counts fetches, not attempts: only a
+        fetch that still failed after its retries (or a 403) counts against
+        the host.
+
+        Raises:
+            CircuitOpenError: The host is failing fast; no request was sent.
+            requests.RequestException: Connection failure, reset or timeout on
+                the last attempt, or a request error not worth retrying
+                (e.g. an invalid URL or a redirect loop).
+        """
+        host = urlsplit(url).netloc
+        bucket, breaker = self._host(host)
+        if not breaker.allow():
+            metrics.incr('circuit_open_skips')
+            raise CircuitOpenError(f"Skipped: {host} is failing, circuit open for the rest of the run.",
+                                   outcome=breaker.last_outcome)
+        try:
+            return self._get(session, url, headers, host, bucket, breaker)
+        except BaseException:
+            # Anything not already counted (e.g. Ctrl+C) must not leave a half-open breaker stuck
+            breaker.release_trial()
+            raise
+
+    def _get(self, session, url, headers, host, bucket, breaker):
+        """The retry loop of get(), once the breaker has let the fetch through."""
+        import requests
+        attempt = 0
+        while True:
+            bucket.acquire()
+            retry_after = None
+            try:
+                response = (session or requests).get(url, headers=headers, timeout=self.timeout)
+            except (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError):
+                if attempt >= self.max_retries:
+                    breaker.record_failure(FAILED)
+                    raise
+            except requests.RequestException:
+                # Retrying cannot help, but the fetch still failed against this host
+                breaker.record_failure(FAILED)
+                raise
+            else:
+                status = response.status_code
+                if status == 403:
+                    breaker.record_failure(BLOCKED)
+                    return response
+                if status not in RETRY_STATUSES:
+                    breaker.record_success()
+                    return response
+                retry_after = parse_retry_after(response.headers.get('Retry-After'))
+                outcome = BLOCKED if status == 429 else FAILED
+                if retry_after is not None and retry_after > self.max_retry_after:
+                    # Told to stay away longer than we are willing to wait
+                    breaker.trip(retry_after, outcome)
+                    return response
+                if attempt >= self.max_retries:
+                    breaker.record_failure(outcome)
+                    return response
+            # Stop retrying as soon as other fetches have given up on the host
+            if breaker.tripped():
+                metrics.incr('circuit_open_skips')
+                raise CircuitOpenError(f"Gave up on {host}: circuit opened while retrying.",
+                                       outcome=breaker.last_outcome)
+            delay = backoff_delay(attempt, self.rng, self.backoff_base)
+            if retry_after is not None:
+                # The whole host waits, not just this request
+                delay = retry_after + delay / 4
+                bucket.pause(retry_after)
+            attempt += 1
+            metrics.incr('fetch_retries')
+            time.sleep(delay)
+
+def fetch_outcome(result):
+    """
+    Typed outcome of a fetch that did not yield new text.
+
+    Returns:
+        'unchanged' for the downloader's NOT_MODIFIED, 'blocked' or 'failed'
+        for a FetchError (or an empty page), and None for text that still has
+        to be compared against the archive.
+    """
+    if isinstance(result, FetchError):
+        return result.outcome
+    if isinstance(result, str):
+        return None if result else FAILED
+    return UNCHANGED if result is not None else FAILED
+
+# End of fetch_policy.py
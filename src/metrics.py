@@ -0,0 +1,200 @@
+# src/metrics.py
+
+import json
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime
+
+LOG_DIR = 'logs'
+EVENTS_LOG = os.path.join(LOG_DIR, 'metrics.jsonl')   # One line per span, plus the run summary
+RUNS_LOG = os.path.join(LOG_DIR, 'runs.jsonl')        # Run summaries only (read by the dashboard)
+PROM_FILE = os.path.join(LOG_DIR, 'tracker.prom')     # Prometheus textfile-collector format
+PROM_PREFIX = 'regulatory_harmony'
+
+# Rules listed in a run summary's 'slowest_rules'
+SLOWEST_RULES = 10
+
+_lock = threading.Lock()
+_scope = threading.local()   # Rule the current thread is working on (see rule_scope)
+_run = None                  # State of the run in progress, or None
+
+@contextmanager
+def rule_scope(rule_id):
+    """Attribute spans and counters recorded on this thread to rule_id."""
+    previous = getattr(_scope, 'rule_id', None)
+    _scope.rule_id = rule_id
+    try:
+        yield
+    finally:
+        _scope.rule_id = previous
+
+def start_run():
+    """Begin collecting spans and counters for a tracker run."""
+    global _run
+    with _lock:
+        _run = {
+            'run_id': uuid.uuid4().hex[:12],
+            'started_at': datetime.now().isoformat(),
+            'start': time.perf_counter(),
+            'events': [],
+            'stages': {},    # stage -> [calls, seconds]
+            'counters': {},
+            'rules': {},     # rule_id -> {stage: seconds}
+        }
+    return _run['run_id']
+
+@contextmanager
+def span(stage, rule_id=None):
+    """
+    Time a stage (fetch, extract, diff, ner, report, db...). Outside a run
+    this only costs the clock reads.
+
+    Args:
+        stage: Stage name.
+        rule_id: Rule the time is charged to; defaults to the thread's rule_scope.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        _record(stage, time.perf_counter() - start, rule_id or getattr(_scope, 'rule_id', None))
+
+def incr(counter, value=1):
+    """Add value to a run counter (bytes_fetched, lines_added, ner_cache_hits...)."""
+    with _lock:
+        if _run is not None:
+            _run['counters'][counter] = _run['counters'].get(counter, 0) + value
+
+def rule_timings():
+    """Seconds per stage for each rule recorded so far in the current run."""
+    with _lock:
+        if _run is None:
+            return {}
+        return {rule_id: dict(stages) for rule_id, stages in _run['rules'].items()}
+
+def export_run():
+    """
+    End the current run without writing any logs and return its raw spans and
+    counters, for a worker process to hand back to its parent (see merge_run).
+    """
+    global _run
+    with _lock:
+        run, _run = _run, None
+    if run is None:
+        return None
+    return {key: run[key] for key in ('events', 'counters')}
+
+def merge_run(exported):
+    """Fold the spans and counters returned by export_run into the current run."""
+    if not exported:
+        return
+    for event in exported['events']:
+        _record(event['stage'], event['seconds'], event['rule_id'])
+    for counter, value in exported['counters'].items():
+        incr(counter, value)
+
+def _record(stage, seconds, rule_id):
+    with _lock:
+        if _run is None:
+            return
+        totals = _run['stages'].setdefault(stage, [0, 0.0])
+        totals[0] += 1
+        totals[1] += seconds
+        if rule_id is not None:
+            per_rule = _run['rules'].setdefault(rule_id, {})
+            per_rule[stage] = per_rule.get(stage, 0.0) + seconds
+        _run['events'].append({'type': 'span', 'run_id': _run['run_id'], 'rule_id': rule_id,
+                               'stage': stage, 'seconds': round(seconds, 6)})
+
+def finish_run(status='ok'):
+    """
+    End the current run: append its spans and summary to the JSON-lines logs
+    and rewrite the Prometheus textfile.
+
+    Args:
+        status: 'ok', or 'error' when the run was aborted.
+
+    Returns:
+        The run summary dict, or None when no run was started.
+    """
+    global _run
+    with _lock:
+        run, _run = _run, None
+    if run is None:
+        return None
+
+    slowest = sorted(run['rules'].items(), key=lambda item: sum(item[1].values()), reverse=True)[:SLOWEST_RULES]
+    summary = {
+        'type': 'run_summary',
+        'run_id': run['run_id'],
+        'started_at': run['started_at'],
+        'finished_at': datetime.now().isoformat(),
+        'status': status,
+        'duration_s': round(time.perf_counter() - run['start'], 3),
+        'stages': {stage: {'calls': calls, 'seconds': round(seconds, 4)}
+                   for stage, (calls, seconds) in sorted(run['stages'].items())},
+        'counters': dict(sorted(run['counters'].items())),
+        'slowest_rules': [{'rule_id': rule_id, 'seconds': round(sum(stages.values()), 4),
+                           'stages': {stage: round(seconds, 4) for stage, seconds in stages.items()}}
+                          for rule_id, stages in slowest],
+    }
+
+    try:
+        os.makedirs(LOG_DIR, exist_ok=True)
+        with open(EVENTS_LOG, 'a', encoding='utf-8') as f:
+            for event in run['events']:
+                f.write(json.dumps(event) + "\n")
+            f.write(json.dumps(summary) + "\n")
+        with open(RUNS_LOG, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(summary) + "\n")
+        write_prometheus(summary)
+    except OSError as e:
+        print(f"Error writing metrics: {e}")
+    return summary
+
+def write_prometheus(summary, path=PROM_FILE):
+    """Write a run summary as gauges in Prometheus text format (atomic replace)."""
+    lines = [
+        f"# HELP {PROM_PREFIX}_run_duration_seconds Wall time of the last tracker run.",
+        f"# TYPE {PROM_PREFIX}_run_duration_seconds gauge",
+        f"{PROM_PREFIX}_run_duration_seconds {summary['duration_s']}",
+        f"# HELP {PROM_PREFIX}_run_success Whether the last tracker run completed (1) or failed (0).",
+        f"# TYPE {PROM_PREFIX}_run_success gauge",
+        f"{PROM_PREFIX}_run_success {1 if summary['status'] == 'ok' else 0}",
+        f"# HELP {PROM_PREFIX}_last_run_timestamp_seconds Unix time the last tracker run finished.",
+        f"# TYPE {PROM_PREFIX}_last_run_timestamp_seconds gauge",
+        f"{PROM_PREFIX}_last_run_timestamp_seconds {int(time.time())}",
+        f"# HELP {PROM_PREFIX}_stage_seconds Time spent per stage in the last run.",
+        f"# TYPE {PROM_PREFIX}_stage_seconds gauge",
+    ]
+    lines += [f'{PROM_PREFIX}_stage_seconds{{stage="{stage}"}} {s["seconds"]}' for stage, s in summary['stages'].items()]
+    lines += [f"# HELP {PROM_PREFIX}_stage_calls Calls per stage in the last run.",
+              f"# TYPE {PROM_PREFIX}_stage_calls gauge"]
+    lines += [f'{PROM_PREFIX}_stage_calls{{stage="{stage}"}} {s["calls"]}' for stage, s in summary['stages'].items()]
+    for counter, value in summary['counters'].items():
+        lines += [f"# TYPE {PROM_PREFIX}_{counter} gauge", f"{PROM_PREFIX}_{counter} {value}"]
+
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write("\n".join(lines) + "\n")
+    os.replace(tmp_path, path)
+
+def read_run_summaries(limit=50, path=RUNS_LOG):
+    """The most recent run summaries, oldest first (empty when no run was logged)."""
+    try:
+        with open(path, encoding='utf-8') as f:
+            lines = f.readlines()[-limit:]
+    except FileNotFoundError:
+        return []
+    summaries = []
+    for line in lines:
+        try:
+            summaries.append(json.loads(line))
+        except json.JSONDecodeError:
+            continue  # Partially written line from an interrupted run
+    return summaries
+
+# End of metrics.py
@@ -0,0 +1,54 @@
+# src/normalizer.py
+
+import re
+import unicodedata
+from functools import lru_cache
+
+# Invisible characters that come and go with CMS edits
+ZERO_WIDTH = dict.fromkeys(map(ord, '\u200b\u200c\u200d\u2060\ufeff'))
+
+# Runs of horizontal whitespace inside a line (NFKC has already turned NBSPs into spaces)
+INLINE_SPACE = re.compile(r'[ \t\f\v]+')
+
+# Lines dropped for every site: page chrome that changes without the rule changing
+COMMON_IGNORE_PATTERNS = [
+    r'^(page )?last (updated|modified|reviewed)\b.*$',
+    r'^print( this page)?$',
+    r'^share( this page)?$',
+]
+
+def canonicalize(text, profile=None):
+    """
+    Reduces extracted rule text to a canonical form so only real wording
+    changes produce a new hash.
+
+    Steps: Unicode NFKC (non-breaking and other fancy spaces become plain
+    spaces), zero-width characters removed, whitespace collapsed and
+    stripped per line, and blank lines plus banner lines matching
+    COMMON_IGNORE_PATTERNS or the profile's 'ignore_patterns' dropped.
+
+    Args:
+        text: Text returned by extractor.extract_text (or an archived version).
+        profile: The site's extraction profile (see extractor.profile_for_url).
+
+    Returns:
+        The canonical text.
+    """
+    text = unicodedata.normalize('NFKC', text).translate(ZERO_WIDTH)
+    ignore = _compile(tuple(COMMON_IGNORE_PATTERNS) + tuple((profile or {}).get('ignore_patterns', ())))
+
+    lines = []
+    for line in text.splitlines():
+        line = INLINE_SPACE.sub(' ', line).strip()
+        # Blank lines come and go with get_text(separator='\n') reflow
+        if not line or ignore.match(line):
+            continue
+        lines.append(line)
+    return "\n".join(lines)
+
+@lru_cache(maxsize=None)
+def _compile(patterns):
+    """One case-insensitive alternation per pattern set, compiled once."""
+    return re.compile('|'.join(f'(?:{p})' for p in patterns), re.IGNORECASE)
+
+# End of normalizer.py
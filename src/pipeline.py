@@ -0,0 +1,322 @@
+# src/pipeline.py
+
+import multiprocessing
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from typing import NamedTuple, Optional
+from src import database_manager, metrics
+from src.database_manager import (batch, close_connection, get_pending_reports, has_baseline, hash_text, init_db,
+                                  log_new_version, record_check, save_report, set_latest_hash)
+from src.analyzer import analyze_changes_batch, save_cache_writes, BATCH_SIZE
+from src.comparator import compare_text, load_baseline, BASELINE_CHANGED, BASELINE_FORMATTING, BASELINE_MISSING
+from src.diff_engine import LineDiff, count_changes
+from src.downloader import (NOT_MODIFIED, FetchError, MAX_WORKERS, PER_HOST_LIMIT, close_host_sessions,
+                            commit_fetch_validators, fetch_rule_page, open_host_sessions, parse_page)
+from src.fetch_policy import FAILED, FetchPolicy, fetch_outcome
+from src.segmenter import change_summary, diff_sections
+
+# CPU stage worker processes (extraction, diff, NER, report rendering); defaults to every core
+CPU_WORKERS = os.cpu_count() or 1
+
+# Fetched pages waiting for the CPU stage. Fetchers block when it is full,
+# so a slow CPU stage throttles the network instead of buffering pages in memory.
+FETCH_QUEUE_SIZE = 32
+
+# Pages handed to the process pool but not yet analyzed, per CPU worker
+MAX_IN_FLIGHT_PER_WORKER = 2
+
+# The writer commits after this many results, or as soon as its queue runs dry
+WRITE_BATCH_SIZE = 50
+
+_DONE = object()   # End-of-stream marker on the stage queues
+
+class PageResult(NamedTuple):
+    """What the CPU stage made of one fetched page (see analyze_page)."""
+    rule_id: str
+    status: str                            # A comparator BASELINE_* status, or FAILED when no text was extracted
+    text: Optional[str] = None             # The page's canonical rule text
+    error: Optional[FetchError] = None     # Why extraction failed
+    diff: Optional[LineDiff] = None
+    changes: Optional[list] = None
+    analysis: Optional[dict] = None
+    sections: Optional[list] = None
+    section_summary: Optional[str] = None
+    as_stored: bool = True                 # See comparator.Baseline
+    cache_writes: Optional[dict] = None    # Entity-cache updates for the writer (see analyzer.save_cache_writes)
+    exported: Optional[dict] = None        # The worker's metrics (see metrics.export_run)
+
+class WriteJob(NamedTuple):
+    """One rule's writes, applied by the writer thread."""
+    rule_id: str
+    text: Optional[str] = None             # New version to archive, if any
+    summary: Optional[str] = None
+    is_change: bool = False                # Queue a redline report for the new version
+    diff: Optional[LineDiff] = None        # Cached for the new version when it indexes the archived lines
+    analysis: Optional[dict] = None
+    sections: Optional[list] = None
+    latest_hash: Optional[str] = None      # Canonical hash for a formatting-only baseline
+    cache_writes: Optional[dict] = None
+
+def _init_worker(db_path):
+    # Spawned workers re-import database_manager, so point them at the parent's
+    # database; read-only, since every write goes through the writer thread
+    init_db(db_path, read_only=True)
+
+def analyze_page(rule, body, nlp_batch_size):
+    """
+    CPU stage, run in a worker process: extracts the rule text of a fetched
+    page and compares it with the archive; a real change also gets its
+    section diff, change extraction and NER. Nothing is written here.
+
+    Returns:
+        A PageResult.
+    """
+    rule_id = rule['id']
+    metrics.start_run()
+    with metrics.rule_scope(rule_id):
+        try:
+            text = parse_page(rule['url'], body)
+        except FetchError as e:
+            return PageResult(rule_id, FAILED, error=e, exported=metrics.export_run())
+        except Exception as e:
+            return PageResult(rule_id, FAILED, error=FetchError(f"Extraction Error: {e}"),
+                              exported=metrics.export_run())
+        baseline = load_baseline(rule, text, upgrade_hash=False)
+        if baseline.status != BASELINE_CHANGED:
+            return PageResult(rule_id, baseline.status, text, exported=metrics.export_run())
+        with metrics.span('diff'):
+            diff, sections, section_summary = diff_sections(baseline.text, text, baseline.sections)
+            changes = compare_text(baseline.text, text, diff=diff)
+        analysis = None
+        cache_writes = {}
+        if changes:
+            analysis = analyze_changes_batch({rule_id: changes}, batch_size=nlp_batch_size or BATCH_SIZE,
+                                             n_process=1, cache_writes=cache_writes)[rule_id]
+    return PageResult(rule_id, BASELINE_CHANGED, text, None, diff, changes, analysis, sections, section_summary,
+                      baseline.as_stored, cache_writes, metrics.export_run())
+
+def settle_page(result):
+    """
+    Decides a rule's outcome from its PageResult.
+
+    Returns:
+        (outcome, WriteJob or None when there is nothing to write).
+    """
+    rule_id = result.rule_id
+    if result.status == FAILED:
+        print(f"[{rule_id}] Skipping due to download failure. {result.error}")
+        metrics.incr('fetch_failures')
+        return 'failed', None
+    if result.status == BASELINE_MISSING:
+        print(f"[{rule_id}] No baseline found. Initializing...")
+        metrics.incr('baselines_created')
+        return 'unchanged', WriteJob(rule_id, result.text, "Initial Baseline Version")
+    if result.status == BASELINE_FORMATTING:
+        return 'unchanged', WriteJob(rule_id, latest_hash=hash_text(result.text))
+    if result.status != BASELINE_CHANGED or not result.changes:
+        print(f"[{rule_id}] No changes detected.")
+        return 'unchanged', None
+    print(f"[{rule_id}] ALERT: Changes detected!" +
+          (f" Sections: {result.section_summary}" if result.section_summary else ""))
+    metrics.incr('rules_changed')
+    lines_added, lines_removed = count_changes(result.diff.opcodes)
+    metrics.incr('lines_added', lines_added)
+    metrics.incr('lines_removed', lines_removed)
+    # A diff against a re-canonicalized baseline is not cached: log_new_version rediffs the archived text
+    return 'changed', WriteJob(rule_id, result.text, change_summary(result.section_summary), True,
+                               result.diff if result.as_stored else None, result.analysis, result.sections,
+                               cache_writes=result.cache_writes)
+
+def render_report_job(version_a, version_b, compress):
+    """
+    CPU stage, run in a worker process: render one queued redline report.
+
+    Returns:
+        ((rule_id, path, size) for save_report, or None on failure; exported metrics).
+    """
+    from src.reporter import write_version_report
+
+    metrics.start_run()
+    rendered = None
+    try:
+        rendered = write_version_report(version_a, version_b, compress=compress)
+    except (OSError, TypeError) as e:
+        print(f"Error rendering report {version_a}->{version_b}: {e}")
+    return rendered, metrics.export_run()
+
+def run_pipeline(rules, max_workers=MAX_WORKERS, per_host_limit=PER_HOST_LIMIT, cpu_workers=CPU_WORKERS,
+                 nlp_batch_size=None, rate_limiter=None, render_reports=True, compress_reports=False, policy=None):
+    """
+    Checks a list of rules as a staged pipeline:
+
+        fetcher threads -> process pool -> writer thread
+
+    Fetchers stream raw pages into a bounded queue, and this thread hands
+    each one to the process pool, with at most MAX_IN_FLIGHT_PER_WORKER
+    pages per worker outstanding. Workers extract the rule text, answer
+    unchanged rules from the stored hashes and diff and run NER on real
+    changes. They only read the database: new versions, hash upgrades and
+    entity-cache entries all go to a single writer thread that commits them
+    in batches. Queued redline reports are then rendered on the same pool.
+    Memory stays bounded by the queue sizes rather than the number of rules.
+
+    The caller owns the surrounding metrics run; unlike check_rules, no
+    batch() is needed because the writer commits its own batches.
+
+    Returns:
+        A dict mapping each rule_id to 'changed', 'unchanged', 'blocked' or
+        'failed'. Rules whose write batch rolled back are 'failed'.
+    """
+    cpu_workers = max(1, cpu_workers)
+    fetched = queue.Queue(maxsize=FETCH_QUEUE_SIZE)
+    todo = queue.Queue()
+    to_write = queue.Queue()
+    in_flight = threading.BoundedSemaphore(cpu_workers * MAX_IN_FLIGHT_PER_WORKER)
+    state_lock = threading.Lock()   # outcomes and errors, shared with the pool's callback thread
+    outcomes = {}
+    errors = []
+    write_failures = set()          # Rules whose write batch rolled back
+
+    # Rules without a baseline need their full text even if the page is cached
+    full_fetch_ids = {rule['id'] for rule in rules if not has_baseline(rule['id'])}
+    hosts = open_host_sessions([rule['url'] for rule in rules], per_host_limit)
+    policy = policy or FetchPolicy()
+    for rule in rules:
+        todo.put(rule)
+
+    def fetcher():
+        try:
+            while True:
+                try:
+                    rule = todo.get_nowait()
+                except queue.Empty:
+                    return
+                fetched.put((rule, fetch_rule_page(rule, hosts, conditional=rule['id'] not in full_fetch_ids,
+                                                   rate_limiter=rate_limiter, policy=policy, raw=True)))
+        finally:
+            close_connection()
+            fetched.put(_DONE)
+
+    def writer():
+        pending = []
+        done = False
+        while not done:
+            item = to_write.get()
+            while item is not _DONE:
+                pending.append(item)
+                if len(pending) >= WRITE_BATCH_SIZE:
+                    break
+                try:
+                    item = to_write.get_nowait()
+                except queue.Empty:
+                    break
+            done = item is _DONE
+            try:
+                with metrics.span('db_write'), batch():
+                    for job in pending:
+                        if job.text is not None:
+                            log_new_version(job.rule_id, job.text, summary=job.summary, diff=job.diff,
+                                            queue_report=job.is_change, analysis=job.analysis, sections=job.sections)
+                        if job.latest_hash is not None:
+                            set_latest_hash(job.rule_id, job.latest_hash)
+                        if job.cache_writes:
+                            save_cache_writes(job.cache_writes)
+            except Exception as e:
+                with state_lock:
+                    errors.append(e)
+                    write_failures.update(job.rule_id for job in pending)
+            pending = []
+        close_connection()
+
+    def on_analyzed(rule_id, future):
+        # Runs on the pool's callback thread
+        try:
+            outcome, job = settle_page(future.result())
+            metrics.merge_run(future.result().exported)
+        except Exception as e:
+            outcome, job = 'failed', None
+            with state_lock:
+                errors.append(e)
+        with state_lock:
+            outcomes[rule_id] = outcome
+        if job is not None:
+            to_write.put(job)
+        in_flight.release()
+
+    start = time.perf_counter()
+    fetchers = [threading.Thread(target=fetcher, name=f"fetcher-{n}", daemon=True)
+                for n in range(max(1, min(max_workers, len(rules))))]
+    write_thread = threading.Thread(target=writer, name="db-writer", daemon=True)
+    # Workers are spawned, not forked: the fetcher threads hold locks and sockets
+    pool = ProcessPoolExecutor(max_workers=cpu_workers, mp_context=multiprocessing.get_context('spawn'),
+                               initializer=_init_worker, initargs=(database_manager.DB_PATH,))
+    try:
+        write_thread.start()
+        for thread in fetchers:
+            thread.start()
+
+        running = len(fetchers)
+        while running:
+            item = fetched.get()
+            if item is _DONE:
+                running -= 1
+                continue
+            rule, page = item
+            rule_id = rule['id']
+            metrics.incr('rules_checked')
+            if page is NOT_MODIFIED or isinstance(page, FetchError):
+                if isinstance(page, FetchError):
+                    print(f"[{rule_id}] Skipping due to download failure. {page}")
+                    metrics.incr('fetch_failures')
+                with state_lock:
+                    outcomes[rule_id] = fetch_outcome(page)
+                continue
+            in_flight.acquire()   # Backpressure: wait for the pool to catch up
+            pool.submit(analyze_page, rule, page, nlp_batch_size).add_done_callback(partial(on_analyzed, rule_id))
+
+        # Every submitted page releases its slot once its result is queued for the writer
+        for _ in range(cpu_workers * MAX_IN_FLIGHT_PER_WORKER):
+            in_flight.acquire()
+        to_write.put(_DONE)
+        write_thread.join()
+        # Page validators are saved only now, after the writer committed every
+        # version; a rule whose version was rolled back is recorded as failed
+        urls = {rule['id']: rule['url'] for rule in rules}
+        with batch():
+            for rule_id in list(outcomes):
+                if rule_id in write_failures:
+                    outcomes[rule_id] = 'failed'
+                record_check(rule_id, outcomes[rule_id])
+                if outcomes[rule_id] in ('changed', 'unchanged'):
+                    commit_fetch_validators(urls[rule_id])
+
+        pairs = get_pending_reports() if render_reports and not errors else []
+        if pairs:
+            results = list(pool.map(render_report_job, [a for a, _ in pairs], [b for _, b in pairs],
+                                    [compress_reports] * len(pairs)))
+            with batch():
+                for (version_a, version_b), (rendered, exported) in zip(pairs, results):
+                    metrics.merge_run(exported)
+                    if rendered:
+                        rule_id, path, size = rendered
+                        save_report(version_a, version_b, rule_id, path, size)
+                        print(f"[{rule_id}] Report rendered: {path}")
+    finally:
+        pool.shutdown(cancel_futures=True)
+        close_host_sessions(hosts)
+        if write_thread.is_alive():
+            to_write.put(_DONE)
+
+    if errors:
+        raise errors[0]
+    counts = {name: list(outcomes.values()).count(name) for name in ('changed', 'unchanged', 'blocked', 'failed')}
+    print(f"Pipeline checked {len(outcomes)} rule(s) on {cpu_workers} CPU worker(s) in "
+          f"{time.perf_counter() - start:.1f}s: {counts['changed']} changed, {counts['unchanged']} unchanged, "
+          f"{counts['blocked']} blocked, {counts['failed']} failed.")
+    return outcomes
+
+# End of pipeline.py
@@ -1,58 +1,258 @@
 # src/reporter.py
 
 import difflib
+import gzip
+import html
 import os
+import threading
+from bisect import bisect_right
 from datetime import datetime
+from src.diff_engine import compute_diff, grouped_opcodes, LineDiff
+from src.database_manager import (get_report, get_pending_reports, save_report, get_version_info, get_version_text,
+                                  get_version_diff, get_version_sections, close_connection)
+from src.segmenter import covers, section_label, segment
+from src import metrics
 
-def generate_html_report(rule_id, rule_name, old_text, new_text):
+# Lines of unchanged context shown around each change
+CONTEXT_LINES = 5
+
+# Intraline (character-level) highlighting is skipped for lines longer than this
+INTRALINE_MAX_CHARS = 2000
+
+REPORTS_DIR = 'reports'
+
+# Write on-demand reports as .html.gz
+COMPRESS_REPORTS = False
+
+# Seconds the background report worker waits between queue checks
+REPORT_WORKER_POLL_S = 30
+
+PAGE_TEMPLATE = """<!DOCTYPE html>
+<html>
+<head>
+    <meta charset="utf-8" />
+    <title>{title}</title>
+    <style>
+        body {{ font-family: 'Helvetica Neue', Helvetica, Arial, sans-serif; padding: 20px; }}
+        h1 {{ color: #333; }}
+        table.diff {{ font-family: Menlo, Consolas, Monaco, Liberation Mono, Lucida Console, monospace; border: medium; }}
+        table.diff td {{ white-space: pre-wrap; vertical-align: top; }}
+        .diff_header {{ background-color: #e0e0e0; }}
+        td.diff_header {{ text-align: right; }}
+        .diff_add {{ background-color: #d4fcbc; }}
+        .diff_chg {{ background-color: #ffffcc; }}
+        .diff_sub {{ background-color: #ffcccc; }}
+        tbody.diff_hunk {{ border-top: 2px solid #999; }}
+        td.diff_section {{ background-color: #f0f0f0; font-weight: bold; padding: 4px; }}
+    </style>
+</head>
+<body>
+    <table class="diff" cellspacing="0" cellpadding="0" rules="groups">
+        <colgroup></colgroup> <colgroup></colgroup> <colgroup></colgroup> <colgroup></colgroup>
+        <thead><tr><th colspan="2" class="diff_header">{fromdesc}</th><th colspan="2" class="diff_header">{todesc}</th></tr></thead>
+{body}
+    </table>
+</body>
+</html>
+"""
+
+# Everything before and after the hunks; write_report streams the rows in between
+PAGE_HEAD, PAGE_TAIL = PAGE_TEMPLATE.split("{body}\n")
+
+def generate_html_report(rule_id, rule_name, old_text, new_text, diff=None):
     """
     Generates a side-by-side HTML comparison (redline) of the old vs new text.
     Saves the file to the 'reports/' directory.
+
+    Args:
+        diff: A LineDiff already computed for this pair by the tracker (reused,
+            so the texts are not diffed a second time).
     """
     print(f"[{rule_id}] Generating HTML redline report...")
-    
-    # 1. Prepare the Data
-    # difflib expects lists of strings (lines), not big text blocks
-    old_lines = old_text.splitlines()
-    new_lines = new_text.splitlines()
-    
-    # 2. Configure the HTML Generator
-    d = difflib.HtmlDiff()
-    
-    # 3. Generate the HTML content
-    # We provide a custom header and styling tweaks via 'wrapcolumn' if needed
-    html_content = d.make_file(
-        old_lines, 
-        new_lines, 
-        fromdesc=f"Baseline Version ({rule_id})", 
-        todesc=f"New Version ({datetime.now().strftime('%Y-%m-%d')})",
-        context=True,  # Show context lines around changes? (False = show everything)
-        numlines=5     # If context=True, how many lines of context to show
-    )
-    
-    # 4. Save to File
-    filename = f"reports/{rule_id}_CHANGE_REPORT.html"
-    
-    # We can inject a little CSS to make it look modern
-    # The default difflib style is a bit 1990s
-    custom_css = """
-    <style>
-        body { font-family: 'Helvetica Neue', Helvetica, Arial, sans-serif; padding: 20px; }
-        h1 { color: #333; }
-        .diff_header { background-color: #e0e0e0; }
-        td.diff_header { text-align: right; }
-        .diff_next { display: none; }
-        .diff_add { background-color: #d4fcbc; }
-        .diff_chg { background-color: #ffffcc; }
-        .diff_sub { background-color: #ffcccc; }
-    </style>
-    """
-    
-    # Inject CSS into the head
-    html_content = html_content.replace('<head>', f'<head>{custom_css}')
-    
-    with open(filename, 'w', encoding='utf-8') as f:
-        f.write(html_content)
-        
+
+    # Reuse the tracker's line diff when we have one
+    if diff is None:
+        diff = compute_diff(old_text, new_text)
+
+    filename = os.path.join(REPORTS_DIR, f"{rule_id}_CHANGE_REPORT.html")
+    write_report(filename, diff,
+                 title=f"{rule_id} — {rule_name}",
+                 fromdesc=f"Baseline Version ({rule_id})",
+                 todesc=f"New Version ({datetime.now().strftime('%Y-%m-%d')})")
+
     print(f"[{rule_id}] Report saved: {filename}")
     return filename
+
+def render_report(version_a, version_b, rule_name=None, compress=COMPRESS_REPORTS):
+    """
+    Returns the redline report for a pair of archived versions, rendering it
+    on first request. Rendered reports are cached by version pair in the
+    'reports' table, so later requests are a lookup.
+
+    Args:
+        version_a: The baseline version id.
+        version_b: The comparison version id.
+        rule_name: Optional display name for the page title.
+        compress: Write the report gzip-compressed (.html.gz).
+
+    Returns:
+        The report's path on disk.
+    """
+    cached = get_report(version_a, version_b)
+    if cached and cached['status'] == 'ready' and cached['path'] and os.path.exists(cached['path']):
+        return cached['path']
+
+    rule_id, path, size = write_version_report(version_a, version_b, rule_name, compress)
+    save_report(version_a, version_b, rule_id, path, size)
+    print(f"[{rule_id}] Report rendered: {path}")
+    return path
+
+def write_version_report(version_a, version_b, rule_name=None, compress=COMPRESS_REPORTS):
+    """
+    Renders the report file for a pair of archived versions without touching
+    the reports table, so a read-only process can do it (the caller then
+    records it with save_report).
+
+    Returns:
+        (rule_id, path, size in bytes).
+    """
+    rule_id, date_a = get_version_info(version_a)
+    _, date_b = get_version_info(version_b)
+    with metrics.span('report', rule_id):
+        # The pair's opcodes usually come straight from diff_cache
+        opcodes = get_version_diff(version_a, version_b)['opcodes']
+        diff = LineDiff(get_version_text(version_a).splitlines(), get_version_text(version_b).splitlines(), opcodes)
+        path = os.path.join(REPORTS_DIR, f"{rule_id}_v{version_a}_v{version_b}.html" + (".gz" if compress else ""))
+        size = write_report(path, diff,
+                            title=f"{rule_id} — {rule_name}" if rule_name else rule_id,
+                            fromdesc=f"Version {version_a} ({date_a[:10]})",
+                            todesc=f"Version {version_b} ({date_b[:10]})",
+                            compress=compress, sections=get_version_sections(version_b))
+    return rule_id, path, size
+
+def render_pending_reports(limit=None, compress=COMPRESS_REPORTS):
+    """Render every report the tracker has queued. Returns how many were rendered."""
+    rendered = 0
+    for version_a, version_b in get_pending_reports(limit):
+        try:
+            render_report(version_a, version_b, compress=compress)
+            rendered += 1
+        except (OSError, TypeError) as e:
+            # TypeError: one of the versions was deleted after the report was queued
+            print(f"Error rendering report {version_a}->{version_b}: {e}")
+    return rendered
+
+def start_report_worker(poll_interval=REPORT_WORKER_POLL_S, compress=COMPRESS_REPORTS):
+    """
+    Render queued reports on a background thread until the returned
+    threading.Event is set.
+    """
+    stop = threading.Event()
+
+    def work():
+        while not stop.is_set():
+            render_pending_reports(compress=compress)
+            stop.wait(poll_interval)
+        close_connection()
+
+    threading.Thread(target=work, name="report-worker", daemon=True).start()
+    return stop
+
+def write_report(path, diff, title, fromdesc, todesc, compress=False, sections=None):
+    """
+    Streams a redline page to disk one hunk at a time (optionally gzipped).
+    Each hunk is headed by the sections of the new text it changes.
+
+    The page is written to a temporary file and renamed into place, so a
+    reader never sees a half-written report.
+
+    Returns:
+        The size of the written file in bytes.
+    """
+    if not covers(sections, diff.new_lines):
+        sections = segment(diff.new_lines)
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    opener = gzip.open if compress else open
+    with opener(tmp_path, 'wt', encoding='utf-8') as f:
+        f.write(PAGE_HEAD.format(title=html.escape(title), fromdesc=html.escape(fromdesc),
+                                 todesc=html.escape(todesc)))
+        # One <tbody> per hunk, with CONTEXT_LINES of context around changes
+        hunks = 0
+        for group in grouped_opcodes(diff.opcodes, CONTEXT_LINES):
+            f.write('        <tbody class="diff_hunk">\n')
+            labels = _hunk_sections(sections, group)
+            if labels:
+                f.write(f'            <tr><td class="diff_section" colspan="4">{html.escape(labels)}</td></tr>\n')
+            for tag, i1, i2, j1, j2 in group:
+                for row in _render_rows(diff.old_lines, diff.new_lines, tag, i1, i2, j1, j2):
+                    f.write(row + "\n")
+            f.write('        </tbody>\n')
+            hunks += 1
+        if not hunks:
+            f.write('        <tbody><tr><td colspan="4">No Differences Found</td></tr></tbody>\n')
+        f.write(PAGE_TAIL)
+    os.replace(tmp_path, path)
+    return os.path.getsize(path)
+
+def _hunk_sections(sections, group):
+    """Labels of the new-text sections a hunk's changes fall in, e.g. "(c)(1), .02"."""
+    labels = []
+    starts = [section.start for section in sections]
+    for tag, _, _, j1, j2 in group:
+        if tag == 'equal' or not sections:
+            continue
+        # A deletion (j1 == j2) points at the section it was removed from
+        first = max(bisect_right(starts, j1) - 1, 0)
+        last = max(bisect_right(starts, max(j2 - 1, j1)) - 1, 0)
+        for section in sections[first:last + 1]:
+            label = section_label(section.key)
+            if label not in labels:
+                labels.append(label)
+    return ", ".join(labels)
+
+def _render_rows(old_lines, new_lines, tag, i1, i2, j1, j2):
+    """Yield the table rows for one opcode."""
+    if tag == 'equal':
+        for offset in range(i2 - i1):
+            line = html.escape(old_lines[i1 + offset])
+            yield _row(i1 + offset + 1, line, j1 + offset + 1, line)
+    elif tag == 'delete':
+        for i in range(i1, i2):
+            yield _row(i + 1, _mark(html.escape(old_lines[i]), 'diff_sub'), '', '')
+    elif tag == 'insert':
+        for j in range(j1, j2):
+            yield _row('', '', j + 1, _mark(html.escape(new_lines[j]), 'diff_add'))
+    else:
+        # Pair replaced lines up side by side; leftovers are pure deletes/inserts
+        for offset in range(max(i2 - i1, j2 - j1)):
+            i, j = i1 + offset, j1 + offset
+            if i < i2 and j < j2:
+                old_html, new_html = _intraline(old_lines[i], new_lines[j])
+                yield _row(i + 1, old_html, j + 1, new_html)
+            elif i < i2:
+                yield _row(i + 1, _mark(html.escape(old_lines[i]), 'diff_sub'), '', '')
+            else:
+                yield _row('', '', j + 1, _mark(html.escape(new_lines[j]), 'diff_add'))
+
+def _row(old_num, old_html, new_num, new_html):
+    return (f'            <tr><td class="diff_header">{old_num}</td><td>{old_html}</td>'
+            f'<td class="diff_header">{new_num}</td><td>{new_html}</td></tr>')
+
+def _mark(escaped, css_class):
+    return f'<span class="{css_class}">{escaped}</span>' if escaped else ''
+
+def _intraline(old, new):
+    """Highlight the changed characters of a paired old/new line."""
+    if len(old) > INTRALINE_MAX_CHARS or len(new) > INTRALINE_MAX_CHARS:
+        return _mark(html.escape(old), 'diff_chg'), _mark(html.escape(new), 'diff_chg')
+    old_parts, new_parts = [], []
+    for tag, i1, i2, j1, j2 in difflib.SequenceMatcher(None, old, new, autojunk=False).get_opcodes():
+        old_chunk, new_chunk = html.escape(old[i1:i2]), html.escape(new[j1:j2])
+        if tag == 'equal':
+            old_parts.append(old_chunk)
+            new_parts.append(new_chunk)
+        else:
+            old_parts.append(_mark(old_chunk, 'diff_sub' if tag == 'delete' else 'diff_chg'))
+            new_parts.append(_mark(new_chunk, 'diff_add' if tag == 'insert' else 'diff_chg'))
+    return "".join(old_parts), "".join(new_parts)
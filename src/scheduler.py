@@ -0,0 +1,107 @@
+# src/scheduler.py
+
+import random
+import threading
+import time
+
+# Polling interval bounds. A rule starts at DEFAULT_INTERVAL_S and moves
+# between the bounds as changes are (or are not) observed.
+DEFAULT_INTERVAL_S = 6 * 3600
+MIN_INTERVAL_S = 15 * 60
+MAX_INTERVAL_S = 7 * 24 * 3600
+
+# Multiplicative adaptation: halve the interval after a change, stretch it
+# by a quarter after every check that found nothing
+SPEEDUP_ON_CHANGE = 0.5
+BACKOFF_ON_NO_CHANGE = 1.25
+
+# A failed check is retried after this long (or the rule's interval, if shorter)
+FAILURE_RETRY_S = 30 * 60
+
+# Rules whose pages are slow to fetch are polled less often: the interval is
+# scaled by avg_fetch_s / FETCH_COST_REFERENCE_S, capped at MAX_COST_FACTOR
+FETCH_COST_REFERENCE_S = 2.0
+MAX_COST_FACTOR = 4.0
+
+# +/- fraction of random jitter on every next-check time, so rules added
+# together do not stay synchronized
+JITTER = 0.1
+
+# Global cap on requests sent by the daemon, across all hosts
+MAX_REQUESTS_PER_MINUTE = 30
+
+# Rules checked per scheduler tick, and the longest the daemon sleeps between ticks
+MAX_RULES_PER_TICK = 50
+MAX_SLEEP_S = 60
+
+# Weight of the newest sample in the fetch-time moving average
+FETCH_COST_SMOOTHING = 0.3
+
+def next_interval(interval_s, outcome):
+    """
+    Adapt a rule's polling interval to the result of its latest check.
+
+    Args:
+        interval_s: The interval the check was scheduled with.
+        outcome: 'changed', 'unchanged', 'blocked' or 'failed' (failures keep the interval).
+
+    Returns:
+        The new interval, clamped to [MIN_INTERVAL_S, MAX_INTERVAL_S].
+    """
+    if outcome == 'changed':
+        interval_s *= SPEEDUP_ON_CHANGE
+    elif outcome == 'unchanged':
+        interval_s *= BACKOFF_ON_NO_CHANGE
+    return min(MAX_INTERVAL_S, max(MIN_INTERVAL_S, interval_s))
+
+def cost_factor(avg_fetch_s):
+    """How much longer to wait before re-checking a rule that is expensive to fetch."""
+    if not avg_fetch_s:
+        return 1.0
+    return min(MAX_COST_FACTOR, max(1.0, avg_fetch_s / FETCH_COST_REFERENCE_S))
+
+def smooth_fetch_cost(avg_fetch_s, fetch_s):
+    """Exponential moving average of a rule's fetch time (None when there is no sample)."""
+    if fetch_s is None:
+        return avg_fetch_s
+    if avg_fetch_s is None:
+        return fetch_s
+    return (1 - FETCH_COST_SMOOTHING) * avg_fetch_s + FETCH_COST_SMOOTHING * fetch_s
+
+def plan_next_check(interval_s, outcome, avg_fetch_s, now, rng=random):
+    """
+    Returns (interval_s, next_check) for a rule that was just checked.
+
+    The stored interval only reflects change frequency; fetch cost and jitter
+    are applied to the next-check time so they do not compound.
+    """
+    interval_s = next_interval(interval_s, outcome)
+    delay = interval_s * cost_factor(avg_fetch_s)
+    if outcome in ('failed', 'blocked'):
+        delay = min(delay, FAILURE_RETRY_S)
+    delay *= rng.uniform(1 - JITTER, 1 + JITTER)
+    return interval_s, now + delay
+
+def sleep_time(next_due, now, max_sleep=MAX_SLEEP_S):
+    """Seconds to sleep until the next rule is due (at most max_sleep)."""
+    if next_due is None:
+        return max_sleep
+    return min(max_sleep, max(0.0, next_due - now))
+
+class RateLimiter:
+    """Spaces calls to acquire() at least 60 / per_minute seconds apart, across threads."""
+
+    def __init__(self, per_minute=MAX_REQUESTS_PER_MINUTE):
+        self.spacing = 60.0 / per_minute if per_minute else 0.0
+        self.next_slot = 0.0
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        with self.lock:
+            now = time.monotonic()
+            slot = max(now, self.next_slot)
+            self.next_slot = slot + self.spacing
+        if slot > now:
+            time.sleep(slot - now)
+
+# End of scheduler.py
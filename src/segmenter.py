@@ -0,0 +1,200 @@
+# src/segmenter.py
+
+import hashlib
+import re
+from typing import Dict, List, NamedTuple, Optional
+from src.diff_engine import LineDiff, Opcode, diff_lines, MAX_COST
+
+# Paragraph markers at the start of a line, outermost first. FINRA nests
+# (a) > (1) > (A) > (i); (i), (v) and (x) are told apart from letters by context.
+LETTER = re.compile(r'^\(([a-z]{1,2})\)\s')
+NUMBER = re.compile(r'^\((\d{1,3})\)\s')
+UPPER = re.compile(r'^\(([A-Z])\)\s')
+ROMAN = re.compile(r'^\(([ivx]{1,5})\)\s')
+SUPPLEMENTARY = re.compile(r'^[•\-\s]*Supplementary Material\b', re.IGNORECASE)
+SUPPLEMENTARY_ITEM = re.compile(r'^\.(\d{2})\b')
+
+SUPPLEMENTARY_KEY = 'SM'
+PREAMBLE_KEY = ''
+
+# Change summaries name at most this many sections before "and N more"
+MAX_SUMMARY_SECTIONS = 8
+
+class Section(NamedTuple):
+    """One section of a rule: its own lines [start, end), up to the next marker of any level."""
+    key: str           # Path such as "(a)(1)", ".02", "SM"; "" for text before the first marker
+    parent: str        # Key of the enclosing section ("" at the top level)
+    start: int
+    end: int
+    digest: bytes      # sha256 of the section's own lines
+
+def segment(lines: List[str]) -> List[Section]:
+    """
+    Splits a rule's lines into sections at paragraph markers.
+
+    Sections are contiguous and cover every line, so line ranges map straight
+    onto LineDiff indexes. A repeated key (malformed numbering) gets a "#n"
+    suffix so keys stay unique.
+    """
+    sections = []
+    path = []          # [(level, key)] of the open markers
+    seen = {}
+    start, key, parent = 0, PREAMBLE_KEY, PREAMBLE_KEY
+
+    def close(end):
+        if end > start:
+            digest = hashlib.sha256("\n".join(lines[start:end]).encode('utf-8')).digest()
+            sections.append(Section(key, parent, start, end, digest))
+
+    for index, line in enumerate(lines):
+        marker = _marker(line, path)
+        if marker is None:
+            continue
+        level, label = marker
+        close(index)
+        while path and path[-1][0] >= level:
+            path.pop()
+        if label.startswith('.'):
+            parent = SUPPLEMENTARY_KEY if any(k == SUPPLEMENTARY_KEY for _, k in path) else PREAMBLE_KEY
+            new_key = label
+        else:
+            parent = path[-1][1] if path else PREAMBLE_KEY
+            new_key = label if label == SUPPLEMENTARY_KEY else parent.replace(SUPPLEMENTARY_KEY, '', 1) + label
+        seen[new_key] = seen.get(new_key, 0) + 1
+        if seen[new_key] > 1:
+            new_key = f"{new_key}#{seen[new_key]}"
+        path.append((level, new_key))
+        start, key = index, new_key
+    close(len(lines))
+    return sections
+
+def _marker(line, path):
+    """(level, label) when the line opens a section, else None."""
+    # Most lines are body text; skip the regexes for them
+    if not line.startswith(('(', '.')):
+        return (1, SUPPLEMENTARY_KEY) if 'upplementary' in line[:40] and SUPPLEMENTARY.match(line) else None
+    match = SUPPLEMENTARY_ITEM.match(line)
+    if match:
+        return 2, f".{match.group(1)}"
+    match = ROMAN.match(line)
+    if match:
+        numeral = match.group(1)
+        # (i), (v), (x) right after (h), (u), (w) continue the lettered list
+        letter = next((key for level, key in path if level == 1), '')
+        continues_letters = len(numeral) == 1 and letter.startswith(f"({chr(ord(numeral) - 1)})")
+        if not continues_letters and (len(numeral) > 1 or any(level >= 2 for level, _ in path)):
+            return 4, f"({numeral})"
+    for level, pattern in ((1, LETTER), (2, NUMBER), (3, UPPER)):
+        match = pattern.match(line)
+        if match:
+            return level, f"({match.group(1)})"
+    return None
+
+def section_diff(old_lines: List[str], new_lines: List[str], old_sections: Optional[List[Section]] = None,
+                 new_sections: Optional[List[Section]] = None, max_cost: int = MAX_COST) -> LineDiff:
+    """
+    Line diff that only does line-level work inside changed sections.
+
+    Sections are first matched by (key, hash); runs of identical sections
+    become 'equal' opcodes without looking at their lines, and only the
+    regions between them are diffed line by line. The result has the same
+    format as compute_diff and is a valid (if not always identical) diff.
+    """
+    if not covers(old_sections, old_lines):
+        old_sections = segment(old_lines)
+    if not covers(new_sections, new_lines):
+        new_sections = segment(new_lines)
+    tokens_a = [f"{s.key}\0{s.digest.hex()}" for s in old_sections]
+    tokens_b = [f"{s.key}\0{s.digest.hex()}" for s in new_sections]
+
+    opcodes = []
+    for tag, i1, i2, j1, j2 in diff_lines(tokens_a, tokens_b, max_cost):
+        a1, a2 = _line_range(old_sections, i1, i2, len(old_lines))
+        b1, b2 = _line_range(new_sections, j1, j2, len(new_lines))
+        if tag == 'equal':
+            _append(opcodes, ('equal', a1, a2, b1, b2))
+            continue
+        for sub_tag, si1, si2, sj1, sj2 in diff_lines(old_lines[a1:a2], new_lines[b1:b2], max_cost):
+            _append(opcodes, (sub_tag, a1 + si1, a1 + si2, b1 + sj1, b1 + sj2))
+    return LineDiff(old_lines, new_lines, opcodes)
+
+def diff_sections(old_text: str, new_text: str, old_sections: Optional[List[Section]] = None):
+    """
+    Section-aware replacement for compute_diff.
+
+    Args:
+        old_text: The baseline text.
+        new_text: The newer text.
+        old_sections: The baseline's stored sections, if any (re-segmented
+            when they do not match old_text's line count).
+
+    Returns:
+        (LineDiff, the new text's sections, summary such as "(c) added, .02 amended").
+    """
+    old_lines = old_text.splitlines()
+    new_lines = new_text.splitlines()
+    if not covers(old_sections, old_lines):
+        old_sections = segment(old_lines)
+    new_sections = segment(new_lines)
+    diff = section_diff(old_lines, new_lines, old_sections, new_sections)
+    return diff, new_sections, describe_changes(changed_sections(old_sections, new_sections))
+
+def covers(sections: Optional[List[Section]], lines: List[str]) -> bool:
+    """Whether sections (e.g. loaded from the database) span exactly these lines."""
+    if sections is None:
+        return False
+    if not sections:
+        return not lines
+    return sections[0].start == 0 and sections[-1].end == len(lines)
+
+def _line_range(sections, i1, i2, line_count):
+    start = sections[i1].start if i1 < len(sections) else line_count
+    end = sections[i2 - 1].end if i2 > i1 else start
+    return start, end
+
+def _append(opcodes: List[Opcode], opcode: Opcode):
+    """Append an opcode, merging it into the previous one when the tags match."""
+    if opcodes and opcodes[-1][0] == opcode[0]:
+        tag, i1, _, j1, _ = opcodes[-1]
+        opcodes[-1] = (tag, i1, opcode[2], j1, opcode[4])
+    elif opcode[1] != opcode[2] or opcode[3] != opcode[4]:
+        opcodes.append(opcode)
+
+def changed_sections(old_sections: List[Section], new_sections: List[Section]) -> Dict[str, List[str]]:
+    """
+    Section keys that were added, removed or amended (own text changed).
+
+    Descendants of an added or removed section are folded into it.
+    """
+    old = {s.key: s for s in old_sections}
+    new = {s.key: s for s in new_sections}
+    added = [s.key for s in new_sections if s.key not in old]
+    removed = [s.key for s in old_sections if s.key not in new]
+    amended = [s.key for s in new_sections if s.key in old and old[s.key].digest != s.digest]
+
+    def fold(keys, sections):
+        keys_set = set(keys)
+        return [s.key for s in sections if s.key in keys_set and s.parent not in keys_set]
+    return {'added': fold(added, new_sections), 'removed': fold(removed, old_sections), 'amended': amended}
+
+def describe_changes(changes: Dict[str, List[str]]) -> str:
+    """Human-readable summary such as "(c) added, .02 amended"."""
+    parts = [f"{section_label(key)} {kind}" for kind in ('added', 'amended', 'removed') for key in changes[kind]]
+    if len(parts) > MAX_SUMMARY_SECTIONS:
+        parts = parts[:MAX_SUMMARY_SECTIONS] + [f"and {len(parts) - MAX_SUMMARY_SECTIONS} more"]
+    return ", ".join(parts)
+
+def change_summary(section_summary: str = "") -> str:
+    """The change_summary archived with a detected change."""
+    if section_summary:
+        return f"Changes detected: {section_summary}. Redline report queued."
+    return "Changes detected. Redline report queued."
+
+def section_label(key: str) -> str:
+    if key == PREAMBLE_KEY:
+        return "preamble"
+    if key == SUPPLEMENTARY_KEY:
+        return "Supplementary Material"
+    return key
+
+# End of segmenter.py